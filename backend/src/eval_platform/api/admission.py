@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+
+from starlette import status
+
+logger = logging.getLogger(__name__)
+
+# Weight of the latest request in the moving average of slot hold times.
+_SERVICE_TIME_ALPHA = 0.2
+
+
+class AdmissionRejected(Exception):
+    """A request was turned away instead of queued; carries the HTTP reply."""
+
+    def __init__(self, stage: str, detail: str, *, status_code: int, retry_after: int):
+        super().__init__(detail)
+        self.stage = stage
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class StageLimits:
+    max_concurrent: int
+    max_queue: int
+    max_queue_per_principal: int
+    max_wait: float
+
+
+class StageLimiter:
+    """Concurrency limit for one stage with a bounded queue.
+
+    Waiters are grouped per principal and served round-robin, so one client
+    submitting fifty evaluations cannot starve another submitting one.
+    Requests whose expected wait exceeds ``max_wait`` are rejected up front
+    rather than queued.
+    """
+
+    def __init__(self, name: str, limits: StageLimits):
+        self.name = name
+        self.limits = limits
+        self.active = 0
+        self.rejected = 0
+        self._queued = 0
+        self._waiters: OrderedDict[str, deque[asyncio.Future[None]]] = OrderedDict()
+        self._service_time = 1.0
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "queued": self._queued,
+            "limit": self.limits.max_concurrent,
+            "rejected": self.rejected,
+            "avgSeconds": round(self._service_time, 3),
+        }
+
+    def estimated_wait(self, position: int) -> float:
+        """Seconds until the waiter at ``position`` (1-based) gets a slot."""
+        rounds = math.ceil(position / self.limits.max_concurrent)
+        return rounds * self._service_time
+
+    @asynccontextmanager
+    async def slot(self, principal_id: str):
+        await self._acquire(principal_id)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            self._service_time += _SERVICE_TIME_ALPHA * (elapsed - self._service_time)
+            self._release()
+
+    async def _acquire(self, principal_id: str) -> None:
+        if self.active < self.limits.max_concurrent and not self._queued:
+            self.active += 1
+            return
+
+        own = self._waiters.get(principal_id)
+        if own is not None and len(own) >= self.limits.max_queue_per_principal:
+            self._reject(
+                "too many queued requests for this principal",
+                status.HTTP_429_TOO_MANY_REQUESTS,
+                self.estimated_wait(len(own) + 1),
+            )
+        wait = self.estimated_wait(self._queued + 1)
+        if self._queued >= self.limits.max_queue or wait > self.limits.max_wait:
+            self._reject("server busy", status.HTTP_503_SERVICE_UNAVAILABLE, wait)
+
+        waiter: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(principal_id, deque()).append(waiter)
+        self._queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.limits.max_wait)
+        except TimeoutError:
+            if self._abandon(principal_id, waiter):
+                self._reject(
+                    "timed out waiting for capacity",
+                    status.HTTP_503_SERVICE_UNAVAILABLE,
+                    self.estimated_wait(self._queued + 1),
+                )
+        except asyncio.CancelledError:
+            if not self._abandon(principal_id, waiter):
+                # The slot was handed over as we were cancelled; pass it on.
+                self._release()
+            raise
+
+    def _abandon(self, principal_id: str, waiter: asyncio.Future[None]) -> bool:
+        """Drop a waiter from the queue. False if it was already granted a slot."""
+        if waiter.done():
+            return False
+        waiter.cancel()
+        queue = self._waiters.get(principal_id)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self._queued -= 1
+            if not queue:
+                del self._waiters[principal_id]
+        return True
+
+    def _release(self) -> None:
+        # Hand the slot straight to the next principal in rotation.
+        while self._waiters:
+            principal_id, queue = next(iter(self._waiters.items()))
+            waiter = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._waiters.move_to_end(principal_id)
+            else:
+                del self._waiters[principal_id]
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def _reject(self, detail: str, status_code: int, wait: float):
+        self.rejected += 1
+        logger.warning(
+            "Rejected %s request (%s): %d active, %d queued",
+            self.name,
+            detail,
+            self.active,
+            self._queued,
+        )
+        raise AdmissionRejected(
+            self.name,
+            detail,
+            status_code=status_code,
+            retry_after=max(1, math.ceil(wait)),
+        )
+
+
+class AdmissionController:
+    """Per-stage limiters for expensive platform work (snapshots and diffs)."""
+
+    def __init__(self, stages: dict[str, StageLimits]):
+        self.stages = {
+            name: StageLimiter(name, limits) for name, limits in stages.items()
+        }
+
+    def slot(self, stage: str, principal_id: str):
+        return self.stages[stage].slot(principal_id)
+
+    def stats(self) -> dict[str, dict]:
+        return {name: limiter.stats() for name, limiter in self.stages.items()}
@@ -3,6 +3,9 @@ from __future__ import annotations
 import asyncio
 import logging
 import os
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
 from typing import Optional
 
 import httpx
@@ -15,11 +18,43 @@ logger = logging.getLogger(__name__)
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development").lower()
 CONTROL_PLANE_URL = os.getenv("CONTROL_PLANE_URL")
 CONTROL_PLANE_TIMEOUT = float(os.getenv("CONTROL_PLANE_TIMEOUT", "20.0"))
+# Seconds a validated key is trusted before re-checking; bounds how long a
+# revoked key keeps working.
+API_KEY_CACHE_TTL = float(os.getenv("API_KEY_CACHE_TTL", "30"))
+API_KEY_NEGATIVE_CACHE_TTL = float(os.getenv("API_KEY_NEGATIVE_CACHE_TTL", "5"))
+# Extra seconds a previously valid key is accepted while the control plane
+# is unreachable.
+API_KEY_STALE_GRACE = float(os.getenv("API_KEY_STALE_GRACE", "300"))
+# Most verdicts kept; the oldest are dropped first, so unknown keys sent by
+# unauthenticated callers cannot grow memory without bound.
+API_KEY_CACHE_SIZE = int(os.getenv("API_KEY_CACHE_SIZE", "10000"))
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "10"))
+
+# Actions the control plane rate-limits are validated on every call.
+RATE_LIMITED_ACTIONS = frozenset({"environment_created"})
 
 _http_client: httpx.AsyncClient | None = None
 _http_client_lock = asyncio.Lock()
 
 
+@dataclass
+class _CachedKey:
+    principal_id: str | None
+    reason: str | None
+    checked_at: float
+
+
+class _KeyRejected(PermissionError):
+    """The control plane answered that the key itself is not valid."""
+
+
+# api key -> last control plane verdict, oldest verdict first
+_key_cache: OrderedDict[str, _CachedKey] = OrderedDict()
+# (api key, action) -> calls not yet reported to the control plane
+_usage_counts: Counter[tuple[str, str]] = Counter()
+_usage_flush_task: asyncio.Task | None = None
+
+
 def is_dev_mode() -> bool:
     """Check if running in development mode."""
     return ENVIRONMENT == "development"
@@ -44,7 +79,10 @@ async def validate_with_control_plane(api_key: str, action: str = "api_request")
     """
     Validate API key with control plane and return principal_id.
 
-    Every request hits the control plane for use tracking.
+    Verdicts are cached per key (``API_KEY_CACHE_TTL``, or
+    ``API_KEY_NEGATIVE_CACHE_TTL`` for rejected keys). Calls served from the
+    cache are counted locally and reported in batches; rate-limited actions
+    always go to the control plane, which counts them itself.
 
     Args:
         api_key: The API key to validate
@@ -53,30 +91,111 @@ async def validate_with_control_plane(api_key: str, action: str = "api_request")
     if not CONTROL_PLANE_URL:
         raise RuntimeError("CONTROL_PLANE_URL not configured for production mode")
 
+    now = time.monotonic()
+    cached = _key_cache.get(api_key)
+    if cached is not None and action not in RATE_LIMITED_ACTIONS:
+        ttl = API_KEY_CACHE_TTL if cached.principal_id else API_KEY_NEGATIVE_CACHE_TTL
+        if now - cached.checked_at < ttl:
+            if cached.principal_id is None:
+                raise PermissionError(cached.reason)
+            _record_usage(api_key, action)
+            return cached.principal_id
+
+    try:
+        principal_id = await _validate_remote(api_key, action)
+    except _KeyRejected as exc:
+        _remember_key(api_key, _CachedKey(None, str(exc), now))
+        raise
+    except (httpx.TimeoutException, httpx.RequestError) as exc:
+        if (
+            cached is not None
+            and cached.principal_id is not None
+            and now - cached.checked_at < API_KEY_CACHE_TTL + API_KEY_STALE_GRACE
+        ):
+            logger.warning(f"Control plane unreachable, using cached key: {exc}")
+            _record_usage(api_key, action)
+            return cached.principal_id
+        if isinstance(exc, httpx.TimeoutException):
+            raise PermissionError("control plane timeout - try again")
+        raise RuntimeError(f"control plane unavailable: {exc}")
+
+    _remember_key(api_key, _CachedKey(principal_id, None, now))
+    return principal_id
+
+
+def _remember_key(api_key: str, entry: _CachedKey) -> None:
+    """Cache a verdict, pruning expired and surplus entries oldest first."""
+    _key_cache[api_key] = entry
+    _key_cache.move_to_end(api_key)
+    max_age = API_KEY_CACHE_TTL + API_KEY_STALE_GRACE
+    while len(_key_cache) > 1:
+        oldest = next(iter(_key_cache.values()))
+        if (
+            len(_key_cache) <= API_KEY_CACHE_SIZE
+            and entry.checked_at - oldest.checked_at < max_age
+        ):
+            break
+        _key_cache.popitem(last=False)
+
+
+async def _validate_remote(api_key: str, action: str) -> str:
+    client = await _get_http_client()
+    response = await client.post(
+        f"{CONTROL_PLANE_URL}/validate",
+        json={"api_key": api_key, "action": action},
+    )
+
+    if response.status_code == 200:
+        data = response.json()
+        if data.get("valid"):
+            return data["user_id"]
+        else:
+            raise _KeyRejected(data.get("reason", "access denied"))
+    elif response.status_code == 401:
+        raise _KeyRejected("invalid api key")
+    elif response.status_code == 429:
+        raise PermissionError("rate limit exceeded")
+    else:
+        raise PermissionError(f"authorization failed: {response.status_code}")
+
+
+def _record_usage(api_key: str, action: str, count: int = 1) -> None:
+    global _usage_flush_task
+    _usage_counts[(api_key, action)] += count
+    if _usage_flush_task is None or _usage_flush_task.done():
+        _usage_flush_task = asyncio.get_running_loop().create_task(_usage_flush_loop())
+
+
+async def _usage_flush_loop() -> None:
+    """Report usage every ``USAGE_FLUSH_INTERVAL`` seconds until none is pending."""
+    while _usage_counts:
+        await asyncio.sleep(USAGE_FLUSH_INTERVAL)
+        await flush_usage()
+
+
+async def flush_usage() -> None:
+    """Send locally counted usage to the control plane in one batch.
+
+    Counts are kept for the next attempt if the control plane cannot be
+    reached.
+    """
+    if not _usage_counts or not CONTROL_PLANE_URL:
+        return
+    batch = dict(_usage_counts)
+    _usage_counts.clear()
+    events = [
+        {"api_key": api_key, "action": action, "count": count}
+        for (api_key, action), count in batch.items()
+    ]
     try:
         client = await _get_http_client()
         response = await client.post(
-            f"{CONTROL_PLANE_URL}/validate",
-            json={"api_key": api_key, "action": action},
+            f"{CONTROL_PLANE_URL}/usage", json={"events": events}
         )
-
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("valid"):
-                return data["user_id"]
-            else:
-                raise PermissionError(data.get("reason", "access denied"))
-        elif response.status_code == 401:
-            raise PermissionError("invalid api key")
-        elif response.status_code == 429:
-            raise PermissionError("rate limit exceeded")
-        else:
-            raise PermissionError(f"authorization failed: {response.status_code}")
-
-    except httpx.TimeoutException:
-        raise PermissionError("control plane timeout - try again")
-    except httpx.RequestError as e:
-        raise RuntimeError(f"control plane unavailable: {e}")
+        response.raise_for_status()
+    except httpx.HTTPError as exc:
+        logger.warning(f"Failed to report usage for {len(events)} keys: {exc}")
+        _usage_counts.update(batch)
 
 
 async def get_principal_id(api_key: Optional[str], action: str = "api_request") -> str:
@@ -93,12 +212,25 @@ async def get_principal_id(api_key: Optional[str], action: str = "api_request")
     if not api_key:
         raise PermissionError("api key required in production mode")
 
+    return await validate_with_control_plane(_strip_bearer(api_key), action)
+
+
+def record_usage(api_key: Optional[str], action: str, count: int = 1) -> None:
+    """Report ``count`` further uses of ``action`` through the usage batcher.
+
+    For calls that do the work of several, e.g. the environments a batch
+    creates beyond the one counted when its key was validated.
+    """
+    if is_dev_mode() or not api_key or count <= 0:
+        return
+    _record_usage(_strip_bearer(api_key), action, count)
+
+
+def _strip_bearer(api_key: str) -> str:
     # Strip "Bearer " prefix if present
-    clean_key = api_key
     if api_key.lower().startswith("bearer "):
-        clean_key = api_key[7:]  # Remove "Bearer " (7 chars)
-
-    return await validate_with_control_plane(clean_key, action)
+        return api_key[7:]  # Remove "Bearer " (7 chars)
+    return api_key
 
 
 def require_resource_access(principal_id: str, owner_id: str) -> None:
@@ -1,6 +1,12 @@
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.pool import NullPool
-from eval_platform.isolationEngine.session import SessionManager
+from eval_platform.isolationEngine.session import (
+    SessionManager,
+    async_database_url,
+    parse_shard_urls,
+)
 from starlette.applications import Starlette
 from starlette.middleware import Middleware
 from os import environ
@@ -10,6 +16,7 @@ from eval_platform.evaluationEngine.replication import (
     LogicalReplicationService,
     ReplicationConfig,
 )
+from eval_platform.isolationEngine.artifact import ArtifactStore
 from eval_platform.isolationEngine.environment import EnvironmentHandler
 from eval_platform.isolationEngine.templateManager import TemplateManager
 from eval_platform.isolationEngine.maintenance import (
@@ -19,12 +26,20 @@ from eval_platform.isolationEngine.maintenance import (
 from eval_platform.testManager.core import CoreTestManager
 from starlette.routing import Router
 from eval_platform.api.routes import routes as platform_routes
-from eval_platform.api.middleware import IsolationMiddleware, PlatformMiddleware
+from eval_platform.api.middleware import (
+    DIFF_STAGE,
+    SNAPSHOT_STAGE,
+    IsolationMiddleware,
+    PlatformMiddleware,
+)
+from eval_platform.api.admission import AdmissionController, StageLimits
+from eval_platform.api.auth import flush_usage
 from services.slack.api.methods import routes as slack_routes
 from services.calendar.api import routes as calendar_routes
 from services.box.api.routes import routes as box_routes
 from eval_platform.logging_config import setup_logging
 from eval_platform.isolationEngine.pool import PoolManager
+from eval_platform.isolationEngine.autoscaler import PoolAutoscaler
 from eval_platform.db.schema import TemplateEnvironment
 from ariadne import load_schema_from_path, make_executable_schema
 from services.linear.api.graphql_linear import LinearGraphQL
@@ -33,21 +48,51 @@ from services.linear.api.resolvers import bindables
 setup_logging()
 
 
-def create_app():
-    app = Starlette()
-    db_url = environ["DATABASE_URL"]
-
+def _create_db_engine(db_url: str):
     # Use NullPool when using Neon's PgBouncer (-pooler) to avoid double pooling
     # Neon's pooler handles connection management, so we don't need SQLAlchemy's pool
     if "-pooler" in db_url or "pgbouncer=true" in db_url:
-        platform_engine = create_engine(db_url, poolclass=NullPool)
-    else:
-        # Direct connection - use SQLAlchemy pooling
-        platform_engine = create_engine(
-            db_url, pool_size=20, max_overflow=40, pool_pre_ping=True
+        return create_engine(db_url, poolclass=NullPool)
+    # Direct connection - use SQLAlchemy pooling
+    return create_engine(db_url, pool_size=20, max_overflow=40, pool_pre_ping=True)
+
+
+def _create_async_db_engine(db_url: str):
+    async_url = async_database_url(db_url)
+    if "-pooler" in db_url or "pgbouncer=true" in db_url:
+        # PgBouncer in transaction mode cannot keep psycopg's prepared statements
+        return create_async_engine(
+            async_url, poolclass=NullPool, connect_args={"prepare_threshold": None}
         )
-    sessions = SessionManager(platform_engine)
-    environment_handler = EnvironmentHandler(session_manager=sessions)
+    return create_async_engine(
+        async_url, pool_size=20, max_overflow=40, pool_pre_ping=True
+    )
+
+
+def create_app():
+    app = Starlette()
+    db_url = environ["DATABASE_URL"]
+
+    platform_engine = _create_db_engine(db_url)
+    # Extra data databases for environment schemas, e.g. "shard_b=postgresql://...".
+    # Each must be seeded with the same template schemas as DATABASE_URL.
+    shard_engines = {
+        name: _create_db_engine(url)
+        for name, url in parse_shard_urls(environ.get("DATA_SHARD_URLS")).items()
+    }
+    sessions = SessionManager(
+        platform_engine,
+        shard_engines=shard_engines,
+        async_engine=_create_async_db_engine(db_url),
+        resolve_ttl=float(environ.get("ENV_RESOLVE_CACHE_TTL", 5)),
+        touch_flush_interval=float(environ.get("LAST_USED_FLUSH_INTERVAL", 5)),
+    )
+    # Directory for compressed schema artifacts, e.g. hibernated environments
+    artifact_dir = environ.get("ARTIFACT_DIR")
+    artifact_store = ArtifactStore(artifact_dir) if artifact_dir else None
+    environment_handler = EnvironmentHandler(
+        session_manager=sessions, artifact_store=artifact_store
+    )
     pool_manager = PoolManager(sessions)
 
     coreIsolationEngine = CoreIsolationEngine(
@@ -55,7 +100,21 @@ def create_app():
         environment_handler=environment_handler,
         pool_manager=pool_manager,
     )
-    coreEvaluationEngine = CoreEvaluationEngine(sessions=sessions)
+    coreEvaluationEngine = CoreEvaluationEngine(
+        sessions=sessions,
+        # "false" falls back to separate insert, update and delete joins
+        single_pass_diff=environ.get("DIFF_SINGLE_PASS", "true").lower() == "true",
+        # Tables snapshotted and diffed concurrently per request
+        diff_workers=int(environ.get("DIFF_WORKERS", 4)),
+        template_snapshots=(
+            environ.get("TEMPLATE_BEFORE_SNAPSHOTS", "true").lower() == "true"
+        ),
+        # "false" checksums every table on every snapshot instead
+        change_counters=environ.get("DIFF_CHANGE_COUNTERS", "true").lower() == "true",
+        # "capture" records row changes with triggers instead of snapshots;
+        # logical replication, when enabled, still takes precedence
+        change_capture=environ.get("DIFF_MODE", "snapshot").lower() == "capture",
+    )
     coreTestManager = CoreTestManager()
     templateManager = TemplateManager()
 
@@ -81,10 +140,42 @@ def create_app():
             templates = session.query(TemplateEnvironment.location).all()
             pool_targets = {location: 100 for (location,) in templates}
 
+    # Empty, migrated schemas kept per service for pool misses, e.g. "slack:2,linear:2"
+    raw_empty_targets = environ.get("POOL_EMPTY_TARGETS")
+    if raw_empty_targets is not None:
+        pool_empty_targets = parse_pool_targets(raw_empty_targets)
+    else:
+        with sessions.with_meta_session() as session:
+            services = session.query(TemplateEnvironment.service).distinct().all()
+            pool_empty_targets = {service: 1 for (service,) in services}
+
     # Create on-demand maintenance service (replaces cleanup + pool_refill)
     maintenance_idle_timeout = int(environ.get("MAINTENANCE_IDLE_TIMEOUT", 300))
     maintenance_cycle_interval = int(environ.get("MAINTENANCE_CYCLE_INTERVAL", 10))
     maintenance_concurrency = int(environ.get("POOL_REFILL_CONCURRENCY", 10))
+    pool_recycle_mode = environ.get("POOL_RECYCLE_MODE", "delta").lower()
+    cleanup_batch_size = int(environ.get("CLEANUP_BATCH_SIZE", 500))
+    cleanup_drop_concurrency = int(environ.get("CLEANUP_DROP_CONCURRENCY", 4))
+    # Environments idle this long are exported to ARTIFACT_DIR and dropped
+    hibernate_after = (
+        int(environ.get("HIBERNATE_IDLE_SECONDS", 0)) if artifact_store else 0
+    )
+
+    # Pool targets act as per-template ceilings when autoscaling is enabled.
+    # POOL_AUTOSCALE is single-replica only, hence off by default: claim and
+    # miss rates are measured in this process's memory, so with several
+    # replicas each one sizes the shared pool from its fraction of the demand
+    # and retires schemas the others still need.
+    pool_autoscaler = None
+    if environ.get("POOL_AUTOSCALE", "false").lower() == "true":
+        pool_autoscaler = PoolAutoscaler(
+            ceilings=pool_targets,
+            floors=parse_pool_targets(environ.get("POOL_FLOORS")),
+            default_floor=int(environ.get("POOL_DEFAULT_FLOOR", 1)),
+            half_life=float(environ.get("POOL_DEMAND_HALF_LIFE", 300)),
+            headroom=float(environ.get("POOL_HEADROOM", 1.5)),
+            refill_interval=maintenance_cycle_interval,
+        )
     maintenance_service = EnvironmentMaintenanceService(
         session_manager=sessions,
         environment_handler=environment_handler,
@@ -94,6 +185,39 @@ def create_app():
         cycle_interval=maintenance_cycle_interval,
         max_concurrent_builds=maintenance_concurrency,
         replication_service=replication_service,
+        recycle_mode=pool_recycle_mode,
+        autoscaler=pool_autoscaler,
+        empty_targets=pool_empty_targets,
+        cleanup_batch_size=cleanup_batch_size,
+        max_concurrent_drops=cleanup_drop_concurrency,
+        hibernate_after=hibernate_after,
+    )
+
+    # Snapshot and diff work runs here rather than on the default executor, so
+    # a burst of evaluations cannot starve other blocking calls in the worker.
+    evaluation_executor = ThreadPoolExecutor(
+        max_workers=int(environ.get("EVALUATION_WORKERS", 8)),
+        thread_name_prefix="evaluation",
+    )
+
+    # Snapshot and diff requests beyond the stage limits queue fairly per
+    # principal; ones that would wait longer than ADMISSION_MAX_WAIT get 503.
+    admission_queue = int(environ.get("ADMISSION_QUEUE_SIZE", 64))
+    admission_per_principal = int(environ.get("ADMISSION_QUEUE_PER_PRINCIPAL", 16))
+    admission_max_wait = float(environ.get("ADMISSION_MAX_WAIT", 30))
+    admission = AdmissionController(
+        {
+            stage: StageLimits(
+                max_concurrent=int(environ.get(env_var, 4)),
+                max_queue=admission_queue,
+                max_queue_per_principal=admission_per_principal,
+                max_wait=admission_max_wait,
+            )
+            for stage, env_var in (
+                (SNAPSHOT_STAGE, "SNAPSHOT_CONCURRENCY"),
+                (DIFF_STAGE, "DIFF_CONCURRENCY"),
+            )
+        }
     )
 
     app.state.coreIsolationEngine = coreIsolationEngine
@@ -105,6 +229,8 @@ def create_app():
     app.state.pool_manager = pool_manager
     app.state.replication_service = replication_service
     app.state.replication_enabled = replication_enabled
+    app.state.evaluation_executor = evaluation_executor
+    app.state.admission = admission
 
     app.add_middleware(
         IsolationMiddleware,
@@ -114,7 +240,11 @@ def create_app():
 
     platform_router = Router(
         routes=platform_routes,
-        middleware=[Middleware(PlatformMiddleware, session_manager=sessions)],
+        middleware=[
+            Middleware(
+                PlatformMiddleware, session_manager=sessions, admission=admission
+            )
+        ],
     )
     app.mount("/api/platform", platform_router)
 
@@ -141,9 +271,14 @@ def create_app():
 
     @app.on_event("shutdown")
     async def shutdown_event():
+        # Persist coalesced last_used_at updates before exiting
+        app.state.sessions.flush_last_used()
+        await flush_usage()
         # Stop replication service if running (it's on-demand now)
         if app.state.replication_service:
             app.state.replication_service.stop()
+        app.state.evaluation_executor.shutdown(wait=False, cancel_futures=True)
+        await app.state.sessions.async_engine.dispose()
 
     return app
 
@@ -1,150 +1,292 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+from contextlib import nullcontext
 
-from starlette.middleware.base import BaseHTTPMiddleware
+from sqlalchemy.exc import DBAPIError
 from starlette.requests import Request
-from starlette.responses import Response, JSONResponse
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from starlette import status
 
-from eval_platform.isolationEngine.session import SessionManager
+from eval_platform.isolationEngine.session import (
+    EnvironmentHibernated,
+    SessionManager,
+)
 from eval_platform.isolationEngine.core import CoreIsolationEngine
+from eval_platform.api.admission import AdmissionController, AdmissionRejected
 from eval_platform.api.auth import get_principal_id, is_dev_mode
-from eval_platform.db.schema import RunTimeEnvironment
 
 logger = logging.getLogger(__name__)
 
+# SQLSTATE raised when a read-only environment attempts a write
+READ_ONLY_SQL_TRANSACTION = "25006"
 
-class PlatformMiddleware(BaseHTTPMiddleware):
-    """Middleware for platform API authentication."""
+# Platform endpoints that run snapshot or diff work, by admission stage
+SNAPSHOT_STAGE = "snapshot"
+DIFF_STAGE = "diff"
+_ADMISSION_PATHS = {
+    "/api/platform/startRun": SNAPSHOT_STAGE,
+    "/api/platform/evaluateRun": DIFF_STAGE,
+    "/api/platform/diffRun": DIFF_STAGE,
+}
 
-    def __init__(self, app, *, session_manager: SessionManager):
-        super().__init__(app)
+
+# Platform endpoints that create environments, checked against the creation
+# quota; batch and fork routes report the rest of their environments later.
+_CREATION_PATHS = frozenset({"/api/platform/initEnv", "/api/platform/initEnvBatch"})
+
+
+def _rate_limit_action(path: str, method: str) -> str:
+    if method != "POST":
+        return "api_request"
+    if path in _CREATION_PATHS or (
+        path.startswith("/api/platform/env/") and path.endswith("/fork")
+    ):
+        return "environment_created"
+    return "api_request"
+
+
+def _admission_stage(path: str, method: str) -> str | None:
+    if method != "POST":
+        return None
+    if path in _ADMISSION_PATHS:
+        return _ADMISSION_PATHS[path]
+    if path.startswith("/api/platform/env/") and (
+        path.endswith("/checkpoints") or "/rollback/" in path
+    ):
+        return SNAPSHOT_STAGE
+    return None
+
+
+class PlatformMiddleware:
+    """Middleware for platform API authentication.
+
+    Plain ASGI: messages pass through unchanged, so response bodies stream
+    without buffering. The meta session is committed just before the response
+    headers go out, so a failed commit still becomes an error response, and
+    closed once the response has been sent.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        session_manager: SessionManager,
+        admission: AdmissionController | None = None,
+    ):
+        self.app = app
         self.session_manager = session_manager
+        self.admission = admission
 
-    async def dispatch(self, request: Request, call_next) -> Response:
-        path = request.scope.get("path", "")
-        if path == "/api/platform/health":
-            return await call_next(request)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        path = scope.get("path", "")
+        if scope["type"] != "http" or path == "/api/platform/health":
+            await self.app(scope, receive, send)
+            return
 
+        request = Request(scope)
         api_key_hdr = request.headers.get("X-API-Key") or request.headers.get(
             "Authorization"
         )
 
         if not api_key_hdr and not is_dev_mode():
-            return JSONResponse(
+            await JSONResponse(
                 {"detail": "missing api key"},
                 status_code=status.HTTP_401_UNAUTHORIZED,
-            )
+            )(scope, receive, send)
+            return
 
-        # Determine action type for rate limiting
-        action = "api_request"
-        if path == "/api/platform/initEnv" and request.method == "POST":
-            action = "environment_created"
+        action = _rate_limit_action(path, request.method)
 
+        response_started = False
         try:
             principal_id = await get_principal_id(api_key_hdr, action=action)
 
-            with self.session_manager.with_meta_session() as meta_session:
+            # Snapshot/diff endpoints wait for a stage slot before opening a
+            # session, so queued requests hold no database connection.
+            stage = _admission_stage(path, request.method)
+            slot = (
+                self.admission.slot(stage, principal_id)
+                if self.admission is not None and stage is not None
+                else nullcontext()
+            )
+            # Platform routes get an AsyncSession; synchronous helpers run
+            # against it through ``session.run_sync``.
+            async with (
+                slot,
+                self.session_manager.with_async_meta_session() as meta_session,
+            ):
                 request.state.principal_id = principal_id
+                request.state.api_key = api_key_hdr
                 request.state.db_session = meta_session
-                return await call_next(request)
-        except PermissionError as exc:
+
+                async def send_committed(message: Message) -> None:
+                    nonlocal response_started
+                    if message["type"] == "http.response.start":
+                        await meta_session.commit()
+                        response_started = True
+                    await send(message)
+
+                await self.app(scope, receive, send_committed)
+                return
+        except Exception as exc:
+            if response_started:
+                raise
+            response = self._error_response(exc)
+        await response(scope, receive, send)
+
+    @staticmethod
+    def _error_response(exc: Exception) -> JSONResponse:
+        if isinstance(exc, AdmissionRejected):
+            return JSONResponse(
+                {"detail": str(exc)},
+                status_code=exc.status_code,
+                headers={"Retry-After": str(exc.retry_after)},
+            )
+        if isinstance(exc, PermissionError):
             return JSONResponse(
                 {"detail": str(exc)},
                 status_code=status.HTTP_401_UNAUTHORIZED,
             )
-        except RuntimeError as exc:
+        if isinstance(exc, RuntimeError):
             logger.error(f"Control plane error: {exc}")
             return JSONResponse(
                 {"detail": str(exc)},
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             )
-        except Exception:
-            logger.exception("Unhandled exception in PlatformMiddleware")
-            return JSONResponse(
-                {"detail": "internal server error"},
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
+        logger.exception("Unhandled exception in PlatformMiddleware", exc_info=exc)
+        return JSONResponse(
+            {"detail": "internal server error"},
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+
 
+class IsolationMiddleware:
+    """Binds ``/api/env/{env_id}/...`` requests to the environment's schema.
+
+    Plain ASGI like ``PlatformMiddleware``: bodies such as Box downloads
+    stream straight through, and the environment session commits before the
+    response headers are sent. Hibernated environments are restored before
+    the request is handled; concurrent requests share one restore.
+    """
 
-class IsolationMiddleware(BaseHTTPMiddleware):
     def __init__(
         self,
-        app,
+        app: ASGIApp,
         *,
         session_manager: SessionManager,
         core_isolation_engine: CoreIsolationEngine,
     ):
-        super().__init__(app)
+        self.app = app
         self.session_manager = session_manager
         self.core_isolation_engine = core_isolation_engine
+        self._restoring: dict[str, asyncio.Future[bool]] = {}
 
-    async def dispatch(self, request: Request, call_next) -> Response:
-        path = request.scope.get("path", "")
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        path = scope.get("path", "")
         # Expected: /api/env/{env_id}/services/{service}/...
-        if not path.startswith("/api/env/"):
-            return await call_next(request)
+        if scope["type"] != "http" or not path.startswith("/api/env/"):
+            await self.app(scope, receive, send)
+            return
 
+        request = Request(scope)
+        response_started = False
         try:
             path_after_prefix = path[len("/api/env/") :]
             env_id = path_after_prefix.split("/")[0] if path_after_prefix else ""
 
             if not env_id:
-                return JSONResponse(
+                response = JSONResponse(
                     {"ok": False, "error": "invalid_environment_path"},
                     status_code=status.HTTP_400_BAD_REQUEST,
                 )
+                await response(scope, receive, send)
+                return
 
             api_key_hdr = request.headers.get("X-API-Key") or request.headers.get(
                 "Authorization"
             )
 
             if not api_key_hdr and not is_dev_mode():
-                return JSONResponse(
+                response = JSONResponse(
                     {"ok": False, "error": "not_authed"},
                     status_code=status.HTTP_401_UNAUTHORIZED,
                 )
+                await response(scope, receive, send)
+                return
 
             principal_id = await get_principal_id(api_key_hdr, action="api_request")
+            request.state.principal_id = principal_id
 
-            with self.session_manager.with_meta_session() as meta_session:
-                request.state.principal_id = principal_id
-
-                try:
-                    env_uuid = self.session_manager._to_uuid(env_id)
-                    env = (
-                        meta_session.query(RunTimeEnvironment)
-                        .filter(RunTimeEnvironment.id == env_uuid)
-                        .one_or_none()
-                    )
-                    if env is not None:
-                        request.state.impersonate_user_id = env.impersonate_user_id
-                        request.state.impersonate_email = env.impersonate_email
-                except (ValueError, TypeError) as e:
-                    logger.debug(
-                        f"Could not load impersonation data for env {env_id}: {e}"
-                    )
+            # Served from the in-process cache on repeat calls; the session
+            # below reuses the same resolution.
+            try:
+                env = self.session_manager.resolve_environment(env_id)
+            except EnvironmentHibernated:
+                await self._restore(env_id)
+                env = self.session_manager.resolve_environment(env_id)
+            request.state.impersonate_user_id = env.impersonate_user_id
+            request.state.impersonate_email = env.impersonate_email
 
             with self.session_manager.with_session_for_environment(env_id) as session:
                 request.state.db_session = session
                 request.state.environment_id = env_id
-                return await call_next(request)
 
-        except PermissionError as exc:
+                async def send_committed(message: Message) -> None:
+                    nonlocal response_started
+                    if message["type"] == "http.response.start":
+                        # A rejected write (e.g. read-only) surfaces here, while
+                        # the status can still be changed.
+                        session.commit()
+                        response_started = True
+                    await send(message)
+
+                await self.app(scope, receive, send_committed)
+                return
+        except Exception as exc:
+            if response_started:
+                raise
+            response = self._error_response(exc)
+        await response(scope, receive, send)
+
+    async def _restore(self, env_id: str) -> None:
+        restoring = self._restoring.get(env_id)
+        if restoring is None:
+            restoring = asyncio.ensure_future(
+                asyncio.to_thread(
+                    self.core_isolation_engine.restore_environment, env_id
+                )
+            )
+            self._restoring[env_id] = restoring
+            restoring.add_done_callback(lambda _: self._restoring.pop(env_id, None))
+        # Shielded so one cancelled request does not abort the others' restore.
+        await asyncio.shield(restoring)
+
+    @staticmethod
+    def _error_response(exc: Exception) -> JSONResponse:
+        if isinstance(exc, PermissionError):
             return JSONResponse(
                 {"ok": False, "error": str(exc)},
                 status_code=status.HTTP_401_UNAUTHORIZED,
             )
-        except RuntimeError as exc:
+        if isinstance(exc, RuntimeError):
             logger.error(f"Control plane error: {exc}")
             return JSONResponse(
                 {"ok": False, "error": str(exc)},
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             )
-        except Exception:
-            logger.exception("Unhandled exception in IsolationMiddleware")
+        if (
+            isinstance(exc, DBAPIError)
+            and getattr(exc.orig, "pgcode", None) == READ_ONLY_SQL_TRANSACTION
+        ):
             return JSONResponse(
-                {"ok": False, "error": "internal_error"},
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                {"ok": False, "error": "environment_read_only"},
+                status_code=status.HTTP_403_FORBIDDEN,
             )
+        logger.exception("Unhandled exception in IsolationMiddleware", exc_info=exc)
+        return JSONResponse(
+            {"ok": False, "error": "internal_error"},
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
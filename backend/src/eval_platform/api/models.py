@@ -20,6 +20,11 @@ class Visibility(str, Enum):
     private = "private"
 
 
+class TemplateKind(str, Enum):
+    schema = "schema"  # a live schema, cloned with INSERT…SELECT
+    artifact = "artifact"  # a compressed export, restored with COPY
+
+
 class APIError(BaseModel):
     detail: str
 
@@ -138,6 +143,8 @@ class InitEnvRequestBody(BaseModel):
     ttlSeconds: Optional[int] = None
     impersonateUserId: Optional[str] = None
     impersonateEmail: Optional[str] = None
+    # Bind to the template schema itself; writes are rejected.
+    readOnly: bool = False
 
 
 class InitEnvResponse(BaseModel):
@@ -147,11 +154,51 @@ class InitEnvResponse(BaseModel):
     service: "Service"
     environmentUrl: str
     expiresAt: Optional[datetime]
+    readOnly: bool = False
+    # "provisioning" on a pool miss; poll GET /env/{id}/ready until "ready"
+    status: str = "ready"
 
     class Config:
         validate_by_name = True
 
 
+class InitEnvBatchRequest(BaseModel):
+    environments: List[InitEnvRequestBody]
+
+
+class InitEnvBatchItem(InitEnvResponse):
+    poolHit: bool
+
+
+class InitEnvBatchResponse(BaseModel):
+    environments: List[InitEnvBatchItem]
+
+
+class ForkEnvRequest(BaseModel):
+    ttlSeconds: Optional[int] = None
+
+
+class ForkEnvResponse(BaseModel):
+    sourceEnvironmentId: str
+    environments: List[InitEnvResponse]
+
+
+class CreateCheckpointRequest(BaseModel):
+    name: str
+
+
+class CheckpointResponse(BaseModel):
+    environmentId: str
+    name: str
+    createdAt: datetime
+
+
+class RollbackResponse(BaseModel):
+    environmentId: str
+    name: str
+    tablesRestored: List[str]
+
+
 class StartRunRequest(BaseModel):
     envId: str
     testId: Optional[UUID] = None
@@ -207,6 +254,12 @@ class DeleteEnvResponse(BaseModel):
     status: str
 
 
+class EnvReadyResponse(BaseModel):
+    environmentId: str
+    status: str
+    ready: bool
+
+
 class CreateTemplateFromEnvRequest(BaseModel):
     environmentId: str
     service: "Service"
@@ -214,6 +267,7 @@ class CreateTemplateFromEnvRequest(BaseModel):
     description: Optional[str] = None
     visibility: "Visibility" = Visibility.private
     version: str = "v1"  # optional
+    kind: "TemplateKind" = TemplateKind.schema
 
 
 class CreateTemplateFromEnvResponse(BaseModel):
@@ -3,8 +3,12 @@ from __future__ import annotations
 import asyncio
 import logging
 from datetime import datetime
+from functools import partial
 import time
 
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 from starlette import status
 from starlette.requests import Request
 from starlette.responses import JSONResponse
@@ -13,6 +17,14 @@ from starlette.routing import Route
 from eval_platform.api.models import (
     InitEnvRequestBody,
     InitEnvResponse,
+    InitEnvBatchRequest,
+    InitEnvBatchItem,
+    InitEnvBatchResponse,
+    ForkEnvRequest,
+    ForkEnvResponse,
+    CreateCheckpointRequest,
+    CheckpointResponse,
+    RollbackResponse,
     TestSuiteListResponse,
     Test as TestModel,
     CreateTestSuiteRequest,
@@ -25,6 +37,7 @@ from eval_platform.api.models import (
     DiffRunRequest,
     DiffRunResponse,
     DeleteEnvResponse,
+    EnvReadyResponse,
     TestSuiteSummary,
     TestSuiteDetail,
     TemplateEnvironmentSummary,
@@ -38,19 +51,22 @@ from eval_platform.api.models import (
     CreateTestsResponse,
 )
 from eval_platform.api.auth import (
+    record_usage,
     require_resource_access,
     check_template_access,
 )
 from eval_platform.db.schema import (
+    PRIMARY_SHARD,
     Test,
     TestRun,
     RunTimeEnvironment,
     TemplateEnvironment,
 )
 from eval_platform.evaluationEngine.core import CoreEvaluationEngine
-from eval_platform.evaluationEngine.differ import Differ
+from eval_platform.evaluationEngine.differ import is_capture_suffix
 from eval_platform.evaluationEngine.models import DiffResult
 from eval_platform.isolationEngine.core import CoreIsolationEngine
+from eval_platform.isolationEngine.models import EnvironmentSpec
 from eval_platform.testManager.core import CoreTestManager
 from eval_platform.isolationEngine.templateManager import TemplateManager
 from eval_platform.api.resolvers import (
@@ -69,6 +85,15 @@ from eval_platform.api.errors import (
 
 logger = logging.getLogger(__name__)
 
+MAX_INIT_ENV_BATCH = 500
+MAX_FORK_COUNT = 50
+# Longest a GET /env/{id}/ready long-poll is held open, and how often it rechecks
+MAX_READY_WAIT_SECONDS = 60
+READY_POLL_INTERVAL = 0.5
+# Snapshot suffix recorded for runs on read-only environments, whose diff is
+# always empty.
+READ_ONLY_SNAPSHOT = "read_only"
+
 
 def _principal_id_from_request(request: Request) -> str:
     """Extract principal_id from request state."""
@@ -78,17 +103,62 @@ def _principal_id_from_request(request: Request) -> str:
     return principal_id
 
 
+def _record_created_environments(request: Request, created: int) -> None:
+    """Report environments beyond the one counted when the key was validated."""
+    record_usage(
+        getattr(request.state, "api_key", None), "environment_created", created - 1
+    )
+
+
+async def _run_evaluation(request: Request, fn, /, **kwargs):
+    """Run snapshot/diff work on the app's bounded evaluation executor.
+
+    Falls back to the loop's default executor when none is configured.
+    """
+    executor = getattr(request.app.state, "evaluation_executor", None)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(fn, **kwargs))
+
+
+async def _release_capture_positions(
+    request: Request,
+    *,
+    schema: str,
+    environment_id: str,
+    suffixes: list[str | None],
+) -> None:
+    """Release change capture positions whose diff is done.
+
+    Lets the change log shrink, and drops its triggers once no run on the
+    environment is capturing. Failures only delay that cleanup.
+    """
+    positions = [suffix for suffix in suffixes if is_capture_suffix(suffix)]
+    if not positions:
+        return
+    core_eval: CoreEvaluationEngine = request.app.state.coreEvaluationEngine
+    try:
+        await _run_evaluation(
+            request,
+            core_eval.archive,
+            schema=schema,
+            environment_id=environment_id,
+            suffixes=positions,
+        )
+    except Exception as exc:
+        logger.warning(f"Failed to release capture positions {positions}: {exc}")
+
+
 async def list_environment_templates(
     request: Request,
 ) -> JSONResponse:
-    session = request.state.db_session
+    session: AsyncSession = request.state.db_session
     try:
         principal_id = _principal_id_from_request(request)
     except PermissionError:
         return unauthorized()
     template_manager: TemplateManager = request.app.state.templateManager
 
-    templates = template_manager.list_templates(session, principal_id)
+    templates = await session.run_sync(template_manager.list_templates, principal_id)
 
     response = TemplateEnvironmentListResponse(
         templates=[
@@ -108,7 +178,7 @@ async def get_environment_template(
     request: Request,
 ) -> JSONResponse:
     template_id = request.path_params["template_id"]
-    session = request.state.db_session
+    session: AsyncSession = request.state.db_session
     try:
         principal_id = _principal_id_from_request(request)
     except PermissionError:
@@ -118,11 +188,7 @@ async def get_environment_template(
     if parsed_id is None:
         return bad_request("invalid template id")
 
-    template = (
-        session.query(TemplateEnvironment)
-        .filter(TemplateEnvironment.id == parsed_id)
-        .one_or_none()
-    )
+    template = await session.get(TemplateEnvironment, parsed_id)
     if template is None:
         return not_found("template not found")
 
@@ -152,17 +218,13 @@ async def create_template_from_environment(request: Request) -> JSONResponse:
         principal_id = _principal_id_from_request(request)
     except PermissionError:
         return unauthorized()
-    session = request.state.db_session
+    session: AsyncSession = request.state.db_session
 
     env_uuid = parse_uuid(payload.environmentId)
     if env_uuid is None:
         return bad_request("invalid environment id")
 
-    env = (
-        session.query(RunTimeEnvironment)
-        .filter(RunTimeEnvironment.id == env_uuid)
-        .one_or_none()
-    )
+    env = await session.get(RunTimeEnvironment, env_uuid)
     if env is None:
         return not_found("environment not found")
 
@@ -173,7 +235,8 @@ async def create_template_from_environment(request: Request) -> JSONResponse:
 
     core: CoreIsolationEngine = request.app.state.coreIsolationEngine
     try:
-        result = core.create_template_from_environment(
+        result = await asyncio.to_thread(
+            core.create_template_from_environment,
             environment_id=payload.environmentId,
             service=payload.service.value,
             name=payload.name,
@@ -181,6 +244,7 @@ async def create_template_from_environment(request: Request) -> JSONResponse:
             visibility=payload.visibility.value,
             owner_id=principal_id,
             version=payload.version or "v1",
+            kind=payload.kind.value,
         )
     except ValueError as e:
         logger.warning(f"Template creation failed: {e}")
@@ -197,7 +261,7 @@ async def create_template_from_environment(request: Request) -> JSONResponse:
 
 async def get_test(request: Request) -> JSONResponse:
     test_id = request.path_params["test_id"]
-    session = request.state.db_session
+    session: AsyncSession = request.state.db_session
     try:
         principal_id = _principal_id_from_request(request)
     except PermissionError:
@@ -209,7 +273,7 @@ async def get_test(request: Request) -> JSONResponse:
         return bad_request("invalid test id")
 
     try:
-        test = core_tests.get_test(session, principal_id, str(test_uuid))
+        test = await session.run_sync(core_tests.get_test, principal_id, str(test_uuid))
     except ValueError as e:
         return not_found(str(e))
     except PermissionError:
@@ -235,43 +299,47 @@ async def create_test_suite(request: Request) -> JSONResponse:
     except ValueError as e:
         return bad_request(str(e))
 
-    session = request.state.db_session
+    session: AsyncSession = request.state.db_session
     try:
         principal_id = _principal_id_from_request(request)
     except PermissionError:
         return unauthorized()
     core_tests: CoreTestManager = request.app.state.coreTestManager
     template_manager: TemplateManager = request.app.state.templateManager
-    suite = core_tests.create_test_suite(
-        session,
-        principal_id,
-        name=body.name,
-        description=body.description,
-        visibility=Visibility(body.visibility),
-    )
-    if body.tests:
-        for t in body.tests:
-            try:
-                schema = template_manager.resolve_template_schema(
-                    session, principal_id, str(t.environmentTemplate)
-                )
-                core_tests.create_test(
-                    session,
-                    principal_id,
-                    test_suite_id=str(suite.id),
-                    name=t.name,
-                    prompt=t.prompt,
-                    type=t.type,
-                    expected_output=t.expected_output,
-                    template_schema=schema,
-                    impersonate_user_id=t.impersonateUserId,
-                )
-            except ValueError as e:
-                logger.warning(f"Test creation in suite failed: {e}")
-                return bad_request(str(e))
-            except PermissionError:
-                logger.warning("Unauthorized test creation in suite")
-                return unauthorized()
+
+    def create_suite(sync_session: Session):
+        suite = core_tests.create_test_suite(
+            sync_session,
+            principal_id,
+            name=body.name,
+            description=body.description,
+            visibility=Visibility(body.visibility),
+        )
+        for t in body.tests or []:
+            schema = template_manager.resolve_template_schema(
+                sync_session, principal_id, str(t.environmentTemplate)
+            )
+            core_tests.create_test(
+                sync_session,
+                principal_id,
+                test_suite_id=str(suite.id),
+                name=t.name,
+                prompt=t.prompt,
+                type=t.type,
+                expected_output=t.expected_output,
+                template_schema=schema,
+                impersonate_user_id=t.impersonateUserId,
+            )
+        return suite
+
+    try:
+        suite = await session.run_sync(create_suite)
+    except ValueError as e:
+        logger.warning(f"Test creation in suite failed: {e}")
+        return bad_request(str(e))
+    except PermissionError:
+        logger.warning("Unauthorized test creation in suite")
+        return unauthorized()
     response = CreateTestSuiteResponse(
         id=suite.id,
         name=suite.name,
@@ -284,7 +352,7 @@ async def create_test_suite(request: Request) -> JSONResponse:
 
 
 async def list_test_suites(request: Request) -> JSONResponse:
-    session = request.state.db_session
+    session: AsyncSession = request.state.db_session
     try:
         principal_id = _principal_id_from_request(request)
     except PermissionError:
@@ -308,8 +376,8 @@ async def list_test_suites(request: Request) -> JSONResponse:
         except ValueError:
             return bad_request(f"invalid visibility: {visibility_str}")
 
-    suites = core_tests.list_test_suites(
-        session,
+    suites = await session.run_sync(
+        core_tests.list_test_suites,
         principal_id,
         name=name,
         suite_id=suite_id,
@@ -330,7 +398,7 @@ async def list_test_suites(request: Request) -> JSONResponse:
 
 async def get_test_suite(request: Request) -> JSONResponse:
     suite_id = request.path_params["suite_id"]
-    session = request.state.db_session
+    session: AsyncSession = request.state.db_session
     try:
         principal_id = _principal_id_from_request(request)
     except PermissionError:
@@ -339,7 +407,9 @@ async def get_test_suite(request: Request) -> JSONResponse:
     expand_param = request.query_params.get("expand", "")
     include_tests = "tests" in {p.strip() for p in expand_param.split(",") if p}
     try:
-        suite, tests = core_tests.get_test_suite(session, principal_id, suite_id)
+        suite, tests = await session.run_sync(
+            core_tests.get_test_suite, principal_id, suite_id
+        )
     except PermissionError:
         return unauthorized()
     if suite is None:
@@ -392,7 +462,7 @@ async def init_environment(request: Request) -> JSONResponse:
     except ValueError as e:
         return bad_request(str(e))
 
-    session = request.state.db_session
+    session: AsyncSession = request.state.db_session
     try:
         principal_id = _principal_id_from_request(request)
     except PermissionError:
@@ -400,8 +470,8 @@ async def init_environment(request: Request) -> JSONResponse:
     template_manager: TemplateManager = request.app.state.templateManager
 
     try:
-        schema, selected_template_service = template_manager.resolve_init_template(
-            session, principal_id, body
+        schema, selected_template_service = await session.run_sync(
+            template_manager.resolve_init_template, principal_id, body
         )
     except PermissionError:
         logger.warning("Unauthorized template access in init_environment")
@@ -419,15 +489,26 @@ async def init_environment(request: Request) -> JSONResponse:
     t1 = time.perf_counter()
     logger.debug(f"init_environment setup took {t1 - t0:.2f}s")
 
+    spec = EnvironmentSpec(
+        template_schema=schema,
+        ttl_seconds=body.ttlSeconds or 1800,
+        impersonate_user_id=body.impersonateUserId,
+        impersonate_email=body.impersonateEmail,
+        read_only=body.readOnly,
+    )
     try:
-        result = await asyncio.to_thread(
-            core.create_environment,
-            template_schema=schema,
-            ttl_seconds=body.ttlSeconds or 1800,
-            created_by=principal_id,
-            impersonate_user_id=body.impersonateUserId,
-            impersonate_email=body.impersonateEmail,
-        )
+        if maintenance:
+            # Pool misses are built in the background; the client polls
+            # GET /env/{id}/ready instead of holding this request open.
+            [result], deferred = await asyncio.to_thread(
+                core.provision_environments, [spec], created_by=principal_id
+            )
+            if deferred:
+                maintenance.provision(core.complete_deferred_build, deferred)
+        else:
+            [result] = await asyncio.to_thread(
+                core.create_environments, [spec], created_by=principal_id
+            )
     except ValueError as e:
         logger.warning(f"Environment creation failed: {e}")
         return bad_request(str(e))
@@ -446,6 +527,162 @@ async def init_environment(request: Request) -> JSONResponse:
         expiresAt=result.expires_at,
         schemaName=result.schema_name,
         service=Service(service),
+        readOnly=result.read_only,
+        status=result.status,
+    )
+    return JSONResponse(
+        response.model_dump(mode="json"),
+        status_code=status.HTTP_202_ACCEPTED
+        if result.status == "provisioning"
+        else status.HTTP_201_CREATED,
+    )
+
+
+async def environment_ready(request: Request) -> JSONResponse:
+    """Long-poll until a provisioning environment is ready or failed.
+
+    Waits up to ``timeout`` seconds (query parameter, capped at
+    ``MAX_READY_WAIT_SECONDS``) and reports the status at that point.
+    """
+    env_id = request.path_params["env_id"]
+    session: AsyncSession = request.state.db_session
+    try:
+        principal_id = _principal_id_from_request(request)
+    except PermissionError:
+        return unauthorized()
+
+    try:
+        timeout = float(request.query_params.get("timeout", "30"))
+    except ValueError:
+        return bad_request("timeout must be a number")
+    timeout = min(max(timeout, 0.0), MAX_READY_WAIT_SECONDS)
+
+    try:
+        env = await session.run_sync(require_environment_access, principal_id, env_id)
+    except ValueError as e:
+        return not_found(str(e))
+    except PermissionError:
+        logger.warning(f"Unauthorized environment access: env_id={env_id}")
+        return unauthorized()
+
+    deadline = time.monotonic() + timeout
+    env_status = env.status
+    while env_status == "initializing" and time.monotonic() < deadline:
+        # End the read transaction so no connection is held between polls.
+        await session.commit()
+        await asyncio.sleep(min(READY_POLL_INTERVAL, deadline - time.monotonic()))
+        env_status = await session.scalar(
+            select(RunTimeEnvironment.status).where(RunTimeEnvironment.id == env.id)
+        )
+
+    public_status = "provisioning" if env_status == "initializing" else env_status
+    response = EnvReadyResponse(
+        environmentId=env.id.hex,
+        status=public_status,
+        # Hibernated environments are restored on their next request.
+        ready=env_status in ("ready", "hibernated"),
+    )
+    return JSONResponse(response.model_dump(mode="json"))
+
+
+async def init_environment_batch(request: Request) -> JSONResponse:
+    maintenance = getattr(request.app.state, "maintenance_service", None)
+    if maintenance:
+        await maintenance.trigger()
+
+    t0 = time.perf_counter()
+    try:
+        body = await parse_request_body(request, InitEnvBatchRequest)
+    except ValueError as e:
+        return bad_request(str(e))
+
+    if not body.environments:
+        return bad_request("environments must not be empty")
+    if len(body.environments) > MAX_INIT_ENV_BATCH:
+        return bad_request(
+            f"at most {MAX_INIT_ENV_BATCH} environments can be initialized per batch"
+        )
+
+    session: AsyncSession = request.state.db_session
+    try:
+        principal_id = _principal_id_from_request(request)
+    except PermissionError:
+        return unauthorized()
+    template_manager: TemplateManager = request.app.state.templateManager
+
+    # Items without a testId resolve identically for the same template selector
+    resolved: dict[tuple, tuple[str, str]] = {}
+    specs: list[EnvironmentSpec] = []
+    services: list[str] = []
+    for index, item in enumerate(body.environments):
+        key = (
+            item.templateId,
+            item.templateService,
+            item.templateName,
+            item.templateSchema,
+        )
+        try:
+            if item.testId is None and key in resolved:
+                schema, service = resolved[key]
+            else:
+                schema, service = await session.run_sync(
+                    template_manager.resolve_init_template, principal_id, item
+                )
+                if item.testId is None:
+                    resolved[key] = (schema, service)
+        except PermissionError:
+            logger.warning("Unauthorized template access in init_environment_batch")
+            return unauthorized()
+        except ValueError as e:
+            logger.warning(f"Template resolution failed for batch item {index}: {e}")
+            return bad_request(f"environments[{index}]: {e}")
+
+        if not item.testId and not item.impersonateUserId and not item.impersonateEmail:
+            return bad_request(
+                f"environments[{index}]: impersonateUserId or impersonateEmail must be provided when initializing without a testId"
+            )
+
+        specs.append(
+            EnvironmentSpec(
+                template_schema=schema,
+                ttl_seconds=item.ttlSeconds or 1800,
+                impersonate_user_id=item.impersonateUserId,
+                impersonate_email=item.impersonateEmail,
+                read_only=item.readOnly,
+            )
+        )
+        services.append(service)
+
+    core: CoreIsolationEngine = request.app.state.coreIsolationEngine
+    t1 = time.perf_counter()
+    try:
+        results = await asyncio.to_thread(
+            core.create_environments, specs, created_by=principal_id
+        )
+    except ValueError as e:
+        logger.warning(f"Batch environment creation failed: {e}")
+        return bad_request(str(e))
+    _record_created_environments(request, len(results))
+
+    logger.info(
+        f"init_environment_batch created {len(results)} environments in "
+        f"{time.perf_counter() - t1:.2f}s (total {time.perf_counter() - t0:.2f}s)"
+    )
+
+    response = InitEnvBatchResponse(
+        environments=[
+            InitEnvBatchItem(
+                environmentId=result.environment_id,
+                templateSchema=spec.template_schema,
+                environmentUrl=f"/api/env/{result.environment_id}/services/{service}",
+                expiresAt=result.expires_at,
+                schemaName=result.schema_name,
+                service=Service(service),
+                readOnly=result.read_only,
+                poolHit=result.pooled,
+            )
+            for spec, service, result in zip(specs, services, results)
+        ]
     )
     return JSONResponse(
         response.model_dump(mode="json"), status_code=status.HTTP_201_CREATED
@@ -454,7 +691,7 @@ async def init_environment(request: Request) -> JSONResponse:
 
 async def create_tests_in_suite(request: Request) -> JSONResponse:
     suite_id = request.path_params["suite_id"]
-    session = request.state.db_session
+    session: AsyncSession = request.state.db_session
     try:
         principal_id = _principal_id_from_request(request)
     except PermissionError:
@@ -468,15 +705,17 @@ async def create_tests_in_suite(request: Request) -> JSONResponse:
         return bad_request(str(e))
 
     try:
-        suite, _ = core_tests.get_test_suite(session, principal_id, suite_id)
+        suite, _ = await session.run_sync(
+            core_tests.get_test_suite, principal_id, suite_id
+        )
     except PermissionError:
         return unauthorized()
     if suite is None:
         return not_found("test suite not found")
 
     try:
-        resolved_schemas = resolve_and_validate_test_items(
-            session,
+        resolved_schemas = await session.run_sync(
+            resolve_and_validate_test_items,
             principal_id,
             body.tests,
             str(body.defaultEnvironmentTemplate)
@@ -492,8 +731,8 @@ async def create_tests_in_suite(request: Request) -> JSONResponse:
         return unauthorized()
 
     try:
-        created_tests = core_tests.create_tests_bulk(
-            session,
+        created_tests = await session.run_sync(
+            core_tests.create_tests_bulk,
             principal_id,
             test_suite_id=str(suite.id),
             items=to_bulk_test_items(body),
@@ -537,14 +776,14 @@ async def start_run(request: Request) -> JSONResponse:
     except ValueError as e:
         return bad_request(str(e))
 
-    session = request.state.db_session
+    session: AsyncSession = request.state.db_session
     try:
         principal_id = _principal_id_from_request(request)
     except PermissionError:
         return unauthorized()
 
     if body.testId:
-        test = session.query(Test).filter(Test.id == body.testId).one_or_none()
+        test = await session.get(Test, body.testId)
         if test is None:
             return not_found("test not found")
 
@@ -553,7 +792,9 @@ async def start_run(request: Request) -> JSONResponse:
         return bad_request("invalid environment id")
 
     try:
-        rte = require_environment_access(session, principal_id, str(env_uuid))
+        rte = await session.run_sync(
+            require_environment_access, principal_id, str(env_uuid)
+        )
     except ValueError as e:
         return not_found(str(e))
     except PermissionError:
@@ -562,18 +803,25 @@ async def start_run(request: Request) -> JSONResponse:
         )
         return unauthorized()
 
+    # The replication slot only streams the primary shard's database.
     replication_enabled = bool(
         getattr(request.app.state, "replication_enabled", False)
         and getattr(request.app.state, "replication_service", None)
+        and rte.shard == PRIMARY_SHARD
     )
 
-    # Use snapshots when replication is disabled
+    # Use snapshots (or change capture) when replication is disabled
     core_eval: CoreEvaluationEngine = request.app.state.coreEvaluationEngine
     before_result = None
-    if not replication_enabled:
-        before_result = core_eval.take_before(
-            schema=rte.schema, environment_id=str(rte.id)
+    before_suffix = READ_ONLY_SNAPSHOT if rte.read_only else None
+    if not replication_enabled and not rte.read_only:
+        before_result = await _run_evaluation(
+            request,
+            core_eval.take_before,
+            schema=rte.schema,
+            environment_id=str(rte.id),
         )
+        before_suffix = before_result.suffix
 
     run = TestRun(
         test_id=body.testId,
@@ -581,19 +829,17 @@ async def start_run(request: Request) -> JSONResponse:
         environment_id=body.envId,
         status="running",
         result=None,
-        before_snapshot_suffix=before_result.suffix if before_result else None,
+        before_snapshot_suffix=before_suffix,
         created_by=principal_id,
         created_at=datetime.now(),
         updated_at=datetime.now(),
     )
     session.add(run)
-    session.flush()
-
-    session.commit()
+    await session.commit()
 
     t1 = time.perf_counter()
     replication_service = getattr(request.app.state, "replication_service", None)
-    if replication_service:
+    if replication_enabled and not rte.read_only:
         try:
             slot_name = await asyncio.to_thread(
                 replication_service.start_stream,
@@ -604,7 +850,7 @@ async def start_run(request: Request) -> JSONResponse:
             run.replication_slot = slot_name
             run.replication_plugin = replication_service.plugin
             run.replication_started_at = datetime.now()
-            session.commit()
+            await session.commit()
             t2 = time.perf_counter()
             logger.info(
                 f"start_run replication setup took {t2 - t1:.2f}s (total {t2 - t0:.2f}s)"
@@ -621,7 +867,7 @@ async def start_run(request: Request) -> JSONResponse:
     response = StartRunResponse(
         runId=str(run.id),
         status=run.status,
-        beforeSnapshot=before_result.suffix if before_result else "",
+        beforeSnapshot=before_suffix or "",
     )
     return JSONResponse(
         response.model_dump(mode="json"), status_code=status.HTTP_201_CREATED
@@ -638,7 +884,7 @@ async def evaluate_run(request: Request) -> JSONResponse:
     except ValueError as e:
         return bad_request(str(e))
 
-    session = request.state.db_session
+    session: AsyncSession = request.state.db_session
     try:
         principal_id = _principal_id_from_request(request)
     except PermissionError:
@@ -649,7 +895,7 @@ async def evaluate_run(request: Request) -> JSONResponse:
         return bad_request("invalid run id")
 
     try:
-        run = require_run_access(session, principal_id, str(run_uuid))
+        run = await session.run_sync(require_run_access, principal_id, str(run_uuid))
     except ValueError as e:
         return not_found(str(e))
     except PermissionError:
@@ -657,20 +903,23 @@ async def evaluate_run(request: Request) -> JSONResponse:
         return unauthorized()
 
     core_eval: CoreEvaluationEngine = request.app.state.coreEvaluationEngine
-    rte = (
-        session.query(RunTimeEnvironment)
-        .filter(RunTimeEnvironment.id == run.environment_id)
-        .one()
-    )
+    rte = await session.get_one(RunTimeEnvironment, run.environment_id)
 
     replication_service = getattr(request.app.state, "replication_service", None)
     replication_enabled = bool(getattr(request.app.state, "replication_enabled", False))
     use_journal = bool(replication_enabled and run.replication_slot)
     after_suffix = "journal"
-    if not use_journal:
-        after_suffix = core_eval.take_after(
-            schema=rte.schema, environment_id=str(run.environment_id)
-        ).suffix
+    if rte.read_only:
+        after_suffix = READ_ONLY_SNAPSHOT
+    elif not use_journal:
+        after = await _run_evaluation(
+            request,
+            core_eval.take_after,
+            schema=rte.schema,
+            environment_id=str(run.environment_id),
+            before_suffix=run.before_snapshot_suffix,
+        )
+        after_suffix = after.suffix
 
     if replication_service and run.replication_slot:
         try:
@@ -688,8 +937,11 @@ async def evaluate_run(request: Request) -> JSONResponse:
     diff_payload: DiffResult | None = None
     try:
         diff_timer = time.perf_counter()
-        if use_journal:
-            diff_payload = await asyncio.to_thread(
+        if rte.read_only:
+            diff_payload = DiffResult(inserts=[], updates=[], deletes=[])
+        elif use_journal:
+            diff_payload = await _run_evaluation(
+                request,
                 core_eval.compute_diff_from_journal,
                 environment_id=str(run.environment_id),
                 run_id=str(run.id),
@@ -697,7 +949,8 @@ async def evaluate_run(request: Request) -> JSONResponse:
         else:
             if run.before_snapshot_suffix is None:
                 raise ValueError("before snapshot missing")
-            diff_payload = await asyncio.to_thread(
+            diff_payload = await _run_evaluation(
+                request,
                 core_eval.compute_diff,
                 schema=rte.schema,
                 environment_id=str(run.environment_id),
@@ -710,24 +963,21 @@ async def evaluate_run(request: Request) -> JSONResponse:
             run.environment_id,
             time.perf_counter() - diff_timer,
         )
-        logger.debug(f"Diff payload: {diff_payload}")
-        differ = Differ(
+        # The Differ reflects the schema when built, so it is built off the loop.
+        await _run_evaluation(
+            request,
+            core_eval.store_diff,
             schema=rte.schema,
             environment_id=str(run.environment_id),
-            session_manager=request.app.state.sessions,
-        )
-        logger.debug(f"Differ: {differ}")
-        await asyncio.to_thread(
-            differ.store_diff,
-            diff_payload,
+            diff=diff_payload,
             before_suffix=run.before_snapshot_suffix or "journal",
             after_suffix=after_suffix,
         )
         if body.expectedOutput:
             raw_spec = body.expectedOutput
-            logger.debug(f"Using expectedOutput from request: {raw_spec}")
+            logger.debug("Using expectedOutput from request: %s", raw_spec)
         elif run.test_id:
-            test_obj = session.query(Test).filter(Test.id == run.test_id).one()
+            test_obj = await session.get_one(Test, run.test_id)
             raw_spec = test_obj.expected_output
             logger.debug(f"Using expected_output from test: {test_obj.name}")
         else:
@@ -742,7 +992,7 @@ async def evaluate_run(request: Request) -> JSONResponse:
             compiled_spec=compiled_spec,
             diff=diff_payload,
         )
-        logger.debug(f"Evaluation: {evaluation}")
+        logger.debug("Evaluation: %s", evaluation)
         run.status = "passed" if evaluation.get("passed") else "failed"
         logger.info(f"Test run {run.id} completed with status {run.status}")
     except Exception as exc:  # snapshot/diff/eval failure
@@ -755,6 +1005,12 @@ async def evaluate_run(request: Request) -> JSONResponse:
                 f"Runtime error during evaluation: {exc.__class__.__name__}: {exc}"
             ],
         }
+    await _release_capture_positions(
+        request,
+        schema=rte.schema,
+        environment_id=str(run.environment_id),
+        suffixes=[run.before_snapshot_suffix, after_suffix],
+    )
     if diff_payload is not None:
         evaluation.setdefault("diff", diff_payload.model_dump(mode="json"))
     run.result = evaluation
@@ -767,13 +1023,13 @@ async def evaluate_run(request: Request) -> JSONResponse:
         passed=bool(evaluation.get("passed")),
         score=evaluation.get("score"),
     )
-    logger.debug(f"EndRunResponse: {response}")
+    logger.debug("EndRunResponse: %s", response)
     return JSONResponse(response.model_dump(mode="json"))
 
 
 async def get_run_result(request: Request) -> JSONResponse:
     run_id = request.path_params["run_id"]
-    session = request.state.db_session
+    session: AsyncSession = request.state.db_session
     try:
         principal_id = _principal_id_from_request(request)
     except PermissionError:
@@ -784,7 +1040,7 @@ async def get_run_result(request: Request) -> JSONResponse:
         return bad_request("invalid run id")
 
     try:
-        run = require_run_access(session, principal_id, str(run_uuid))
+        run = await session.run_sync(require_run_access, principal_id, str(run_uuid))
     except ValueError as e:
         return not_found(str(e))
     except PermissionError:
@@ -809,7 +1065,7 @@ async def diff_run(request: Request) -> JSONResponse:
     except ValueError as e:
         return bad_request(str(e))
 
-    session = request.state.db_session
+    session: AsyncSession = request.state.db_session
     try:
         principal_id = _principal_id_from_request(request)
     except PermissionError:
@@ -828,23 +1084,23 @@ async def diff_run(request: Request) -> JSONResponse:
         if run_uuid is None:
             return bad_request("invalid run id")
         try:
-            run = require_run_access(session, principal_id, str(run_uuid))
+            run = await session.run_sync(
+                require_run_access, principal_id, str(run_uuid)
+            )
         except ValueError as e:
             return not_found(str(e))
         except PermissionError:
             return unauthorized()
-        env = (
-            session.query(RunTimeEnvironment)
-            .filter(RunTimeEnvironment.id == run.environment_id)
-            .one()
-        )
+        env = await session.get_one(RunTimeEnvironment, run.environment_id)
         before_suffix = run.before_snapshot_suffix
     else:
         env_uuid = parse_uuid(body.envId or "")
         if env_uuid is None:
             return bad_request("invalid environment id")
         try:
-            env = require_environment_access(session, principal_id, str(env_uuid))
+            env = await session.run_sync(
+                require_environment_access, principal_id, str(env_uuid)
+            )
         except ValueError as e:
             return not_found(str(e))
         except PermissionError:
@@ -857,11 +1113,15 @@ async def diff_run(request: Request) -> JSONResponse:
 
     diff_timer = time.perf_counter()
     after_suffix: str | None = None
-    if use_journal:
+    if env.read_only:
+        diff_payload = DiffResult(inserts=[], updates=[], deletes=[])
+        before_suffix = after_suffix = READ_ONLY_SNAPSHOT
+    elif use_journal:
         # Use journal-based diff for logical replication
         # run is guaranteed non-None here because use_journal requires run.replication_slot
         assert run is not None
-        diff_payload = await asyncio.to_thread(
+        diff_payload = await _run_evaluation(
+            request,
             core_eval.compute_diff_from_journal,
             environment_id=str(run.environment_id),
             run_id=str(run.id),
@@ -873,16 +1133,31 @@ async def diff_run(request: Request) -> JSONResponse:
         if before_suffix is None:
             return bad_request("before snapshot missing for run")
         snapshot_timer = time.perf_counter()
-        after = core_eval.take_after(schema=env.schema, environment_id=str(env.id))
+        after = await _run_evaluation(
+            request,
+            core_eval.take_after,
+            schema=env.schema,
+            environment_id=str(env.id),
+            before_suffix=before_suffix,
+        )
         snapshot_duration = time.perf_counter() - snapshot_timer
         logger.info("diff_run take_after for env %s: %.2fs", env.id, snapshot_duration)
         after_suffix = after.suffix
-        diff_payload = core_eval.compute_diff(
+        diff_payload = await _run_evaluation(
+            request,
+            core_eval.compute_diff,
             schema=env.schema,
             environment_id=str(env.id),
             before_suffix=before_suffix,
             after_suffix=after_suffix,
         )
+        # The run may go on, so only the position taken for this diff goes.
+        await _release_capture_positions(
+            request,
+            schema=env.schema,
+            environment_id=str(env.id),
+            suffixes=[after_suffix],
+        )
 
     diff_duration = time.perf_counter() - diff_timer
     logger.info(
@@ -906,7 +1181,7 @@ async def delete_environment(request: Request) -> JSONResponse:
         await maintenance.trigger()
 
     env_id = request.path_params["env_id"]
-    session = request.state.db_session
+    session: AsyncSession = request.state.db_session
     try:
         principal_id = _principal_id_from_request(request)
     except PermissionError:
@@ -917,7 +1192,9 @@ async def delete_environment(request: Request) -> JSONResponse:
         return bad_request("invalid environment id")
 
     try:
-        env = require_environment_access(session, principal_id, str(env_uuid))
+        env = await session.run_sync(
+            require_environment_access, principal_id, str(env_uuid)
+        )
     except ValueError as e:
         return not_found(str(e))
     except PermissionError:
@@ -925,22 +1202,193 @@ async def delete_environment(request: Request) -> JSONResponse:
         return unauthorized()
 
     core: CoreIsolationEngine = request.app.state.coreIsolationEngine
-    core.environment_handler.drop_schema(env.schema)
-    core.environment_handler.mark_environment_status(env_id, "deleted")
+    if not env.read_only:
+        await asyncio.to_thread(
+            core.environment_handler.drop_schema, env.schema, env.shard
+        )
+    await asyncio.to_thread(
+        core.environment_handler.mark_environment_status, env_id, "deleted"
+    )
+    if env.artifact_location:
+        await asyncio.to_thread(
+            core.environment_handler.discard_artifacts, [env.artifact_location]
+        )
 
     response = DeleteEnvResponse(environmentId=str(env_id), status="deleted")
     return JSONResponse(response.model_dump(mode="json"))
 
 
-async def health_check(request: Request) -> JSONResponse:
-    time = datetime.now()
+async def fork_environment(request: Request) -> JSONResponse:
+    maintenance = getattr(request.app.state, "maintenance_service", None)
+    if maintenance:
+        await maintenance.trigger()
+
+    env_id = request.path_params["env_id"]
+    session: AsyncSession = request.state.db_session
+    try:
+        principal_id = _principal_id_from_request(request)
+    except PermissionError:
+        return unauthorized()
+
+    try:
+        count = int(request.query_params.get("count", "1"))
+    except ValueError:
+        return bad_request("count must be an integer")
+    if not 1 <= count <= MAX_FORK_COUNT:
+        return bad_request(f"count must be between 1 and {MAX_FORK_COUNT}")
+
+    body = ForkEnvRequest()
+    if await request.body():
+        try:
+            body = await parse_request_body(request, ForkEnvRequest)
+        except ValueError as e:
+            return bad_request(str(e))
+
+    try:
+        env = await session.run_sync(require_environment_access, principal_id, env_id)
+    except ValueError as e:
+        return not_found(str(e))
+    except PermissionError:
+        logger.warning(f"Unauthorized environment access: env_id={env_id}")
+        return unauthorized()
+
+    template = (
+        await session.get(TemplateEnvironment, env.template_id)
+        if env.template_id
+        else None
+    )
+    if template is None:
+        return bad_request("environment has no associated template")
+
+    core: CoreIsolationEngine = request.app.state.coreIsolationEngine
+    try:
+        results = await asyncio.to_thread(
+            core.fork_environment,
+            str(env.id),
+            count=count,
+            ttl_seconds=body.ttlSeconds or 1800,
+            created_by=principal_id,
+        )
+    except ValueError as e:
+        logger.warning(f"Environment fork failed: {e}")
+        return bad_request(str(e))
+    _record_created_environments(request, len(results))
+
+    response = ForkEnvResponse(
+        sourceEnvironmentId=env.id.hex,
+        environments=[
+            InitEnvResponse(
+                environmentId=result.environment_id,
+                templateSchema=template.location,
+                environmentUrl=f"/api/env/{result.environment_id}/services/{template.service}",
+                expiresAt=result.expires_at,
+                schemaName=result.schema_name,
+                service=Service(template.service),
+            )
+            for result in results
+        ],
+    )
     return JSONResponse(
-        {
-            "status": "healthy",
-            "service": "diff-the-universe",
-            "time": time.isoformat(),
-        }
+        response.model_dump(mode="json"), status_code=status.HTTP_201_CREATED
+    )
+
+
+async def create_checkpoint(request: Request) -> JSONResponse:
+    env_id = request.path_params["env_id"]
+    session: AsyncSession = request.state.db_session
+    try:
+        principal_id = _principal_id_from_request(request)
+    except PermissionError:
+        return unauthorized()
+
+    try:
+        body = await parse_request_body(request, CreateCheckpointRequest)
+    except ValueError as e:
+        return bad_request(str(e))
+
+    try:
+        env = await session.run_sync(require_environment_access, principal_id, env_id)
+    except ValueError as e:
+        return not_found(str(e))
+    except PermissionError:
+        logger.warning(f"Unauthorized environment access: env_id={env_id}")
+        return unauthorized()
+    if env.read_only:
+        return bad_request("read-only environments cannot be checkpointed")
+
+    core_eval: CoreEvaluationEngine = request.app.state.coreEvaluationEngine
+    try:
+        await _run_evaluation(
+            request,
+            core_eval.create_checkpoint,
+            schema=env.schema,
+            environment_id=str(env.id),
+            name=body.name,
+        )
+    except ValueError as e:
+        return bad_request(str(e))
+
+    response = CheckpointResponse(
+        environmentId=env.id.hex, name=body.name, createdAt=datetime.now()
+    )
+    return JSONResponse(
+        response.model_dump(mode="json"), status_code=status.HTTP_201_CREATED
+    )
+
+
+async def rollback_environment(request: Request) -> JSONResponse:
+    env_id = request.path_params["env_id"]
+    name = request.path_params["name"]
+    session: AsyncSession = request.state.db_session
+    try:
+        principal_id = _principal_id_from_request(request)
+    except PermissionError:
+        return unauthorized()
+
+    try:
+        env = await session.run_sync(require_environment_access, principal_id, env_id)
+    except ValueError as e:
+        return not_found(str(e))
+    except PermissionError:
+        logger.warning(f"Unauthorized environment access: env_id={env_id}")
+        return unauthorized()
+    if env.read_only:
+        return bad_request("read-only environments cannot be rolled back")
+
+    core_eval: CoreEvaluationEngine = request.app.state.coreEvaluationEngine
+    try:
+        CoreEvaluationEngine.checkpoint_suffix(name)
+    except ValueError as e:
+        return bad_request(str(e))
+    try:
+        restored = await _run_evaluation(
+            request,
+            core_eval.rollback_to_checkpoint,
+            schema=env.schema,
+            environment_id=str(env.id),
+            name=name,
+        )
+    except ValueError as e:
+        return not_found(str(e))
+
+    response = RollbackResponse(
+        environmentId=env.id.hex, name=name, tablesRestored=restored
     )
+    return JSONResponse(response.model_dump(mode="json"))
+
+
+async def health_check(request: Request) -> JSONResponse:
+    time = datetime.now()
+    body = {
+        "status": "healthy",
+        "service": "diff-the-universe",
+        "time": time.isoformat(),
+    }
+    # Active and queued snapshot/diff requests per admission stage
+    admission = getattr(request.app.state, "admission", None)
+    if admission is not None:
+        body["admission"] = admission.stats()
+    return JSONResponse(body)
 
 
 routes = [
@@ -957,10 +1405,15 @@ routes = [
         methods=["POST"],
     ),
     Route("/initEnv", init_environment, methods=["POST"]),
+    Route("/initEnvBatch", init_environment_batch, methods=["POST"]),
     Route("/startRun", start_run, methods=["POST"]),
     Route("/evaluateRun", evaluate_run, methods=["POST"]),
     Route("/results/{run_id}", get_run_result, methods=["GET"]),
     Route("/diffRun", diff_run, methods=["POST"]),
     Route("/env/{env_id}", delete_environment, methods=["DELETE"]),
+    Route("/env/{env_id}/ready", environment_ready, methods=["GET"]),
+    Route("/env/{env_id}/fork", fork_environment, methods=["POST"]),
+    Route("/env/{env_id}/checkpoints", create_checkpoint, methods=["POST"]),
+    Route("/env/{env_id}/rollback/{name}", rollback_environment, methods=["POST"]),
     Route("/tests/{test_id}", get_test, methods=["GET"]),
 ]
@@ -0,0 +1,65 @@
+"""read-only runtime environments
+
+Revision ID: a3c5e7f9b1d2
+Revises: merge_heads_20260130
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "a3c5e7f9b1d2"
+down_revision: Union[str, None] = "merge_heads_20260130"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "run_time_environments",
+        sa.Column("read_only", sa.Boolean(), server_default="false", nullable=False),
+        schema="public",
+    )
+    # Read-only environments point at their template schema, so several rows
+    # may share one schema; uniqueness only applies to owned schemas.
+    op.drop_constraint(
+        "uq_run_time_environments_schema",
+        "run_time_environments",
+        schema="public",
+        type_="unique",
+    )
+    op.create_index(
+        "uq_run_time_environments_schema",
+        "run_time_environments",
+        ["schema"],
+        unique=True,
+        schema="public",
+        postgresql_where=sa.text("NOT read_only"),
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        "UPDATE public.run_time_environments SET status = 'deleted' "
+        "WHERE read_only AND status <> 'deleted'"
+    )
+    op.drop_index(
+        "uq_run_time_environments_schema",
+        table_name="run_time_environments",
+        schema="public",
+    )
+    op.execute(
+        "UPDATE public.run_time_environments "
+        "SET schema = schema || '_ro_' || left(id::text, 8) WHERE read_only"
+    )
+    op.create_unique_constraint(
+        "uq_run_time_environments_schema",
+        "run_time_environments",
+        ["schema"],
+        schema="public",
+    )
+    op.drop_column("run_time_environments", "read_only", schema="public")
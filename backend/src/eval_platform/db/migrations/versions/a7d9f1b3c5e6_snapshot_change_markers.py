@@ -0,0 +1,46 @@
+"""change counter markers on snapshot metadata
+
+Revision ID: a7d9f1b3c5e6
+Revises: f6c8e0a2b4d5
+Create Date: 2026-10-16 23:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "a7d9f1b3c5e6"
+down_revision: Union[str, None] = "f6c8e0a2b4d5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "snapshot_metadata",
+        sa.Column("change_marker", sa.String(length=64), nullable=True),
+        schema="public",
+    )
+    op.alter_column(
+        "snapshot_metadata",
+        "checksum",
+        existing_type=sa.String(length=64),
+        nullable=True,
+        schema="public",
+    )
+
+
+def downgrade() -> None:
+    # Snapshots that deferred their checksum cannot be compared without it.
+    op.execute("DELETE FROM public.snapshot_metadata WHERE checksum IS NULL")
+    op.alter_column(
+        "snapshot_metadata",
+        "checksum",
+        existing_type=sa.String(length=64),
+        nullable=False,
+        schema="public",
+    )
+    op.drop_column("snapshot_metadata", "change_marker", schema="public")
@@ -0,0 +1,38 @@
+"""shard map for runtime environments and pool entries
+
+Revision ID: b6e8d0f2a4c7
+Revises: a3c5e7f9b1d2
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "b6e8d0f2a4c7"
+down_revision: Union[str, None] = "a3c5e7f9b1d2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing schemas all live in the platform's own database.
+    for table in ("run_time_environments", "environment_pool_entries"):
+        op.add_column(
+            table,
+            sa.Column(
+                "shard",
+                sa.String(length=64),
+                server_default="primary",
+                nullable=False,
+            ),
+            schema="public",
+        )
+
+
+def downgrade() -> None:
+    for table in ("run_time_environments", "environment_pool_entries"):
+        op.drop_column(table, "shard", schema="public")
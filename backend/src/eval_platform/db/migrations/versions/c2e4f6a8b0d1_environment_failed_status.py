@@ -0,0 +1,31 @@
+"""failed status for environments whose deferred build did not complete
+
+Revision ID: c2e4f6a8b0d1
+Revises: b6e8d0f2a4c7
+Create Date: 2026-10-16 15:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = "c2e4f6a8b0d1"
+down_revision: Union[str, None] = "b6e8d0f2a4c7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # New enum values cannot be used in the transaction that adds them.
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE test_state_status ADD VALUE IF NOT EXISTS 'failed'")
+
+
+def downgrade() -> None:
+    # Postgres cannot drop an enum value; retire failed rows instead.
+    op.execute(
+        "UPDATE public.run_time_environments SET status = 'deleted' "
+        "WHERE status = 'failed'"
+    )
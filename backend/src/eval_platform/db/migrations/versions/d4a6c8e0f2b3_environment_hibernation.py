@@ -0,0 +1,39 @@
+"""hibernated status and artifact location for runtime environments
+
+Revision ID: d4a6c8e0f2b3
+Revises: c2e4f6a8b0d1
+Create Date: 2026-10-16 18:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "d4a6c8e0f2b3"
+down_revision: Union[str, None] = "c2e4f6a8b0d1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # New enum values cannot be used in the transaction that adds them.
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE test_state_status ADD VALUE IF NOT EXISTS 'hibernated'")
+    op.add_column(
+        "run_time_environments",
+        sa.Column("artifact_location", sa.String(length=512), nullable=True),
+        schema="public",
+    )
+
+
+def downgrade() -> None:
+    # Postgres cannot drop an enum value; hibernated schemas are gone, so
+    # retire their rows.
+    op.execute(
+        "UPDATE public.run_time_environments SET status = 'deleted' "
+        "WHERE status = 'hibernated'"
+    )
+    op.drop_column("run_time_environments", "artifact_location", schema="public")
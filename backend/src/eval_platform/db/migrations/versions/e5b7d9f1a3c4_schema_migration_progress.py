@@ -0,0 +1,96 @@
+"""per-schema progress of migrations fanned out over environment schemas
+
+Revision ID: e5b7d9f1a3c4
+Revises: d4a6c8e0f2b3
+Create Date: 2026-10-16 20:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = "e5b7d9f1a3c4"
+down_revision: Union[str, None] = "d4a6c8e0f2b3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    target_enum = postgresql.ENUM(
+        "template", "pool", "environment", name="schema_migration_target"
+    )
+    status_enum = postgresql.ENUM(
+        "pending",
+        "running",
+        "done",
+        "failed",
+        "skipped",
+        name="schema_migration_status",
+    )
+    target_enum.create(op.get_bind(), checkfirst=True)
+    status_enum.create(op.get_bind(), checkfirst=True)
+
+    op.create_table(
+        "schema_migration_progress",
+        sa.Column(
+            "id",
+            postgresql.UUID(as_uuid=True),
+            primary_key=True,
+            server_default=sa.text("gen_random_uuid()"),
+        ),
+        sa.Column("revision", sa.String(length=64), nullable=False),
+        sa.Column("schema_name", sa.String(length=128), nullable=False),
+        sa.Column(
+            "shard",
+            sa.String(length=64),
+            server_default="primary",
+            nullable=False,
+        ),
+        sa.Column(
+            "target_kind",
+            postgresql.ENUM(name="schema_migration_target", create_type=False),
+            nullable=False,
+        ),
+        sa.Column(
+            "status",
+            postgresql.ENUM(name="schema_migration_status", create_type=False),
+            server_default="pending",
+            nullable=False,
+        ),
+        sa.Column("attempts", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.Column(
+            "created_at",
+            sa.DateTime(),
+            nullable=False,
+            server_default=sa.text("now()"),
+        ),
+        sa.UniqueConstraint(
+            "revision", "shard", "schema_name", name="uq_schema_migration_target"
+        ),
+        schema="public",
+    )
+    op.create_index(
+        "ix_schema_migration_progress_revision_status",
+        "schema_migration_progress",
+        ["revision", "status"],
+        unique=False,
+        schema="public",
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_schema_migration_progress_revision_status",
+        table_name="schema_migration_progress",
+        schema="public",
+    )
+    op.drop_table("schema_migration_progress", schema="public")
+    op.execute("DROP TYPE IF EXISTS schema_migration_status")
+    op.execute("DROP TYPE IF EXISTS schema_migration_target")
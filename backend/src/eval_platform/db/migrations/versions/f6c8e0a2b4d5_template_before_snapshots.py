@@ -0,0 +1,59 @@
+"""pristine environments and shared template snapshot metadata
+
+Revision ID: f6c8e0a2b4d5
+Revises: e5b7d9f1a3c4
+Create Date: 2026-10-16 22:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = "f6c8e0a2b4d5"
+down_revision: Union[str, None] = "e5b7d9f1a3c4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "run_time_environments",
+        sa.Column("pristine", sa.Boolean(), server_default="false", nullable=False),
+        schema="public",
+    )
+    op.alter_column(
+        "snapshot_metadata",
+        "environment_id",
+        existing_type=postgresql.UUID(as_uuid=True),
+        nullable=True,
+        schema="public",
+    )
+    op.create_index(
+        "uq_snapshot_metadata_template_entry",
+        "snapshot_metadata",
+        ["schema_name", "snapshot_suffix", "table_name"],
+        unique=True,
+        schema="public",
+        postgresql_where=sa.text("environment_id IS NULL"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "uq_snapshot_metadata_template_entry",
+        table_name="snapshot_metadata",
+        schema="public",
+    )
+    op.execute("DELETE FROM public.snapshot_metadata WHERE environment_id IS NULL")
+    op.alter_column(
+        "snapshot_metadata",
+        "environment_id",
+        existing_type=postgresql.UUID(as_uuid=True),
+        nullable=False,
+        schema="public",
+    )
+    op.drop_column("run_time_environments", "pristine", schema="public")
@@ -14,11 +14,17 @@ from sqlalchemy import (
     String,
     Text,
     UniqueConstraint,
+    text,
 )
 from sqlalchemy.dialects.postgresql import UUID as PgUUID
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 
+# Name of the data database behind the platform's own engine. Environment
+# schemas live here unless additional shards are configured.
+PRIMARY_SHARD = "primary"
+
+
 class PlatformBase(DeclarativeBase):
     """Base class for platform ORM models."""
 
@@ -73,7 +79,13 @@ class TemplateEnvironment(PlatformBase):
 class RunTimeEnvironment(PlatformBase):
     __tablename__ = "run_time_environments"
     __table_args__ = (
-        UniqueConstraint("schema", name="uq_run_time_environments_schema"),
+        # Read-only environments share their template's schema.
+        Index(
+            "uq_run_time_environments_schema",
+            "schema",
+            unique=True,
+            postgresql_where=text("NOT read_only"),
+        ),
         {"schema": "public"},
     )
 
@@ -85,13 +97,24 @@ class RunTimeEnvironment(PlatformBase):
     )
     schema: Mapped[str] = mapped_column(String(128), nullable=False)
     status: Mapped[str] = mapped_column(
-        Enum("initializing", "ready", "expired", "deleted", name="test_state_status"),
+        Enum(
+            "initializing",
+            "ready",
+            "expired",
+            "deleted",
+            "failed",
+            "hibernated",
+            name="test_state_status",
+        ),
         nullable=False,
         default="initializing",
     )
     permanent: Mapped[bool] = mapped_column(
         Boolean, default=False, server_default="false", nullable=False
     )
+    read_only: Mapped[bool] = mapped_column(
+        Boolean, default=False, server_default="false", nullable=False
+    )
     expires_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
     max_idle_seconds: Mapped[int | None] = mapped_column(Integer, nullable=True)
     last_used_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
@@ -104,6 +127,17 @@ class RunTimeEnvironment(PlatformBase):
     )
     impersonate_user_id: Mapped[str | None] = mapped_column(String(255), nullable=True)
     impersonate_email: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    # Data database holding ``schema``
+    shard: Mapped[str] = mapped_column(
+        String(64), default=PRIMARY_SHARD, server_default=PRIMARY_SHARD, nullable=False
+    )
+    # Compressed export of the schema while the environment is hibernated
+    artifact_location: Mapped[str | None] = mapped_column(String(512), nullable=True)
+    # Still identical to its schema template: nothing has opened a data
+    # session on it since it was created
+    pristine: Mapped[bool] = mapped_column(
+        Boolean, default=False, server_default="false", nullable=False
+    )
 
 
 class EnvironmentPoolEntry(PlatformBase):
@@ -136,6 +170,9 @@ class EnvironmentPoolEntry(PlatformBase):
     last_refreshed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
     claimed_by: Mapped[str | None] = mapped_column(String(255), nullable=True)
     claimed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    shard: Mapped[str] = mapped_column(
+        String(64), default=PRIMARY_SHARD, server_default=PRIMARY_SHARD, nullable=False
+    )
     created_at: Mapped[datetime] = mapped_column(
         DateTime, default=datetime.now, nullable=False
     )
@@ -144,6 +181,53 @@ class EnvironmentPoolEntry(PlatformBase):
     )
 
 
+class SchemaMigrationProgress(PlatformBase):
+    """Per-schema state of a migration fanned out over environment schemas."""
+
+    __tablename__ = "schema_migration_progress"
+    __table_args__ = (
+        UniqueConstraint(
+            "revision", "shard", "schema_name", name="uq_schema_migration_target"
+        ),
+        {"schema": "public"},
+    )
+
+    id: Mapped[PyUUID] = mapped_column(
+        PgUUID(as_uuid=True), primary_key=True, default=uuid4
+    )
+    revision: Mapped[str] = mapped_column(String(64), nullable=False)
+    schema_name: Mapped[str] = mapped_column(String(128), nullable=False)
+    shard: Mapped[str] = mapped_column(
+        String(64), default=PRIMARY_SHARD, server_default=PRIMARY_SHARD, nullable=False
+    )
+    # Templates are migrated first so pool rebuilds pick up the new shape.
+    target_kind: Mapped[str] = mapped_column(
+        Enum("template", "pool", "environment", name="schema_migration_target"),
+        nullable=False,
+    )
+    status: Mapped[str] = mapped_column(
+        Enum(
+            "pending",
+            "running",
+            "done",
+            "failed",
+            "skipped",
+            name="schema_migration_status",
+        ),
+        nullable=False,
+        default="pending",
+    )
+    attempts: Mapped[int] = mapped_column(
+        Integer, default=0, server_default="0", nullable=False
+    )
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    started_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.now, nullable=False
+    )
+
+
 class Diff(PlatformBase):
     __tablename__ = "diffs"
     __table_args__ = ({"schema": "public"},)
@@ -172,20 +256,33 @@ class SnapshotMetadata(PlatformBase):
             "table_name",
             name="uq_snapshot_metadata_entry",
         ),
+        # Template snapshots are shared by all environments of the template.
+        Index(
+            "uq_snapshot_metadata_template_entry",
+            "schema_name",
+            "snapshot_suffix",
+            "table_name",
+            unique=True,
+            postgresql_where=text("environment_id IS NULL"),
+        ),
         {"schema": "public"},
     )
 
     id: Mapped[PyUUID] = mapped_column(
         PgUUID(as_uuid=True), primary_key=True, default=uuid4
     )
-    environment_id: Mapped[PyUUID] = mapped_column(
-        ForeignKey("public.run_time_environments.id"), nullable=False
+    # None for a template snapshot, whose schema_name is the template schema
+    environment_id: Mapped[PyUUID | None] = mapped_column(
+        ForeignKey("public.run_time_environments.id"), nullable=True
     )
     schema_name: Mapped[str] = mapped_column(String(255), nullable=False)
     snapshot_suffix: Mapped[str] = mapped_column(String(64), nullable=False)
     table_name: Mapped[str] = mapped_column(String(255), nullable=False)
     row_count: Mapped[int] = mapped_column(BigInteger, nullable=False)
-    checksum: Mapped[str] = mapped_column(String(64), nullable=False)
+    # None until needed when the change counters decide on their own
+    checksum: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    # Change counter reading of the table when the snapshot was taken
+    change_marker: Mapped[str | None] = mapped_column(String(64), nullable=True)
     created_at: Mapped[datetime] = mapped_column(
         DateTime, default=datetime.now, nullable=False
     )
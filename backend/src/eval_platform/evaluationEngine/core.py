@@ -1,8 +1,13 @@
+import re
 from dataclasses import dataclass
 from typing import Any
 from typing_extensions import Literal
 from eval_platform.evaluationEngine.compiler import DSLCompiler
-from eval_platform.evaluationEngine.differ import Differ
+from eval_platform.evaluationEngine.differ import (
+    TEMPLATE_SNAPSHOT,
+    Differ,
+    is_capture_suffix,
+)
 from eval_platform.evaluationEngine.assertion import AssertionEngine
 from eval_platform.evaluationEngine.models import DiffResult
 from eval_platform.isolationEngine.session import SessionManager
@@ -10,6 +15,11 @@ from eval_platform.db.schema import ChangeJournal
 from uuid import uuid4, UUID
 
 
+CHECKPOINT_PREFIX = "c"
+_CHECKPOINT_NAME = re.compile(r"^[A-Za-z0-9_]{1,32}$")
+_MAX_IDENTIFIER_LENGTH = 63
+
+
 @dataclass
 class SnapshotResult:
     suffix: str
@@ -18,9 +28,35 @@ class SnapshotResult:
 
 
 class CoreEvaluationEngine:
-    def __init__(self, sessions: SessionManager):
+    def __init__(
+        self,
+        sessions: SessionManager,
+        *,
+        single_pass_diff: bool = True,
+        diff_workers: int = 1,
+        template_snapshots: bool = True,
+        change_counters: bool = True,
+        change_capture: bool = False,
+    ):
         self.sessions = sessions
         self.compiler = DSLCompiler()
+        self.single_pass_diff = single_pass_diff
+        self.diff_workers = diff_workers
+        # Untouched environments use their template as the before snapshot.
+        self.template_snapshots = template_snapshots
+        self.change_counters = change_counters
+        # Runs record row changes with triggers instead of taking snapshots.
+        self.change_capture = change_capture
+
+    def _differ(self, schema: str, environment_id: str) -> Differ:
+        return Differ(
+            schema=schema,
+            environment_id=environment_id,
+            session_manager=self.sessions,
+            single_pass=self.single_pass_diff,
+            workers=self.diff_workers,
+            change_counters=self.change_counters,
+        )
 
     @staticmethod
     def generate_suffix(prefix: str) -> str:
@@ -38,11 +74,7 @@ class CoreEvaluationEngine:
         suffix: str | None = None,
     ) -> SnapshotResult:
         suffix = suffix or self.generate_suffix(prefix)
-        differ = Differ(
-            schema=schema,
-            environment_id=environment_id,
-            session_manager=self.sessions,
-        )
+        differ = self._differ(schema, environment_id)
         differ.create_snapshot(suffix)
         return SnapshotResult(
             suffix=suffix, schema=schema, environment_id=environment_id
@@ -51,6 +83,19 @@ class CoreEvaluationEngine:
     def take_before(
         self, *, schema: str, environment_id: str, suffix: str | None = None
     ) -> SnapshotResult:
+        if suffix is None and self.change_capture:
+            return SnapshotResult(
+                suffix=self._differ(schema, environment_id).start_capture(),
+                schema=schema,
+                environment_id=environment_id,
+            )
+        if suffix is None and self.template_snapshots:
+            if self._differ(schema, environment_id).use_template_snapshot():
+                return SnapshotResult(
+                    suffix=TEMPLATE_SNAPSHOT,
+                    schema=schema,
+                    environment_id=environment_id,
+                )
         return self.take_snapshot(
             schema=schema,
             environment_id=environment_id,
@@ -59,8 +104,23 @@ class CoreEvaluationEngine:
         )
 
     def take_after(
-        self, *, schema: str, environment_id: str, suffix: str | None = None
+        self,
+        *,
+        schema: str,
+        environment_id: str,
+        suffix: str | None = None,
+        before_suffix: str | None = None,
     ) -> SnapshotResult:
+        """Snapshot to diff against ``before_suffix``.
+
+        A change capture position when the before side is one.
+        """
+        if suffix is None and is_capture_suffix(before_suffix):
+            return SnapshotResult(
+                suffix=self._differ(schema, environment_id).capture_suffix(),
+                schema=schema,
+                environment_id=environment_id,
+            )
         return self.take_snapshot(
             schema=schema,
             environment_id=environment_id,
@@ -76,12 +136,22 @@ class CoreEvaluationEngine:
         before_suffix: str,
         after_suffix: str,
     ) -> DiffResult:
-        differ = Differ(
-            schema=schema, environment_id=environment_id, session_manager=self.sessions
-        )
+        differ = self._differ(schema, environment_id)
 
         return differ.get_diff(before_suffix, after_suffix)
 
+    def store_diff(
+        self,
+        *,
+        schema: str,
+        environment_id: str,
+        diff: DiffResult,
+        before_suffix: str,
+        after_suffix: str,
+    ) -> None:
+        differ = self._differ(schema, environment_id)
+        differ.store_diff(diff, before_suffix, after_suffix)
+
     def compute_diff_from_journal(
         self,
         *,
@@ -130,10 +200,51 @@ class CoreEvaluationEngine:
 
         return DiffResult(inserts=inserts, updates=updates, deletes=deletes)
 
-    def archive(self, *, schema: str, environment_id: str, suffixes: list[str]) -> None:
-        differ = Differ(
-            schema=schema, environment_id=environment_id, session_manager=self.sessions
+    @staticmethod
+    def checkpoint_suffix(name: str) -> str:
+        if not _CHECKPOINT_NAME.match(name):
+            raise ValueError(
+                "checkpoint name must be 1-32 letters, digits or underscores"
+            )
+        return f"{CHECKPOINT_PREFIX}_{name}"
+
+    def create_checkpoint(
+        self, *, schema: str, environment_id: str, name: str
+    ) -> SnapshotResult:
+        """Record the environment's current state as a named restore point.
+
+        Re-using a name replaces the earlier checkpoint.
+        """
+        suffix = self.checkpoint_suffix(name)
+        differ = self._differ(schema, environment_id)
+        too_long = [
+            t
+            for t in differ.tables
+            if len(f"{t}_snapshot_{suffix}") > _MAX_IDENTIFIER_LENGTH
+        ]
+        if too_long:
+            raise ValueError(
+                f"checkpoint name too long for table {too_long[0]}; use a shorter name"
+            )
+        differ.archive_snapshots(suffix)
+        differ.create_snapshot(suffix)
+        return SnapshotResult(
+            suffix=suffix, schema=schema, environment_id=environment_id
         )
+
+    def rollback_to_checkpoint(
+        self, *, schema: str, environment_id: str, name: str
+    ) -> list[str]:
+        """Restore a checkpoint in place; returns the tables that were rewritten."""
+        differ = self._differ(schema, environment_id)
+        suffix = self.checkpoint_suffix(name)
+        try:
+            return differ.restore_snapshot(suffix)
+        except ValueError:
+            raise ValueError(f"checkpoint {name} not found") from None
+
+    def archive(self, *, schema: str, environment_id: str, suffixes: list[str]) -> None:
+        differ = self._differ(schema, environment_id)
         for suffix in suffixes:
             differ.archive_snapshots(suffix)
 
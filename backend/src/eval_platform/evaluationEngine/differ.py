@@ -1,14 +1,42 @@
 from sqlalchemy import text, inspect
+from sqlalchemy.dialects.postgresql import insert
 from eval_platform.isolationEngine.session import SessionManager
 from datetime import datetime
-from eval_platform.db.schema import Diff, SnapshotMetadata
+from eval_platform.db.schema import (
+    Diff,
+    RunTimeEnvironment,
+    SnapshotMetadata,
+    TemplateEnvironment,
+)
+from eval_platform.isolationEngine.environment import SCHEMA_TEMPLATE
+from eval_platform.isolationEngine.planner import (
+    CHANGE_CAPTURE_POSITIONS,
+    CHANGE_CAPTURE_TABLE,
+    CHANGE_CAPTURE_TRIGGER,
+    CHANGE_COUNTER_TABLE,
+    CHANGE_COUNTER_TRIGGER,
+    foreign_key_pairs,
+    owned_sequence_columns,
+    sequence_reset_statement,
+    with_referencing_tables,
+)
 from .models import DiffResult
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from typing import Any
 
 logger = logging.getLogger(__name__)
 
+# Rows fetched per round trip while streaming single-pass diff results
+DIFF_FETCH_SIZE = 1_000
+# Snapshot suffix standing for the environment's template schema itself
+TEMPLATE_SNAPSHOT = "template"
+# Suffixes "capture_<change log oid>_<position id>" mark change capture positions
+CAPTURE_PREFIX = "capture"
+CAPTURE_TRUNCATE_TRIGGER = "_snapshot_capture_truncate"
+
 
 def _sanitize_row(row: dict[str, Any]) -> dict[str, Any]:
     """Convert non-JSON-serializable types (memoryview, bytes) to strings."""
@@ -22,14 +50,50 @@ def _sanitize_row(row: dict[str, Any]) -> dict[str, Any]:
     return sanitized
 
 
+def is_capture_suffix(suffix: str | None) -> bool:
+    return bool(suffix) and suffix.startswith(f"{CAPTURE_PREFIX}_")
+
+
+def _counted_change(before_marker: str | None, after_marker: str | None) -> bool | None:
+    """Whether a table changed between two change counter readings.
+
+    Markers are ``"<counter table oid>.<trigger oid>:<writes>"``. Returns None
+    when the counters cannot tell, e.g. a reading is missing or the trigger
+    was re-created in between.
+    """
+    if before_marker is None or after_marker is None:
+        return None
+    before_source, _, before_writes = before_marker.partition(":")
+    after_source, _, after_writes = after_marker.partition(":")
+    if before_source != after_source:
+        return None
+    return before_writes != after_writes
+
+
 class Differ:
     def __init__(
-        self, schema: str, environment_id: str, session_manager: SessionManager
+        self,
+        schema: str,
+        environment_id: str,
+        session_manager: SessionManager,
+        *,
+        single_pass: bool = True,
+        workers: int = 1,
+        change_counters: bool = True,
     ):
         self.session_manager = session_manager
+        # Diff each table with one FULL OUTER JOIN instead of separate
+        # insert, update and delete joins.
+        self.single_pass = single_pass
+        # Tables snapshotted or diffed concurrently, each on its own pooled
+        # connection; 1 keeps everything on a single connection.
+        self.workers = max(1, workers)
+        # Count writes per table with statement-level triggers, so snapshots
+        # skip checksumming and diffs skip tables nobody wrote to.
+        self.change_counters = change_counters
         self.schema = schema
         self.environment_id = environment_id
-        self.engine = session_manager.base_engine
+        self.engine = session_manager.engine_for_environment(environment_id)
         self.inspector = inspect(self.engine)
         self.tables = [
             name
@@ -39,6 +103,7 @@ class Differ:
         self.q = self.engine.dialect.identifier_preparer.quote
         self._pk_cache = {}
         self._column_cache: dict[str, list[str]] = {}
+        self._template_location: str | None = None
 
     def _get_pk_columns(self, table: str) -> list[str]:
         """Get primary key column(s) for a table."""
@@ -49,39 +114,96 @@ class Differ:
 
     def create_snapshot(self, suffix: str) -> None:
         start = time.perf_counter()
-        with self.engine.begin() as conn:
-            table_count = 0
-            for t in self.tables:
-                table_count += 1
-                table_start = time.perf_counter()
-                snapshot_table = f"{t}_snapshot_{suffix}"
-                sql = f""" 
-                    CREATE TABLE IF NOT EXISTS {self.q(self.schema)}.{self.q(snapshot_table)} AS 
-                    SELECT * FROM {self.q(self.schema)}.{self.q(t)}
-                """
-                conn.execute(text(sql))
-                row_count, checksum = self._compute_snapshot_fingerprint(
-                    conn,
-                    snapshot_table,
-                    self._ordering_columns(t),
-                )
-                self._store_snapshot_metadata(suffix, t, row_count, checksum)
-                table_duration = time.perf_counter() - table_start
-                if table_duration > 1:
-                    logger.debug(
-                        "Snapshot table %s.%s took %.2fs",
-                        self.schema,
-                        snapshot_table,
-                        table_duration,
-                    )
+        self._install_change_counters()
+        if self.workers > 1 and len(self.tables) > 1:
+            self._create_snapshot_parallel(suffix)
+        else:
+            with self.engine.connect() as conn:
+                # One transaction snapshot for the markers and every copy, so
+                # a write committing in between is in neither of them.
+                conn.execution_options(isolation_level="REPEATABLE READ")
+                with conn.begin():
+                    markers = self._read_change_markers(conn)
+                    for t in self.tables:
+                        self._snapshot_table(conn, t, suffix, markers.get(t))
         logger.info(
             "Created snapshot %s for schema %s (%d tables) in %.2fs",
             suffix,
             self.schema,
-            table_count,
+            len(self.tables),
             time.perf_counter() - start,
         )
 
+    def _create_snapshot_parallel(self, suffix: str) -> None:
+        """Copy tables on ``workers`` connections that share one exported snapshot.
+
+        Every worker transaction imports the snapshot the leader exported, so
+        all tables are copied as of the same instant. The leader transaction
+        stays open until the last worker is done; on failure the tables
+        already copied are dropped again.
+        """
+        for t in self.tables:
+            self._ordering_columns(t)
+        try:
+            with self.engine.connect() as leader:
+                leader.execution_options(isolation_level="REPEATABLE READ")
+                with leader.begin():
+                    snapshot_id = leader.exec_driver_sql(
+                        "SELECT pg_export_snapshot()"
+                    ).scalar_one()
+                    markers = self._read_change_markers(leader)
+
+                    def run(table: str) -> None:
+                        with self.engine.connect() as conn:
+                            conn.execution_options(isolation_level="REPEATABLE READ")
+                            with conn.begin():
+                                conn.exec_driver_sql(
+                                    f"SET TRANSACTION SNAPSHOT '{snapshot_id}'"
+                                )
+                                self._snapshot_table(
+                                    conn, table, suffix, markers.get(table)
+                                )
+
+                    with ThreadPoolExecutor(
+                        max_workers=min(self.workers, len(self.tables)),
+                        thread_name_prefix="snapshot",
+                    ) as executor:
+                        list(executor.map(run, self.tables))
+        except Exception:
+            self.archive_snapshots(suffix)
+            raise
+
+    def _snapshot_table(
+        self, conn, t: str, suffix: str, marker: str | None = None
+    ) -> None:
+        table_start = time.perf_counter()
+        snapshot_table = f"{t}_snapshot_{suffix}"
+        sql = f"""
+            CREATE TABLE IF NOT EXISTS {self.q(self.schema)}.{self.q(snapshot_table)} AS 
+            SELECT * FROM {self.q(self.schema)}.{self.q(t)}
+        """
+        copied = conn.execute(text(sql)).rowcount
+        if marker is not None and copied >= 0:
+            # The checksum is only computed if the counters cannot decide.
+            row_count, checksum = copied, None
+        else:
+            # No counters, or the snapshot table already existed.
+            row_count, checksum = self._compute_snapshot_fingerprint(
+                conn,
+                snapshot_table,
+                self._ordering_columns(t),
+            )
+            marker = None
+        self._store_snapshot_metadata(suffix, t, row_count, checksum, marker)
+        table_duration = time.perf_counter() - table_start
+        if table_duration > 1:
+            logger.debug(
+                "Snapshot table %s.%s took %.2fs",
+                self.schema,
+                snapshot_table,
+                table_duration,
+            )
+
     def get_inserts(
         self, before_suffix: str, after_suffix: str, tables: list[str]
     ) -> list[dict]:
@@ -91,8 +213,8 @@ class Differ:
         per_table_stats: list[tuple[str, int, float]] = []
         with self.engine.begin() as conn:
             for t in tables:
-                before_table = f"{t}_snapshot_{before_suffix}"
-                after_table = f"{t}_snapshot_{after_suffix}"
+                before_table = self._snapshot_relation(t, before_suffix)
+                after_table = self._snapshot_relation(t, after_suffix)
                 pk_cols = self._get_pk_columns(t)
 
                 if not pk_cols:
@@ -107,8 +229,8 @@ class Differ:
 
                 q_inserts = f"""
                     SELECT a.*
-                    FROM {self.q(self.schema)}.{self.q(after_table)} AS a
-                    LEFT JOIN {self.q(self.schema)}.{self.q(before_table)} AS b
+                    FROM {after_table} AS a
+                    LEFT JOIN {before_table} AS b
                     ON {join_conditions}
                     WHERE {where_conditions}
                 """
@@ -153,8 +275,8 @@ class Differ:
         per_table_stats: list[tuple[str, int, float]] = []
         with self.engine.begin() as conn:
             for t in tables:
-                before = f"{t}_snapshot_{before_suffix}"
-                after = f"{t}_snapshot_{after_suffix}"
+                before = self._snapshot_relation(t, before_suffix)
+                after = self._snapshot_relation(t, after_suffix)
                 pk_cols = self._get_pk_columns(t)
 
                 if not pk_cols:
@@ -186,8 +308,8 @@ class Differ:
                 )
                 sql = f"""
                     SELECT {proj_cols}
-                    FROM {self.q(self.schema)}.{self.q(after)} AS a
-                    JOIN {self.q(self.schema)}.{self.q(before)} AS b
+                    FROM {after} AS a
+                    JOIN {before} AS b
                       ON {join_conditions}
                     WHERE {cmp_expr}
                 """
@@ -234,8 +356,8 @@ class Differ:
         per_table_stats: list[tuple[str, int, float]] = []
         with self.engine.begin() as conn:
             for t in tables:
-                before_table = f"{t}_snapshot_{before_suffix}"
-                after_table = f"{t}_snapshot_{after_suffix}"
+                before_table = self._snapshot_relation(t, before_suffix)
+                after_table = self._snapshot_relation(t, after_suffix)
                 pk_cols = self._get_pk_columns(t)
 
                 if not pk_cols:
@@ -250,8 +372,8 @@ class Differ:
 
                 q_deletes = f"""
                     SELECT b.*
-                    FROM {self.q(self.schema)}.{self.q(before_table)} AS b
-                    LEFT JOIN {self.q(self.schema)}.{self.q(after_table)} AS a
+                    FROM {before_table} AS b
+                    LEFT JOIN {after_table} AS a
                     ON {join_conditions}
                     WHERE {where_conditions}
                 """
@@ -283,14 +405,447 @@ class Differ:
         self._log_stage_stats("deletes", per_table_stats)
         return deletes
 
+    def get_changes(
+        self,
+        before_suffix: str,
+        after_suffix: str,
+        tables: list[str],
+        exclude_cols: list[str] | None = None,
+    ) -> DiffResult:
+        """Inserts, updates and deletes from one FULL OUTER JOIN per table.
+
+        Rows are classified as they stream back: a side missing its primary
+        key is an insert or delete, any other row returned is an update.
+        With ``workers`` > 1 tables are joined concurrently on separate
+        connections; results keep the order of ``tables`` either way.
+        """
+        start = time.perf_counter()
+        tables = [t for t in tables if self._get_pk_columns(t)]
+        diff_table = partial(
+            self._diff_table,
+            before_suffix=before_suffix,
+            after_suffix=after_suffix,
+            exclude_cols=exclude_cols or (),
+        )
+        results = self._map_tables(diff_table, tables)
+        return self._merge_table_changes("single-pass", tables, results, start)
+
+    def get_captured_changes(self, before_suffix: str, after_suffix: str) -> DiffResult:
+        """Net inserts, updates and deletes recorded by the change capture log.
+
+        Each position is a transaction snapshot, so the run holds the log
+        entries of transactions that committed between the two, whatever
+        order they wrote in. Those entries are folded per primary key: the
+        row image before the first change against the image after the last
+        one. Images are read back as rows of the live table, so the result
+        matches a snapshot diff of the same changes.
+        """
+        start = time.perf_counter()
+        log_oid, first = self._capture_position(before_suffix)
+        after_oid, last = self._capture_position(after_suffix)
+        if log_oid != after_oid or log_oid != self._capture_log_oid():
+            raise ValueError(
+                f"change log of {self.schema} was reset between "
+                f"{before_suffix} and {after_suffix}"
+            )
+        params = {"first": first, "last": last}
+        with self.engine.connect() as conn:
+            known = set(
+                conn.execute(
+                    text(
+                        f"SELECT id FROM {self._capture_positions()} "
+                        "WHERE id IN (:first, :last)"
+                    ),
+                    params,
+                ).scalars()
+            )
+            if known != {first, last}:
+                raise ValueError(
+                    f"unknown change capture position in {self.schema}: "
+                    f"{before_suffix} or {after_suffix}"
+                )
+            touched = set(
+                conn.execute(
+                    text(self._captured_entries("DISTINCT l.table_name")), params
+                ).scalars()
+            )
+        tables = [t for t in self.tables if t in touched and self._get_pk_columns(t)]
+        capture_table = partial(self._capture_table, first=first, last=last)
+        results = self._map_tables(capture_table, tables)
+        return self._merge_table_changes("captured", tables, results, start)
+
+    def _map_tables(self, fn, tables: list[str]) -> list:
+        """``fn(conn, table)`` per table, on ``workers`` connections when > 1."""
+        if self.workers > 1 and len(tables) > 1:
+            # Inspector caches are warm, so workers only read them.
+            for t in tables:
+                self._get_columns(t)
+
+            def run(table: str):
+                with self.engine.begin() as conn:
+                    return fn(conn, table)
+
+            with ThreadPoolExecutor(
+                max_workers=min(self.workers, len(tables)),
+                thread_name_prefix="differ",
+            ) as executor:
+                return list(executor.map(run, tables))
+        with self.engine.begin() as conn:
+            return [fn(conn, t) for t in tables]
+
+    def _merge_table_changes(
+        self, kind: str, tables: list[str], results: list, start: float
+    ) -> DiffResult:
+        inserts: list[dict] = []
+        updates: list[dict] = []
+        deletes: list[dict] = []
+        per_table_stats: list[tuple[str, int, float]] = []
+        for t, (table_inserts, table_updates, table_deletes, duration) in zip(
+            tables, results
+        ):
+            inserts.extend(table_inserts)
+            updates.extend(table_updates)
+            deletes.extend(table_deletes)
+            per_table_stats.append(
+                (
+                    t,
+                    len(table_inserts) + len(table_updates) + len(table_deletes),
+                    duration,
+                )
+            )
+        logger.info(
+            "Computed %s diff for %s (%d inserts, %d updates, %d deletes, %.2fs)",
+            kind,
+            self.schema,
+            len(inserts),
+            len(updates),
+            len(deletes),
+            time.perf_counter() - start,
+        )
+        self._log_stage_stats("changes", per_table_stats)
+        return DiffResult(inserts=inserts, updates=updates, deletes=deletes)
+
+    def _diff_table(
+        self,
+        conn,
+        t: str,
+        *,
+        before_suffix: str,
+        after_suffix: str,
+        exclude_cols,
+    ) -> tuple[list[dict], list[dict], list[dict], float]:
+        before = self._snapshot_relation(t, before_suffix)
+        after = self._snapshot_relation(t, after_suffix)
+        pk_cols = self._get_pk_columns(t)
+        cols = self._get_columns(t)
+        compare_cols = [c for c in cols if c not in exclude_cols]
+        join_conditions = " AND ".join(
+            f"a.{self.q(pk)} = b.{self.q(pk)}" for pk in pk_cols
+        )
+        cmp_expr = (
+            " OR ".join(
+                f"a.{self.q(c)} IS DISTINCT FROM b.{self.q(c)}" for c in compare_cols
+            )
+            or "FALSE"
+        )
+        key = self.q(pk_cols[0])
+        # Selected by position: after columns, then before columns.
+        proj_cols = ", ".join(
+            [f"a.{self.q(c)}" for c in cols] + [f"b.{self.q(c)}" for c in cols]
+        )
+        sql = f"""
+            SELECT b.{key} IS NULL, a.{key} IS NULL, {proj_cols}
+            FROM {after} AS a
+            FULL OUTER JOIN {before} AS b
+              ON {join_conditions}
+            WHERE b.{key} IS NULL OR a.{key} IS NULL OR {cmp_expr}
+        """
+        table_start = time.perf_counter()
+        streaming = conn.execution_options(yield_per=DIFF_FETCH_SIZE)
+        return self._classify_rows(t, cols, streaming.exec_driver_sql(sql), table_start)
+
+    def _capture_table(
+        self, conn, t: str, *, first: int, last: int
+    ) -> tuple[list[dict], list[dict], list[dict], float]:
+        relation = f"{self.q(self.schema)}.{self.q(t)}"
+        cols = self._get_columns(t)
+
+        pk_literals = [pk.replace("'", "''") for pk in self._get_pk_columns(t)]
+
+        def key(image: str) -> str:
+            parts = ", ".join(f"{image}->'{pk}'" for pk in pk_literals)
+            return f"jsonb_build_array({parts})"
+
+        # A key-changing update ends the old key and starts the new one.
+        # Writers of one key are serialised by its row lock, so log ids order
+        # each key's changes even across transactions.
+        proj_cols = ", ".join(
+            [f"a.{self.q(c)}" for c in cols] + [f"b.{self.q(c)}" for c in cols]
+        )
+        sql = f"""
+            WITH log AS (
+                {self._captured_entries("l.id, l.old_row, l.new_row")}
+                  AND l.table_name = :table
+            ),
+            events AS (
+                SELECT id, {key("old_row")} AS key, old_row AS before_row,
+                       CASE WHEN new_row IS NOT NULL
+                                 AND {key("new_row")} = {key("old_row")}
+                            THEN new_row END AS after_row
+                FROM log
+                WHERE old_row IS NOT NULL
+                UNION ALL
+                SELECT id, {key("new_row")}, NULL, new_row
+                FROM log
+                WHERE new_row IS NOT NULL
+                  AND (old_row IS NULL OR {key("new_row")} <> {key("old_row")})
+            ),
+            net AS (
+                SELECT DISTINCT ON (key)
+                       first_value(before_row) OVER w AS before_row,
+                       last_value(after_row) OVER w AS after_row
+                FROM events
+                WINDOW w AS (
+                    PARTITION BY key ORDER BY id
+                    ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+                )
+            )
+            SELECT n.before_row IS NULL, n.after_row IS NULL, {proj_cols}
+            FROM net AS n
+            CROSS JOIN LATERAL jsonb_populate_record(NULL::{relation}, n.after_row) AS a
+            CROSS JOIN LATERAL jsonb_populate_record(NULL::{relation}, n.before_row) AS b
+            WHERE n.before_row IS DISTINCT FROM n.after_row
+        """
+        table_start = time.perf_counter()
+        streaming = conn.execution_options(yield_per=DIFF_FETCH_SIZE)
+        rows = streaming.execute(text(sql), {"table": t, "first": first, "last": last})
+        return self._classify_rows(t, cols, rows, table_start)
+
+    def _classify_rows(
+        self, t: str, cols: list[str], rows, table_start: float
+    ) -> tuple[list[dict], list[dict], list[dict], float]:
+        """Split (inserted, deleted, after cols..., before cols...) rows."""
+        inserts: list[dict] = []
+        updates: list[dict] = []
+        deletes: list[dict] = []
+        width = len(cols)
+        for row in rows:
+            inserted, deleted = row[0], row[1]
+            after_map = _sanitize_row(dict(zip(cols, row[2 : 2 + width])))
+            if inserted:
+                after_map["__table__"] = t
+                inserts.append(after_map)
+                continue
+            before_map = _sanitize_row(dict(zip(cols, row[2 + width :])))
+            if deleted:
+                before_map["__table__"] = t
+                deletes.append(before_map)
+            else:
+                updates.append(
+                    {"__table__": t, "after": after_map, "before": before_map}
+                )
+        table_duration = time.perf_counter() - table_start
+        count = len(inserts) + len(updates) + len(deletes)
+        if count:
+            logger.debug(
+                "Diff changes %s.%s -> %d rows in %.2fs",
+                self.schema,
+                t,
+                count,
+                table_duration,
+            )
+        return inserts, updates, deletes, table_duration
+
     def get_diff(self, before_suffix: str, after_suffix: str) -> DiffResult:
+        if is_capture_suffix(before_suffix):
+            return self.get_captured_changes(before_suffix, after_suffix)
         tables = self._tables_to_compare(before_suffix, after_suffix)
+        if self.single_pass:
+            return self.get_changes(before_suffix, after_suffix, tables)
         inserts = self.get_inserts(before_suffix, after_suffix, tables)
         updates = self.get_updates(before_suffix, after_suffix, tables)
         deletes = self.get_deletes(before_suffix, after_suffix, tables)
         return DiffResult(inserts=inserts, updates=updates, deletes=deletes)
 
+    def use_template_snapshot(self) -> bool:
+        """Whether the template schema can serve as this environment's snapshot.
+
+        True for environments untouched since they were cloned from a schema
+        template. The template's checksums are computed once and shared by all
+        its environments; after this returns True, ``TEMPLATE_SNAPSHOT`` works
+        as a before suffix.
+        """
+        # Counters are read before checking the environment is still pristine,
+        # so they cannot include writes the template does not have.
+        self._install_change_counters()
+        with self.engine.connect() as conn:
+            markers = self._read_change_markers(conn)
+        pristine, location = self._template_row()
+        if not pristine or location is None:
+            return False
+        template_tables = set(self.inspector.get_table_names(schema=location))
+        if not template_tables.issuperset(self.tables):
+            return False
+        metadata = self._template_metadata(location)
+        missing = [t for t in self.tables if t not in metadata]
+        if missing:
+            self._store_template_metadata(location, missing)
+            metadata = self._template_metadata(location)
+        for t in self.tables:
+            if t in markers:
+                entry = metadata[t]
+                self._store_snapshot_metadata(
+                    TEMPLATE_SNAPSHOT, t, entry.row_count, entry.checksum, markers[t]
+                )
+        return True
+
+    def start_capture(self) -> str:
+        """Install the change capture triggers; returns the current capture suffix.
+
+        Tables without a primary key are not captured, as in snapshot diffs.
+        The position is taken in the same transaction, so a concurrent
+        ``release_capture`` cannot remove the triggers in between.
+        """
+        schema = self.q(self.schema)
+        log = self._capture_log()
+        function = f"{schema}.{self.q(CHANGE_CAPTURE_TRIGGER)}"
+        with self.engine.begin() as conn:
+            self._lock_capture(conn)
+            conn.exec_driver_sql(
+                f"CREATE TABLE IF NOT EXISTS {log} (id bigserial PRIMARY KEY, "
+                "table_name text NOT NULL, old_row jsonb, new_row jsonb)"
+            )
+            # Entries carry their writer's transaction id, positions the
+            # snapshot they were taken in; see get_captured_changes.
+            conn.exec_driver_sql(
+                f"ALTER TABLE {log} ADD COLUMN IF NOT EXISTS "
+                "xid xid8 NOT NULL DEFAULT pg_current_xact_id()"
+            )
+            conn.exec_driver_sql(
+                f"CREATE INDEX IF NOT EXISTS {self.q(CHANGE_CAPTURE_TABLE + '_xid')} "
+                f"ON {log} (xid)"
+            )
+            conn.exec_driver_sql(
+                f"CREATE TABLE IF NOT EXISTS {self._capture_positions()} "
+                "(id bigserial PRIMARY KEY, snapshot pg_snapshot NOT NULL)"
+            )
+            captured = self._captured_tables(conn)
+            missing = [
+                t for t in self.tables if t not in captured and self._get_pk_columns(t)
+            ]
+            if missing:
+                # TRUNCATE has no row images; its rows are logged as deletes.
+                conn.execution_options(no_parameters=True).exec_driver_sql(
+                    f"""
+                    CREATE OR REPLACE FUNCTION {function}() RETURNS trigger
+                    LANGUAGE plpgsql AS $$
+                    BEGIN
+                        IF TG_OP = 'TRUNCATE' THEN
+                            EXECUTE format(
+                                'INSERT INTO {log} (table_name, old_row) '
+                                'SELECT %L, to_jsonb(t) FROM %I.%I AS t',
+                                TG_TABLE_NAME, TG_TABLE_SCHEMA, TG_TABLE_NAME
+                            );
+                        ELSIF TG_OP = 'INSERT' THEN
+                            INSERT INTO {log} (table_name, new_row)
+                            VALUES (TG_TABLE_NAME, to_jsonb(NEW));
+                        ELSIF TG_OP = 'UPDATE' THEN
+                            INSERT INTO {log} (table_name, old_row, new_row)
+                            VALUES (TG_TABLE_NAME, to_jsonb(OLD), to_jsonb(NEW));
+                        ELSE
+                            INSERT INTO {log} (table_name, old_row)
+                            VALUES (TG_TABLE_NAME, to_jsonb(OLD));
+                        END IF;
+                        RETURN NULL;
+                    END
+                    $$
+                    """
+                )
+                for t in missing:
+                    relation = f"{schema}.{self.q(t)}"
+                    conn.exec_driver_sql(
+                        f"CREATE TRIGGER {self.q(CHANGE_CAPTURE_TRIGGER)} "
+                        f"AFTER INSERT OR UPDATE OR DELETE ON {relation} "
+                        f"FOR EACH ROW EXECUTE FUNCTION {function}()"
+                    )
+                    conn.exec_driver_sql(
+                        f"CREATE TRIGGER {self.q(CAPTURE_TRUNCATE_TRIGGER)} "
+                        f"BEFORE TRUNCATE ON {relation} "
+                        f"FOR EACH STATEMENT EXECUTE FUNCTION {function}()"
+                    )
+            suffix = self._take_capture_position(conn)
+        logger.info(
+            "Change capture on %s: %d tables newly captured",
+            self.schema,
+            len(missing),
+        )
+        return suffix
+
+    def capture_suffix(self) -> str:
+        """Suffix naming the change log's current position.
+
+        The position records the current transaction snapshot rather than
+        the highest log id: ids are handed out when a transaction writes, not
+        when it commits, so a slow transaction can commit ids below ones
+        already seen.
+        """
+        with self.engine.begin() as conn:
+            self._lock_capture(conn)
+            return self._take_capture_position(conn)
+
+    def release_capture(self, suffix: str) -> None:
+        """Forget a capture position once its diffs are done.
+
+        Log entries every remaining position already sees can no longer be
+        part of a diff and are deleted. When no position is left the
+        triggers, the log and the positions table are dropped, so later
+        writes are not logged any more.
+        """
+        log_oid, position = self._capture_position(suffix)
+        log = self._capture_log()
+        positions = self._capture_positions()
+        with self.engine.begin() as conn:
+            self._lock_capture(conn)
+            current = conn.execute(
+                text("SELECT to_regclass(:log)::oid"), {"log": log}
+            ).scalar()
+            if current != log_oid:
+                return
+            conn.execute(
+                text(f"DELETE FROM {positions} WHERE id = :id"), {"id": position}
+            )
+            if conn.execute(text(f"SELECT 1 FROM {positions} LIMIT 1")).first():
+                conn.execute(
+                    text(
+                        f"""
+                        DELETE FROM {log} AS l
+                        WHERE NOT EXISTS (
+                            SELECT 1 FROM {positions} AS p
+                            WHERE NOT pg_visible_in_snapshot(l.xid, p.snapshot)
+                        )
+                        """
+                    )
+                )
+                return
+            schema = self.q(self.schema)
+            for t in self._captured_tables(conn):
+                relation = f"{schema}.{self.q(t)}"
+                for trigger in (CHANGE_CAPTURE_TRIGGER, CAPTURE_TRUNCATE_TRIGGER):
+                    conn.exec_driver_sql(
+                        f"DROP TRIGGER IF EXISTS {self.q(trigger)} ON {relation}"
+                    )
+            conn.exec_driver_sql(
+                f"DROP FUNCTION IF EXISTS {schema}.{self.q(CHANGE_CAPTURE_TRIGGER)}()"
+            )
+            conn.exec_driver_sql(f"DROP TABLE {log}, {positions}")
+        logger.info("Change capture on %s stopped", self.schema)
+
     def archive_snapshots(self, suffix: str) -> None:
+        if suffix == TEMPLATE_SNAPSHOT:
+            return
+        if is_capture_suffix(suffix):
+            self.release_capture(suffix)
+            return
         with self.engine.begin() as conn:
             for t in self.tables:
                 snapshot_table = f"{t}_snapshot_{suffix}"
@@ -300,6 +855,80 @@ class Differ:
                 conn.execute(text(sql))
         self._delete_snapshot_metadata(suffix)
 
+    def restore_snapshot(self, suffix: str) -> list[str]:
+        """Rewrite the live tables that changed since snapshot ``suffix``.
+
+        Live change counters, or checksums where the counters cannot tell,
+        are compared against the snapshot metadata under an exclusive lock;
+        only changed tables and the tables referencing them are truncated
+        and re-filled from the snapshot tables. Snapshots do
+        not capture sequence state, so sequences of rewritten tables restart
+        after their restored maximum. Returns the rewritten tables.
+        """
+        metadata = self._load_metadata_map(suffix)
+        if not metadata:
+            raise ValueError(f"snapshot {suffix} not found")
+        tables = [t for t in self.tables if t in metadata]
+        schema = self.q(self.schema)
+        start = time.perf_counter()
+        with self.engine.begin() as conn:
+            if tables:
+                conn.execute(
+                    text(
+                        "LOCK TABLE "
+                        + ", ".join(f"{schema}.{self.q(t)}" for t in tables)
+                        + " IN EXCLUSIVE MODE"
+                    )
+                )
+            markers = self._read_change_markers(conn)
+            decided = {
+                t: _counted_change(metadata[t].change_marker, markers.get(t))
+                for t in tables
+            }
+            undecided = [t for t in tables if decided[t] is None]
+            self._ensure_checksums(suffix, metadata, undecided)
+            for t in undecided:
+                row_count, checksum = self._compute_snapshot_fingerprint(
+                    conn, t, self._ordering_columns(t)
+                )
+                entry = metadata[t]
+                decided[t] = row_count != entry.row_count or checksum != entry.checksum
+            changed = [t for t in tables if decided[t]]
+            rewrite = with_referencing_tables(
+                changed, foreign_key_pairs(conn, self.schema), tables
+            )
+            if rewrite:
+                conn.execute(text("SET CONSTRAINTS ALL DEFERRED"))
+                conn.execute(
+                    text(
+                        "TRUNCATE "
+                        + ", ".join(f"{schema}.{self.q(t)}" for t in rewrite)
+                    )
+                )
+                for t in rewrite:
+                    snapshot_table = f"{t}_snapshot_{suffix}"
+                    conn.execute(
+                        text(
+                            f"INSERT INTO {schema}.{self.q(t)} "
+                            f"SELECT * FROM {schema}.{self.q(snapshot_table)}"
+                        )
+                    )
+                conn.execute(text("SET CONSTRAINTS ALL IMMEDIATE"))
+                reset = sequence_reset_statement(
+                    self.schema, owned_sequence_columns(conn, self.schema), rewrite
+                )
+                if reset:
+                    conn.execution_options(no_parameters=True).exec_driver_sql(reset)
+        logger.info(
+            "Restored snapshot %s for schema %s (%d/%d tables) in %.2fs",
+            suffix,
+            self.schema,
+            len(rewrite),
+            len(tables),
+            time.perf_counter() - start,
+        )
+        return rewrite
+
     def store_diff(
         self,
         diff: DiffResult,
@@ -317,10 +946,7 @@ class Differ:
             )
             session.add(diff_object)
 
-    def _ordering_columns(self, table: str) -> list[str]:
-        pk_cols = self._get_pk_columns(table)
-        if pk_cols:
-            return pk_cols
+    def _get_columns(self, table: str) -> list[str]:
         if table not in self._column_cache:
             cols = [
                 c["name"] for c in self.inspector.get_columns(table, schema=self.schema)
@@ -328,11 +954,312 @@ class Differ:
             self._column_cache[table] = cols
         return self._column_cache[table]
 
+    def _ordering_columns(self, table: str) -> list[str]:
+        pk_cols = self._get_pk_columns(table)
+        if pk_cols:
+            return pk_cols
+        return self._get_columns(table)
+
+    def _snapshot_relation(self, table: str, suffix: str) -> str:
+        """Quoted relation holding ``table`` as of snapshot ``suffix``."""
+        if suffix == TEMPLATE_SNAPSHOT:
+            return f"{self.q(self._template_schema())}.{self.q(table)}"
+        return f"{self.q(self.schema)}.{self.q(f'{table}_snapshot_{suffix}')}"
+
+    def _capture_log(self) -> str:
+        return f"{self.q(self.schema)}.{self.q(CHANGE_CAPTURE_TABLE)}"
+
+    def _capture_positions(self) -> str:
+        return f"{self.q(self.schema)}.{self.q(CHANGE_CAPTURE_POSITIONS)}"
+
+    def _lock_capture(self, conn) -> None:
+        """Serialise installing, positioning and releasing change capture."""
+        conn.execute(
+            text("SELECT pg_advisory_xact_lock(hashtextextended(:key, 0))"),
+            {"key": f"capture:{self.schema}"},
+        )
+
+    def _take_capture_position(self, conn) -> str:
+        log_oid = conn.execute(
+            text("SELECT to_regclass(:log)::oid"), {"log": self._capture_log()}
+        ).scalar()
+        if log_oid is None:
+            raise ValueError(f"change capture is not enabled for {self.schema}")
+        position = conn.execute(
+            text(
+                f"INSERT INTO {self._capture_positions()} (snapshot) "
+                "VALUES (pg_current_snapshot()) RETURNING id"
+            )
+        ).scalar_one()
+        return f"{CAPTURE_PREFIX}_{log_oid}_{position}"
+
+    def _captured_tables(self, conn) -> set[str]:
+        return set(
+            conn.execute(
+                text(
+                    """
+                    SELECT c.relname
+                    FROM pg_trigger t
+                    JOIN pg_class c ON c.oid = t.tgrelid
+                    JOIN pg_namespace n ON n.oid = c.relnamespace
+                    WHERE n.nspname = :schema AND t.tgname = :trigger
+                    """
+                ),
+                {"schema": self.schema, "trigger": CHANGE_CAPTURE_TRIGGER},
+            ).scalars()
+        )
+
+    def _captured_entries(self, columns: str) -> str:
+        """SELECT of log entries (alias ``l``) committed between :first and :last.
+
+        An entry belongs to the run if its transaction is visible in the
+        :last snapshot but not in the :first one; transactions older than
+        the first snapshot's xmin are visible in it, which lets the xid
+        index narrow the scan.
+        """
+        positions = self._capture_positions()
+        return f"""
+            SELECT {columns}
+            FROM {self._capture_log()} AS l,
+                 (SELECT (SELECT snapshot FROM {positions} WHERE id = :first) AS since,
+                         (SELECT snapshot FROM {positions} WHERE id = :last) AS until
+                 ) AS p
+            WHERE l.xid >= pg_snapshot_xmin(p.since)
+              AND pg_visible_in_snapshot(l.xid, p.until)
+              AND NOT pg_visible_in_snapshot(l.xid, p.since)
+        """
+
+    def _capture_log_oid(self) -> int | None:
+        with self.engine.connect() as conn:
+            return conn.execute(
+                text("SELECT to_regclass(:log)::oid"), {"log": self._capture_log()}
+            ).scalar()
+
+    @staticmethod
+    def _capture_position(suffix: str) -> tuple[int, int]:
+        """(change log oid, position id) encoded in a capture suffix."""
+        prefix, _, position = suffix.partition("_")
+        log_oid, _, last = position.partition("_")
+        if prefix != CAPTURE_PREFIX or not log_oid.isdigit() or not last.isdigit():
+            raise ValueError(f"{suffix} is not a change capture position")
+        return int(log_oid), int(last)
+
+    def _install_change_counters(self) -> None:
+        """Attach the write counting trigger to tables that lack it.
+
+        Each write statement appends a row to the counter table instead of
+        updating a shared one, so writers never wait on each other; the rows
+        are summed when read and collapsed to one per table here. Runs in its
+        own short transaction. Tables left without the trigger, e.g. because
+        it could not be created, are compared by checksum.
+        """
+        if not self.change_counters:
+            return
+        schema = self.q(self.schema)
+        counters = f"{schema}.{self.q(CHANGE_COUNTER_TABLE)}"
+        function = f"{schema}.{self.q(CHANGE_COUNTER_TRIGGER)}"
+        try:
+            with self.engine.begin() as conn:
+                counted = set(
+                    conn.execute(
+                        text(
+                            """
+                            SELECT c.relname
+                            FROM pg_trigger t
+                            JOIN pg_class c ON c.oid = t.tgrelid
+                            JOIN pg_namespace n ON n.oid = c.relnamespace
+                            WHERE n.nspname = :schema AND t.tgname = :trigger
+                            """
+                        ),
+                        {"schema": self.schema, "trigger": CHANGE_COUNTER_TRIGGER},
+                    ).scalars()
+                )
+                missing = [t for t in self.tables if t not in counted]
+                conn.exec_driver_sql(
+                    f"CREATE TABLE IF NOT EXISTS {counters} "
+                    "(table_name text NOT NULL, writes bigint NOT NULL)"
+                )
+                if counted:
+                    # Rows appended meanwhile are not visible to the DELETE
+                    # and stay; the per-table sums do not change.
+                    conn.exec_driver_sql(
+                        f"""
+                        WITH counted AS (
+                            DELETE FROM {counters} RETURNING table_name, writes
+                        )
+                        INSERT INTO {counters} (table_name, writes)
+                        SELECT table_name, sum(writes) FROM counted
+                        GROUP BY table_name
+                        """
+                    )
+                if not missing:
+                    return
+                conn.exec_driver_sql(
+                    f"""
+                    CREATE OR REPLACE FUNCTION {function}() RETURNS trigger
+                    LANGUAGE plpgsql AS $$
+                    BEGIN
+                        INSERT INTO {counters} (table_name, writes)
+                        VALUES (TG_TABLE_NAME, 1);
+                        RETURN NULL;
+                    END
+                    $$
+                    """
+                )
+                for t in missing:
+                    conn.exec_driver_sql(
+                        f"CREATE TRIGGER {self.q(CHANGE_COUNTER_TRIGGER)} "
+                        "AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE "
+                        f"ON {schema}.{self.q(t)} "
+                        f"FOR EACH STATEMENT EXECUTE FUNCTION {function}()"
+                    )
+        except Exception as exc:
+            logger.warning(
+                "Could not install change counters in %s: %s", self.schema, exc
+            )
+
+    def _read_change_markers(self, conn) -> dict[str, str]:
+        """Change counter reading per counted table, as of ``conn``'s snapshot."""
+        if not self.change_counters:
+            return {}
+        counters = f"{self.q(self.schema)}.{self.q(CHANGE_COUNTER_TABLE)}"
+        counters_oid = conn.execute(
+            text("SELECT to_regclass(:counters)::oid"), {"counters": counters}
+        ).scalar()
+        if counters_oid is None:
+            return {}
+        rows = conn.execute(
+            text(
+                f"""
+                SELECT c.relname, t.oid, COALESCE(k.writes, 0)
+                FROM pg_trigger t
+                JOIN pg_class c ON c.oid = t.tgrelid
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                LEFT JOIN (
+                    SELECT table_name, sum(writes)::bigint AS writes
+                    FROM {counters}
+                    GROUP BY table_name
+                ) k ON k.table_name = c.relname
+                WHERE n.nspname = :schema AND t.tgname = :trigger
+                """
+            ),
+            {"schema": self.schema, "trigger": CHANGE_COUNTER_TRIGGER},
+        )
+        # A re-created counter table or trigger restarts the count, so both
+        # identify the counter a reading belongs to.
+        return {
+            name: f"{counters_oid}.{trigger_oid}:{writes}"
+            for name, trigger_oid, writes in rows
+        }
+
+    def _ensure_checksums(
+        self, suffix: str, metadata: dict[str, SnapshotMetadata], tables: list[str]
+    ) -> None:
+        """Compute the checksums snapshot ``suffix`` left to its change counters."""
+        missing = [t for t in tables if t in metadata and metadata[t].checksum is None]
+        if not missing:
+            return
+        with self.engine.begin() as conn:
+            for t in missing:
+                row_count, checksum = self._compute_snapshot_fingerprint(
+                    conn, f"{t}_snapshot_{suffix}", self._ordering_columns(t)
+                )
+                entry = metadata[t]
+                entry.checksum = checksum
+                self._store_snapshot_metadata(
+                    suffix, t, row_count, checksum, entry.change_marker
+                )
+
+    def _template_row(self) -> tuple[bool, str | None]:
+        """(pristine, schema template location) of this environment."""
+        with self.session_manager.with_meta_session() as session:
+            row = (
+                session.query(
+                    RunTimeEnvironment.pristine,
+                    TemplateEnvironment.location,
+                    TemplateEnvironment.kind,
+                )
+                .outerjoin(
+                    TemplateEnvironment,
+                    TemplateEnvironment.id == RunTimeEnvironment.template_id,
+                )
+                .filter(RunTimeEnvironment.id == self.environment_id)
+                .one_or_none()
+            )
+        if row is None:
+            return False, None
+        pristine, location, kind = row
+        if kind != SCHEMA_TEMPLATE:
+            location = None
+        self._template_location = location
+        return pristine, location
+
+    def _template_schema(self) -> str:
+        if self._template_location is None:
+            _, location = self._template_row()
+            if location is None:
+                raise ValueError(
+                    f"environment {self.environment_id} has no schema template"
+                )
+        return self._template_location
+
+    def _template_metadata(self, location: str) -> dict[str, SnapshotMetadata]:
+        with self.session_manager.with_meta_session() as session:
+            entries = (
+                session.query(SnapshotMetadata)
+                .filter(
+                    SnapshotMetadata.environment_id.is_(None),
+                    SnapshotMetadata.schema_name == location,
+                    SnapshotMetadata.snapshot_suffix == TEMPLATE_SNAPSHOT,
+                )
+                .all()
+            )
+        return {entry.table_name: entry for entry in entries}
+
+    def _store_template_metadata(self, location: str, tables: list[str]) -> None:
+        start = time.perf_counter()
+        now = datetime.now()
+        rows = []
+        with self.engine.begin() as conn:
+            for t in tables:
+                row_count, checksum = self._compute_snapshot_fingerprint(
+                    conn, t, self._ordering_columns(t), schema=location
+                )
+                rows.append(
+                    {
+                        "environment_id": None,
+                        "schema_name": location,
+                        "snapshot_suffix": TEMPLATE_SNAPSHOT,
+                        "table_name": t,
+                        "row_count": row_count,
+                        "checksum": checksum,
+                        "created_at": now,
+                        "updated_at": now,
+                    }
+                )
+        with self.session_manager.with_meta_session() as session:
+            # Environments of the same template may race to fill it in.
+            session.execute(
+                insert(SnapshotMetadata)
+                .values(rows)
+                .on_conflict_do_nothing(
+                    index_elements=["schema_name", "snapshot_suffix", "table_name"],
+                    index_where=SnapshotMetadata.environment_id.is_(None),
+                )
+            )
+        logger.info(
+            "Stored template snapshot checksums for %s (%d tables) in %.2fs",
+            location,
+            len(rows),
+            time.perf_counter() - start,
+        )
+
     def _compute_snapshot_fingerprint(
         self,
         conn,
         snapshot_table: str,
         order_cols: list[str],
+        schema: str | None = None,
     ) -> tuple[int, str]:
         agg_order = ""
         if order_cols:
@@ -341,7 +1268,7 @@ class Differ:
         sql = f"""
             SELECT COUNT(*) AS row_count,
                    md5(COALESCE(string_agg(md5(row_to_json(t)::text), ''{agg_order}), '')) AS checksum
-            FROM {self.q(self.schema)}.{self.q(snapshot_table)} AS t
+            FROM {self.q(schema or self.schema)}.{self.q(snapshot_table)} AS t
         """
         row = conn.execute(text(sql)).one()
         checksum = row.checksum or ""
@@ -352,7 +1279,8 @@ class Differ:
         suffix: str,
         table: str,
         row_count: int,
-        checksum: str,
+        checksum: str | None,
+        change_marker: str | None = None,
     ) -> None:
         with self.session_manager.with_meta_session() as session:
             entry = (
@@ -374,6 +1302,7 @@ class Differ:
                     table_name=table,
                     row_count=row_count,
                     checksum=checksum,
+                    change_marker=change_marker,
                     created_at=now,
                     updated_at=now,
                 )
@@ -381,6 +1310,7 @@ class Differ:
             else:
                 entry.row_count = row_count
                 entry.checksum = checksum
+                entry.change_marker = change_marker
                 entry.updated_at = now
 
     def _delete_snapshot_metadata(self, suffix: str) -> None:
@@ -406,7 +1336,12 @@ class Differ:
                 )
                 .all()
             )
-        return {entry.table_name: entry for entry in entries}
+        metadata = {entry.table_name: entry for entry in entries}
+        if suffix == TEMPLATE_SNAPSHOT:
+            # Shared template checksums, overlaid with the change counters
+            # read when this environment took the template as its snapshot.
+            return {**self._template_metadata(self._template_schema()), **metadata}
+        return metadata
 
     def _tables_to_compare(
         self,
@@ -415,18 +1350,32 @@ class Differ:
     ) -> list[str]:
         before_meta = self._load_metadata_map(before_suffix)
         after_meta = self._load_metadata_map(after_suffix)
-        tables: list[str] = []
+        flagged: set[str] = set()
+        undecided: list[str] = []
         for table in self.tables:
             before_entry = before_meta.get(table)
             after_entry = after_meta.get(table)
             if before_entry is None or after_entry is None:
-                tables.append(table)
+                flagged.add(table)
                 continue
+            changed = _counted_change(
+                before_entry.change_marker, after_entry.change_marker
+            )
+            if changed is None:
+                undecided.append(table)
+            elif changed:
+                flagged.add(table)
+        self._ensure_checksums(before_suffix, before_meta, undecided)
+        self._ensure_checksums(after_suffix, after_meta, undecided)
+        for table in undecided:
+            before_entry = before_meta[table]
+            after_entry = after_meta[table]
             if (
                 before_entry.row_count != after_entry.row_count
                 or before_entry.checksum != after_entry.checksum
             ):
-                tables.append(table)
+                flagged.add(table)
+        tables = [table for table in self.tables if table in flagged]
         logger.info(
             "Diff comparison for %s: %d/%d tables flagged (suffixes %s -> %s)",
             self.schema,
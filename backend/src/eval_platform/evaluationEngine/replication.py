@@ -5,13 +5,14 @@ import logging
 import threading
 import time
 from dataclasses import dataclass
-from typing import Any, Mapping
+from typing import Any, Iterable, Mapping
 from uuid import UUID
 
 import psycopg  # type: ignore[import]
 from psycopg.rows import tuple_row  # type: ignore[import]
 
 from eval_platform.db.schema import ChangeJournal
+from eval_platform.isolationEngine.planner import SNAPSHOT_MARKER
 from eval_platform.isolationEngine.session import SessionManager
 
 logger = logging.getLogger(__name__)
@@ -178,7 +179,8 @@ class GlobalReplicationWorker(threading.Thread):
                 change_schema = change.get("schema", "public")
                 op = change.get("kind")
 
-                if not table_name:
+                # Snapshot copies and change counters are not agent writes.
+                if not table_name or SNAPSHOT_MARKER in table_name:
                     continue
 
                 # Look up which run this schema belongs to
@@ -242,17 +244,17 @@ class GlobalReplicationWorker(threading.Thread):
     ) -> dict[str, Any] | None:
         """
         Zip column names with values, parsing JSON/JSONB values as dicts.
-        
+
         wal2json outputs JSONB columns as quoted strings, not parsed JSON.
         We need to detect JSON/JSONB types and parse them for proper nested access.
         """
         if not names or not values:
             return None
-        
+
         result: dict[str, Any] = {}
         for idx, name in enumerate(names):
             value = values[idx]
-            
+
             # Check if this column is JSON/JSONB and parse it
             if types and idx < len(types):
                 col_type = types[idx].lower()
@@ -262,9 +264,9 @@ class GlobalReplicationWorker(threading.Thread):
                     except json.JSONDecodeError:
                         # Keep as string if not valid JSON
                         pass
-            
+
             result[name] = value
-        
+
         return result
 
     @staticmethod
@@ -512,19 +514,23 @@ class LogicalReplicationService:
 
     def cleanup_environment(self, environment_id: UUID) -> None:
         """Remove all run registrations for an environment."""
-        env_id = UUID(str(environment_id))
+        self.cleanup_environments([environment_id])
+
+    def cleanup_environments(self, environment_ids: Iterable[UUID]) -> None:
+        """Remove all run registrations for several environments at once."""
+        env_ids = {UUID(str(environment_id)) for environment_id in environment_ids}
         with self._lock:
             to_remove = [
                 schema
                 for schema, run in self._active_runs.items()
-                if run.environment_id == env_id
+                if run.environment_id in env_ids
             ]
             for schema in to_remove:
-                del self._active_runs[schema]
+                run = self._active_runs.pop(schema)
                 logger.debug(
                     "Cleaned up replication registration for schema %s (env=%s)",
                     schema,
-                    env_id.hex[:8],
+                    run.environment_id.hex[:8],
                 )
 
     def _ensure_slot(self) -> None:
@@ -0,0 +1,292 @@
+"""
+Compressed binary artifacts of environment schemas.
+
+An artifact holds a schema's DDL, table order and sequence positions in a
+JSON manifest, followed by every table's data as ``COPY ... (FORMAT binary)``
+output. Table data is framed in length-prefixed chunks and the whole file is
+gzip-compressed, so export and restore both stream without holding a table
+in memory.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import struct
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+from .planner import ClonePlan, _quote, _relation_literal
+
+ARTIFACT_MAGIC = b"EVALART\x01"
+ARTIFACT_SUFFIX = ".art.gz"
+# Bytes handed to COPY FROM STDIN per write.
+COPY_CHUNK_SIZE = 1 << 20
+
+_FRAME_HEADER = struct.Struct(">I")
+
+
+@dataclass(frozen=True)
+class ArtifactManifest:
+    source_schema: str
+    ddl: tuple[str, ...]
+    tables: tuple[str, ...]
+    # (table, column, last_value); None for sequences never used
+    sequences: tuple[tuple[str, str, int | None], ...] = ()
+
+    def to_plan(self) -> ClonePlan:
+        """A clone plan rendering this artifact's structure into any schema."""
+        return ClonePlan(
+            template_schema=self.source_schema,
+            fingerprint="",
+            table_order=None,
+            ddl=self.ddl,
+            tables=self.tables,
+            sequence_columns=tuple((tbl, col) for tbl, col, _ in self.sequences),
+        )
+
+    def dumps(self) -> bytes:
+        return json.dumps(
+            {
+                "source_schema": self.source_schema,
+                "ddl": list(self.ddl),
+                "tables": list(self.tables),
+                "sequences": [list(seq) for seq in self.sequences],
+            }
+        ).encode()
+
+    @classmethod
+    def loads(cls, raw: bytes) -> "ArtifactManifest":
+        data = json.loads(raw)
+        return cls(
+            source_schema=data["source_schema"],
+            ddl=tuple(data["ddl"]),
+            tables=tuple(data["tables"]),
+            sequences=tuple(
+                (tbl, col, value) for tbl, col, value in data.get("sequences", ())
+            ),
+        )
+
+
+class ArtifactStore:
+    """Artifacts as files in a local directory, written atomically."""
+
+    def __init__(self, root: str | os.PathLike[str], *, compresslevel: int = 6):
+        self.root = Path(root)
+        self.compresslevel = compresslevel
+
+    def location(self, name: str) -> str:
+        return str(self.root / f"{name}{ARTIFACT_SUFFIX}")
+
+    @contextmanager
+    def open_write(self, location: str) -> Iterator[BinaryIO]:
+        """Write an artifact; it only appears at ``location`` once complete."""
+        path = Path(location)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_name(path.name + ".partial")
+        try:
+            with open(partial, "wb") as raw:
+                with gzip.GzipFile(
+                    fileobj=raw, mode="wb", compresslevel=self.compresslevel
+                ) as compressed:
+                    yield compressed
+                raw.flush()
+                os.fsync(raw.fileno())
+            os.replace(partial, path)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+
+    def open_read(self, location: str) -> BinaryIO:
+        return gzip.open(location, "rb")
+
+    def delete(self, location: str) -> None:
+        Path(location).unlink(missing_ok=True)
+
+
+def write_schema_artifact(
+    conn, plan: ClonePlan, schema: str, fileobj: BinaryIO
+) -> ArtifactManifest:
+    """Export ``schema`` (compiled as ``plan``) into ``fileobj``.
+
+    ``conn`` is a SQLAlchemy connection inside a transaction; callers lock
+    the tables first if the export must be consistent across tables.
+    """
+    manifest = ArtifactManifest(
+        source_schema=schema,
+        ddl=plan.ddl,
+        tables=plan.tables,
+        sequences=_sequence_values(conn, schema, plan.sequence_columns),
+    )
+    header = manifest.dumps()
+    fileobj.write(ARTIFACT_MAGIC + _FRAME_HEADER.pack(len(header)) + header)
+    cursor = conn.connection.cursor()
+    try:
+        for tbl in plan.tables:
+            frames = _FrameWriter(fileobj)
+            _copy_out(
+                cursor,
+                f"COPY {_quote(schema)}.{_quote(tbl)} TO STDOUT (FORMAT binary)",
+                frames,
+            )
+            frames.close()
+    finally:
+        cursor.close()
+    return manifest
+
+
+def read_manifest(fileobj: BinaryIO) -> ArtifactManifest:
+    """Read the manifest, leaving ``fileobj`` positioned at the first table."""
+    magic = fileobj.read(len(ARTIFACT_MAGIC))
+    if magic != ARTIFACT_MAGIC:
+        raise ValueError("not a schema artifact")
+    (length,) = _FRAME_HEADER.unpack(_read_exact(fileobj, _FRAME_HEADER.size))
+    return ArtifactManifest.loads(_read_exact(fileobj, length))
+
+
+def restore_schema_artifact(
+    conn, fileobj: BinaryIO, target_schema: str
+) -> ArtifactManifest:
+    """Create ``target_schema`` from an artifact and load its data.
+
+    Runs inside the caller's transaction, so a failed restore leaves nothing
+    behind.
+    """
+    manifest = read_manifest(fileobj)
+    plan = manifest.to_plan()
+    conn.execution_options(no_parameters=True).exec_driver_sql(
+        plan.render_structure(target_schema)
+    )
+    conn.exec_driver_sql("SET CONSTRAINTS ALL DEFERRED")
+    cursor = conn.connection.cursor()
+    try:
+        for tbl in manifest.tables:
+            _copy_in(
+                cursor,
+                f"COPY {_quote(target_schema)}.{_quote(tbl)} FROM STDIN (FORMAT binary)",
+                _FrameReader(fileobj),
+            )
+    finally:
+        cursor.close()
+    conn.exec_driver_sql("SET CONSTRAINTS ALL IMMEDIATE")
+    restore = _sequence_restore_statement(target_schema, manifest.sequences)
+    if restore:
+        conn.execution_options(no_parameters=True).exec_driver_sql(restore)
+    return manifest
+
+
+def _sequence_values(
+    conn, schema: str, sequence_columns: tuple[tuple[str, str], ...]
+) -> tuple[tuple[str, str, int | None], ...]:
+    if not sequence_columns:
+        return ()
+    calls = []
+    for tbl, column in sequence_columns:
+        column_literal = column.replace("'", "''")
+        calls.append(
+            f"pg_sequence_last_value(pg_get_serial_sequence("
+            f"'{_relation_literal(schema, tbl)}', '{column_literal}')::regclass)"
+        )
+    row = (
+        conn.execution_options(no_parameters=True)
+        .exec_driver_sql("SELECT " + ", ".join(calls))
+        .one()
+    )
+    return tuple(
+        (tbl, column, value) for (tbl, column), value in zip(sequence_columns, row)
+    )
+
+
+def _sequence_restore_statement(
+    schema: str, sequences: tuple[tuple[str, str, int | None], ...]
+) -> str | None:
+    calls = []
+    for tbl, column, value in sequences:
+        column_literal = column.replace("'", "''")
+        target_seq = (
+            f"pg_get_serial_sequence('{_relation_literal(schema, tbl)}', "
+            f"'{column_literal}')"
+        )
+        if value is None:
+            calls.append(f"setval({target_seq}, 1, false)")
+        else:
+            calls.append(f"setval({target_seq}, {int(value)}, true)")
+    if not calls:
+        return None
+    return "SELECT " + ", ".join(calls)
+
+
+def _copy_out(cursor, sql: str, sink) -> None:
+    if hasattr(cursor, "copy_expert"):  # psycopg2
+        cursor.copy_expert(sql, sink)
+        return
+    with cursor.copy(sql) as copy:
+        for block in copy:
+            sink.write(block)
+
+
+def _copy_in(cursor, sql: str, source) -> None:
+    if hasattr(cursor, "copy_expert"):  # psycopg2
+        cursor.copy_expert(sql, source, size=COPY_CHUNK_SIZE)
+        return
+    with cursor.copy(sql) as copy:
+        while block := source.read(COPY_CHUNK_SIZE):
+            copy.write(block)
+
+
+class _FrameWriter:
+    """Writes one table's COPY output as length-prefixed frames."""
+
+    def __init__(self, fileobj: BinaryIO):
+        self._fileobj = fileobj
+
+    def write(self, data) -> int:
+        size = len(data)
+        if size:
+            self._fileobj.write(_FRAME_HEADER.pack(size))
+            self._fileobj.write(data)
+        return size
+
+    def close(self) -> None:
+        self._fileobj.write(_FRAME_HEADER.pack(0))
+
+
+class _FrameReader:
+    """File-like view of one table's frames; reads return b"" at its end."""
+
+    def __init__(self, fileobj: BinaryIO):
+        self._fileobj = fileobj
+        self._remaining = 0
+        self._done = False
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = COPY_CHUNK_SIZE
+        chunks: list[bytes] = []
+        while size > 0 and not self._done:
+            if not self._remaining:
+                (self._remaining,) = _FRAME_HEADER.unpack(
+                    _read_exact(self._fileobj, _FRAME_HEADER.size)
+                )
+                if not self._remaining:
+                    self._done = True
+                    break
+            chunk = _read_exact(self._fileobj, min(size, self._remaining))
+            self._remaining -= len(chunk)
+            size -= len(chunk)
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def readline(self, size: int = -1) -> bytes:
+        # psycopg2's copy_expert only uses readline for text formats.
+        return self.read(size)
+
+
+def _read_exact(fileobj: BinaryIO, size: int) -> bytes:
+    data = fileobj.read(size)
+    if len(data) != size:
+        raise ValueError("truncated schema artifact")
+    return data
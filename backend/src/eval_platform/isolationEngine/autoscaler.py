@@ -0,0 +1,105 @@
+"""
+Demand-driven pool sizing.
+
+Tracks per-template claim and miss rates plus pool build latency with
+exponentially weighted moving averages, and turns them into pool targets
+clamped to a per-template floor and ceiling.
+
+Demand is observed in process memory only, so autoscaling is meant for
+deployments with a single API replica; with several, each replica sees a
+fraction of the claims while sizing the pool they share.
+"""
+
+from __future__ import annotations
+
+import math
+import time
+from dataclasses import dataclass
+from typing import Mapping
+
+
+@dataclass
+class TemplateDemand:
+    claim_rate: float = 0.0  # claims per second, hits and misses
+    miss_rate: float = 0.0  # claims per second that found no ready schema
+    build_seconds: float | None = None
+
+
+class PoolAutoscaler:
+    """
+    Computes pool targets per template from observed demand.
+
+    The target covers the claims expected while a replacement schema is being
+    built (build latency plus one refill interval), scaled by ``headroom`` and
+    further by the observed miss ratio so that a template that keeps missing
+    grows faster than one that is merely busy.
+    """
+
+    def __init__(
+        self,
+        ceilings: Mapping[str, int],
+        floors: Mapping[str, int] | None = None,
+        *,
+        default_floor: int = 1,
+        half_life: float = 300.0,
+        headroom: float = 1.5,
+        refill_interval: float = 10.0,
+        default_build_seconds: float = 5.0,
+    ):
+        self.ceilings = {k: v for k, v in ceilings.items() if v > 0}
+        self.floors = {
+            template: min(max(0, (floors or {}).get(template, default_floor)), ceiling)
+            for template, ceiling in self.ceilings.items()
+        }
+        self.half_life = max(1.0, half_life)
+        self.headroom = headroom
+        self.refill_interval = refill_interval
+        self.default_build_seconds = default_build_seconds
+
+        self._demand: dict[str, TemplateDemand] = {
+            template: TemplateDemand() for template in self.ceilings
+        }
+        self._last_observed = time.monotonic()
+
+    def observe(
+        self, counts: Mapping[str, tuple[int, int]], now: float | None = None
+    ) -> None:
+        """Fold (claims, misses) counted since the last call into the averages."""
+        now = time.monotonic() if now is None else now
+        elapsed = now - self._last_observed
+        if elapsed <= 0:
+            return
+        self._last_observed = now
+        alpha = 1 - math.exp(-elapsed * math.log(2) / self.half_life)
+
+        for template, demand in self._demand.items():
+            claims, misses = counts.get(template, (0, 0))
+            demand.claim_rate += alpha * (claims / elapsed - demand.claim_rate)
+            demand.miss_rate += alpha * (misses / elapsed - demand.miss_rate)
+
+    def record_build(self, template: str, seconds: float) -> None:
+        demand = self._demand.get(template)
+        if demand is None:
+            return
+        if demand.build_seconds is None:
+            demand.build_seconds = seconds
+        else:
+            demand.build_seconds += 0.3 * (seconds - demand.build_seconds)
+
+    def demand(self, template: str) -> TemplateDemand | None:
+        return self._demand.get(template)
+
+    def target(self, template: str) -> int:
+        demand = self._demand[template]
+        build_seconds = demand.build_seconds or self.default_build_seconds
+        lead_time = build_seconds + self.refill_interval
+        miss_ratio = (
+            min(1.0, demand.miss_rate / demand.claim_rate) if demand.claim_rate else 0.0
+        )
+        wanted = math.ceil(
+            demand.claim_rate * lead_time * self.headroom * (1 + miss_ratio)
+        )
+        return max(self.floors[template], min(self.ceilings[template], wanted))
+
+    def targets(self) -> dict[str, int]:
+        return {template: self.target(template) for template in self._demand}
@@ -1,16 +1,36 @@
 import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any
 from .session import SessionManager
-from .environment import EnvironmentHandler
-from .models import EnvironmentResponse
+from .environment import ARTIFACT_TEMPLATE, SCHEMA_TEMPLATE, EnvironmentHandler
+from .models import EnvironmentResponse, EnvironmentSpec
 from .models import TemplateCreateResult
-from eval_platform.db.schema import RunTimeEnvironment
+from eval_platform.db.schema import PRIMARY_SHARD, RunTimeEnvironment
 from uuid import uuid4
 from datetime import datetime, timedelta
 
-from .pool import PoolManager
+from .pool import PoolManager, empty_tier_key
 
 logger = logging.getLogger(__name__)
 
+# Runtime status of an environment whose schema is still being built
+PROVISIONING_STATUS = "initializing"
+
+
+@dataclass(frozen=True)
+class DeferredBuild:
+    """A pool miss accepted by ``provision_environments`` but not yet built."""
+
+    environment_id: str
+    template_schema: str
+    schema: str
+    meta: Any
+    shard: str
+    prebuilt: bool
+
 
 class CoreIsolationEngine:
     def __init__(
@@ -18,10 +38,12 @@ class CoreIsolationEngine:
         sessions: SessionManager,
         environment_handler: EnvironmentHandler,
         pool_manager: PoolManager | None = None,
+        max_parallel_builds: int = 4,
     ):
         self.sessions = sessions
         self.environment_handler = environment_handler
         self.pool_manager = pool_manager or PoolManager(sessions)
+        self.max_parallel_builds = max(1, max_parallel_builds)
 
     def create_environment(
         self,
@@ -31,86 +53,444 @@ class CoreIsolationEngine:
         created_by: str,
         impersonate_user_id: str | None = None,
         impersonate_email: str | None = None,
+        read_only: bool = False,
     ) -> EnvironmentResponse:
-        if not self.environment_handler.schema_exists(template_schema):
-            logger.error(f"Template schema '{template_schema}' does not exist")
-            raise ValueError(f"template schema '{template_schema}' does not exist")
-
-        evn_uuid = uuid4()
-        environment_id = evn_uuid.hex
-        template_meta = self.environment_handler.get_template_metadata(
-            location=template_schema
+        spec = EnvironmentSpec(
+            template_schema=template_schema,
+            ttl_seconds=ttl_seconds,
+            impersonate_user_id=impersonate_user_id,
+            impersonate_email=impersonate_email,
+            read_only=read_only,
+        )
+        [result] = self.create_environments([spec], created_by=created_by)
+        logger.info(
+            "Created environment %s from template %s for user %s (pooled=%s)",
+            result.environment_id,
+            template_schema,
+            created_by,
+            result.pooled,
         )
-        table_order = template_meta.table_order if template_meta else None
-        template_uuid = str(template_meta.id) if template_meta else None
+        return result
 
-        import time
+    def create_environments(
+        self, specs: list[EnvironmentSpec], *, created_by: str
+    ) -> list[EnvironmentResponse]:
+        """Create several environments with one pool claim and one meta write.
 
-        t0 = time.perf_counter()
-        pool_entry = self.pool_manager.claim_ready_schema(
-            template_schema=template_schema, requested_by=created_by
+        Pool misses are built in parallel (bounded by ``max_parallel_builds``)
+        on the least-loaded shards holding their template. Read-only specs are
+        bound to their template schema without claiming anything. Results are
+        returned in the order of ``specs``.
+        """
+        results, _ = self._create_environments(
+            specs, created_by=created_by, defer_builds=False
         )
+        return results
 
-        reused_schema = pool_entry is not None
-
-        if reused_schema:
-            environment_schema = pool_entry.schema_name
-            if pool_entry.template_id and template_uuid is None:
-                template_uuid = str(pool_entry.template_id)
-            logger.info(f"Claimed pooled schema in {time.perf_counter() - t0:.2f}s")
-        else:
-            environment_schema = f"state_{environment_id}"
-            logger.warning(f"Pool miss for {template_schema}, building from scratch...")
+    def provision_environments(
+        self, specs: list[EnvironmentSpec], *, created_by: str
+    ) -> tuple[list[EnvironmentResponse], list[DeferredBuild]]:
+        """Like ``create_environments``, but without building pool misses.
 
-            t1 = time.perf_counter()
-            self.environment_handler.create_schema(environment_schema)
-            logger.info(f"create_schema took {time.perf_counter() - t1:.2f}s")
+        Missed environments are recorded as provisioning and returned with a
+        ``DeferredBuild`` each; the caller runs ``complete_deferred_build`` for
+        them, typically in the background.
+        """
+        return self._create_environments(
+            specs, created_by=created_by, defer_builds=True
+        )
 
-            t2 = time.perf_counter()
-            self.environment_handler.migrate_schema(template_schema, environment_schema)
-            logger.info(f"migrate_schema took {time.perf_counter() - t2:.2f}s")
+    def complete_deferred_build(self, build: DeferredBuild) -> None:
+        """Build a provisioning environment's schema and mark it ready or failed."""
+        try:
+            self._build_unpooled(
+                build.template_schema,
+                build.schema,
+                build.meta,
+                build.shard,
+                build.prebuilt,
+            )
+        except Exception:
+            if not build.prebuilt:
+                try:
+                    self.environment_handler.drop_schema(build.schema, build.shard)
+                except Exception as exc:
+                    logger.warning("Failed to drop schema %s: %s", build.schema, exc)
+            self.environment_handler.finish_provisioning(build.environment_id, "failed")
+            raise
+        if not self.environment_handler.finish_provisioning(
+            build.environment_id, "ready"
+        ):
+            # Deleted or expired while building; the schema goes back to the pool.
+            self.pool_manager.release_in_use(build.schema, recycle=True)
 
-            t3 = time.perf_counter()
-            self.environment_handler.seed_data_from_template(
-                template_schema, environment_schema, tables_order=table_order
+    def _create_environments(
+        self, specs: list[EnvironmentSpec], *, created_by: str, defer_builds: bool
+    ) -> tuple[list[EnvironmentResponse], list[DeferredBuild]]:
+        templates = {spec.template_schema for spec in specs}
+        template_meta = {
+            template_schema: self.environment_handler.get_template_metadata(
+                location=template_schema
             )
-            logger.info(f"seed_data took {time.perf_counter() - t3:.2f}s")
+            for template_schema in templates
+        }
+        template_shards: dict[str, list[str]] = {}
+        for template_schema in templates:
+            shards = self.environment_handler.shards_for_template(
+                template_schema, _template_kind(template_meta[template_schema])
+            )
+            if not shards:
+                logger.error(f"Template schema '{template_schema}' does not exist")
+                raise ValueError(f"template schema '{template_schema}' does not exist")
+            template_shards[template_schema] = shards
+        for spec in specs:
+            if spec.read_only and (
+                _template_kind(template_meta[spec.template_schema]) != SCHEMA_TEMPLATE
+            ):
+                raise ValueError("read-only environments need a schema template")
+
+        counts: dict[str, int] = {}
+        for spec in specs:
+            if not spec.read_only:
+                counts[spec.template_schema] = counts.get(spec.template_schema, 0) + 1
+        claimed = (
+            self.pool_manager.claim_ready_schemas(counts, requested_by=created_by)
+            if counts
+            else {}
+        )
+
+        # (environment_id, schema, template_id, pooled, shard) per spec
+        placements: list[tuple[str, str, str | None, bool, str]] = []
+        # (placement index, template_schema, template metadata) per pool miss
+        misses: list[tuple[int, str, Any]] = []
+        for spec in specs:
+            environment_id = uuid4().hex
+            meta = template_meta[spec.template_schema]
+            template_id = str(meta.id) if meta else None
+            available = claimed.get(spec.template_schema)
+            if spec.read_only:
+                shards = template_shards[spec.template_schema]
+                shard = PRIMARY_SHARD if PRIMARY_SHARD in shards else shards[0]
+                placements.append(
+                    (environment_id, spec.template_schema, template_id, False, shard)
+                )
+            elif available:
+                schema, pool_template_id, shard = available.pop()
+                if template_id is None and pool_template_id:
+                    template_id = str(pool_template_id)
+                placements.append((environment_id, schema, template_id, True, shard))
+            else:
+                misses.append((len(placements), spec.template_schema, meta))
+                placements.append(
+                    (
+                        environment_id,
+                        f"state_{environment_id}",
+                        template_id,
+                        False,
+                        PRIMARY_SHARD,
+                    )
+                )
+
+        deferred: list[DeferredBuild] = []
+        try:
+            if misses:
+                empty_schemas = self._claim_empty_schemas(
+                    [(template_schema, meta) for _, template_schema, meta in misses],
+                    template_shards,
+                    requested_by=created_by,
+                )
+                new_shards = self._place_misses(
+                    [
+                        template_schema
+                        for (_, template_schema, _), empty in zip(misses, empty_schemas)
+                        if empty is None
+                    ],
+                    template_shards,
+                )
+                builds = []
+                for (index, template_schema, meta), empty in zip(misses, empty_schemas):
+                    environment_id, schema, template_id, _, _ = placements[index]
+                    if empty:
+                        schema, shard = empty
+                    else:
+                        shard = new_shards.pop(0)
+                    placements[index] = (
+                        environment_id,
+                        schema,
+                        template_id,
+                        False,
+                        shard,
+                    )
+                    builds.append(
+                        (template_schema, schema, meta, shard, empty is not None)
+                    )
+                logger.warning(
+                    "Pool miss for %d of %d environments (%d empty schemas claimed), "
+                    "%s the rest from scratch...",
+                    len(misses),
+                    len(specs),
+                    sum(1 for empty in empty_schemas if empty),
+                    "deferring" if defer_builds else "building",
+                )
+                if defer_builds:
+                    deferred = [
+                        DeferredBuild(placements[index][0], *build)
+                        for (index, _, _), build in zip(misses, builds)
+                    ]
+                else:
+                    with ThreadPoolExecutor(
+                        max_workers=min(self.max_parallel_builds, len(builds))
+                    ) as executor:
+                        list(
+                            executor.map(
+                                lambda args: self._build_unpooled(*args), builds
+                            )
+                        )
+
+            now = datetime.now()
+            provisioning = {build.environment_id for build in deferred}
+            results: list[EnvironmentResponse] = []
+            rows = []
+            for spec, (environment_id, schema, template_id, pooled, shard) in zip(
+                specs, placements
+            ):
+                expires_at = now + timedelta(seconds=spec.ttl_seconds)
+                status = (
+                    PROVISIONING_STATUS if environment_id in provisioning else "ready"
+                )
+                meta = template_meta[spec.template_schema]
+                rows.append(
+                    {
+                        "environment_id": environment_id,
+                        "schema": schema,
+                        "expires_at": expires_at,
+                        "last_used_at": now,
+                        "created_by": created_by,
+                        "template_id": template_id,
+                        "impersonate_user_id": spec.impersonate_user_id,
+                        "impersonate_email": spec.impersonate_email,
+                        "read_only": spec.read_only,
+                        "shard": shard,
+                        "status": status,
+                        # Clones of a schema template start out identical to it.
+                        "pristine": not spec.read_only
+                        and meta is not None
+                        and meta.kind == SCHEMA_TEMPLATE,
+                    }
+                )
+                results.append(
+                    EnvironmentResponse(
+                        environment_id=environment_id,
+                        schema_name=schema,
+                        expires_at=expires_at,
+                        impersonate_user_id=spec.impersonate_user_id,
+                        impersonate_email=spec.impersonate_email,
+                        pooled=pooled,
+                        read_only=spec.read_only,
+                        status="provisioning"
+                        if status == PROVISIONING_STATUS
+                        else "ready",
+                    )
+                )
+            self.environment_handler.set_runtime_environments(rows)
+        except Exception:
+            # Hand everything claimed or built for this batch back to the pool
+            for spec, (_, schema, _, _, _) in zip(specs, placements):
+                if spec.read_only:
+                    continue
+                try:
+                    self.pool_manager.release_in_use(schema, recycle=True)
+                except Exception as exc:
+                    logger.warning("Failed to release schema %s: %s", schema, exc)
+            raise
+
+        logger.info(
+            "Created %d environments for user %s (pooled=%d)",
+            len(results),
+            created_by,
+            sum(1 for r in results if r.pooled),
+        )
+        return results, deferred
+
+    def _claim_empty_schemas(
+        self,
+        misses: list[tuple[str, Any]],
+        template_shards: dict[str, list[str]],
+        *,
+        requested_by: str,
+    ) -> list[tuple[str, str] | None]:
+        """Claim an empty schema of the right service and shape per (template, meta).
 
-            self.pool_manager.register_entry(
-                schema_name=environment_schema,
-                template_schema=template_schema,
-                template_id=template_meta.id if template_meta else None,
-                status="in_use",
+        Returns the claimed (schema name, shard), or None where the empty tier
+        has nothing to offer, in the order of ``misses``. Empty schemas on a
+        shard without the template cannot be seeded and go back to the pool.
+        """
+        keys: list[str | None] = []
+        for template_schema, meta in misses:
+            # Empty schemas are seeded from a live template schema.
+            if meta is None or meta.kind != SCHEMA_TEMPLATE:
+                keys.append(None)
+                continue
+            shape = self.environment_handler.empty_schema_shape(
+                template_schema,
+                meta.table_order,
+                shard=template_shards[template_schema][0],
             )
-            logger.info(f"Total non-pooled build: {time.perf_counter() - t0:.2f}s")
-
-        expires_at = datetime.now() + timedelta(seconds=ttl_seconds)
-        self.environment_handler.set_runtime_environment(
-            environment_id=environment_id,
-            schema=environment_schema,
-            expires_at=expires_at,
-            last_used_at=datetime.now(),
-            created_by=created_by,
-            template_id=template_uuid,
-            impersonate_user_id=impersonate_user_id,
-            impersonate_email=impersonate_email,
+            keys.append(empty_tier_key(meta.service, shape))
+        counts = Counter(key for key in keys if key)
+        if not counts:
+            return [None] * len(misses)
+        claimed = self.pool_manager.claim_ready_schemas(
+            counts, requested_by=requested_by
         )
+        result: list[tuple[str, str] | None] = []
+        for (template_schema, _), key in zip(misses, keys):
+            candidates = claimed.get(key, []) if key else []
+            usable = next(
+                (c for c in candidates if c[2] in template_shards[template_schema]),
+                None,
+            )
+            if usable is None:
+                result.append(None)
+                continue
+            candidates.remove(usable)
+            result.append((usable[0], usable[2]))
+        for candidates in claimed.values():
+            for schema, _, _ in candidates:
+                self.pool_manager.mark_ready(schema)
+        return result
 
+    def _place_misses(
+        self, templates: list[str], template_shards: dict[str, list[str]]
+    ) -> list[str]:
+        """Least-loaded shard per template in ``templates``, in order."""
+        placed: dict[str, list[str]] = {
+            template_schema: self.pool_manager.place_schemas(
+                template_shards[template_schema], templates.count(template_schema)
+            )
+            for template_schema in set(templates)
+        }
+        return [placed[template_schema].pop(0) for template_schema in templates]
+
+    def _build_unpooled(
+        self,
+        template_schema: str,
+        schema: str,
+        meta,
+        shard: str = PRIMARY_SHARD,
+        prebuilt: bool = False,
+    ) -> None:
+        """Build ``schema`` on ``shard`` from the template, or only seed it if ``prebuilt``."""
+        tables_order = meta.table_order if meta else None
+        t0 = time.perf_counter()
+        if prebuilt:
+            try:
+                self.environment_handler.populate_schema_from_template(
+                    template_schema, schema, tables_order=tables_order, shard=shard
+                )
+            except Exception:
+                self.pool_manager.release_in_use(schema, recycle=True)
+                raise
+        else:
+            self.environment_handler.build_environment_schema(
+                template_schema,
+                schema,
+                kind=_template_kind(meta),
+                tables_order=tables_order,
+                shard=shard,
+            )
         logger.info(
-            "Created environment %s from template %s for user %s (pooled=%s)",
-            environment_id,
+            "%s %s from %s in %.2fs",
+            "Seeded" if prebuilt else "Built",
+            schema,
             template_schema,
-            created_by,
-            reused_schema,
+            time.perf_counter() - t0,
+        )
+        self.pool_manager.register_entry(
+            schema_name=schema,
+            template_schema=template_schema,
+            template_id=meta.id if meta else None,
+            status="in_use",
+            shard=shard,
         )
 
-        return EnvironmentResponse(
-            environment_id=environment_id,
-            schema_name=environment_schema,
-            expires_at=expires_at,
-            impersonate_user_id=impersonate_user_id,
-            impersonate_email=impersonate_email,
+    def fork_environment(
+        self,
+        environment_id: str,
+        *,
+        count: int,
+        ttl_seconds: int,
+        created_by: str,
+    ) -> list[EnvironmentResponse]:
+        """Copy a live environment's current state into ``count`` new environments.
+
+        Forks inherit the source's template and impersonation settings and get
+        their own TTL. They are registered as in-use pool entries so cleanup
+        recycles them like any other environment.
+        """
+        if count < 1:
+            raise ValueError("count must be at least 1")
+        rte = self.environment_handler.require_environment(environment_id)
+        if rte.status != "ready":
+            raise ValueError(f"environment is {rte.status}")
+
+        template_meta = (
+            self.environment_handler.get_template_metadata(template_id=rte.template_id)
+            if rte.template_id
+            else None
         )
+        environment_ids = [uuid4().hex for _ in range(count)]
+        schemas = [f"state_{environment_id}" for environment_id in environment_ids]
+
+        t0 = time.perf_counter()
+        # Forks stay on the source's shard; copies cannot cross databases.
+        self.environment_handler.fork_schema(rte.schema, schemas, shard=rte.shard)
+        logger.info(
+            f"Forked {rte.schema} into {count} schemas in {time.perf_counter() - t0:.2f}s"
+        )
+        # Writers clear pristine before writing, so re-reading it after the
+        # copy tells whether any write made it into the forks.
+        pristine = self.environment_handler.require_environment(environment_id).pristine
+
+        if template_meta:
+            for schema in schemas:
+                self.pool_manager.register_entry(
+                    schema_name=schema,
+                    template_schema=template_meta.location,
+                    template_id=template_meta.id,
+                    status="in_use",
+                    shard=rte.shard,
+                )
+
+        now = datetime.now()
+        expires_at = now + timedelta(seconds=ttl_seconds)
+        self.environment_handler.set_runtime_environments(
+            [
+                {
+                    "environment_id": fork_id,
+                    "schema": schema,
+                    "expires_at": expires_at,
+                    "last_used_at": now,
+                    "created_by": created_by,
+                    "template_id": str(rte.template_id) if rte.template_id else None,
+                    "impersonate_user_id": rte.impersonate_user_id,
+                    "impersonate_email": rte.impersonate_email,
+                    "shard": rte.shard,
+                    "pristine": pristine,
+                }
+                for fork_id, schema in zip(environment_ids, schemas)
+            ]
+        )
+        return [
+            EnvironmentResponse(
+                environment_id=fork_id,
+                schema_name=schema,
+                expires_at=expires_at,
+                impersonate_user_id=rte.impersonate_user_id,
+                impersonate_email=rte.impersonate_email,
+            )
+            for fork_id, schema in zip(environment_ids, schemas)
+        ]
 
     def create_template_from_environment(
         self,
@@ -122,18 +502,37 @@ class CoreIsolationEngine:
         visibility: str = "private",
         owner_id: str | None = None,
         version: str = "v1",
+        kind: str = SCHEMA_TEMPLATE,
     ) -> TemplateCreateResult:
+        """Register an environment's current state as a template.
+
+        Schema templates are cloned into a live schema; artifact templates are
+        exported to the artifact store and never occupy the catalog.
+        """
         rte = self.environment_handler.require_environment(environment_id)
         source_schema = rte.schema
 
         base = f"{service}_{name}".lower().replace(" ", "_")
-        target_schema = base
-        if self.environment_handler.schema_exists(target_schema):
-            target_schema = f"{base}_{uuid4().hex[:8]}"
+        if kind == ARTIFACT_TEMPLATE:
+            store = self.environment_handler.artifact_store
+            if store is None:
+                raise ValueError("artifact templates need an artifact store")
+            target_schema = store.location(f"template_{base}_{uuid4().hex[:8]}")
+            self.environment_handler.export_artifact_template(
+                source_schema, target_schema, rte.shard
+            )
+        elif kind == SCHEMA_TEMPLATE:
+            target_schema = base
+            # The template is created on the environment's shard, which is
+            # then the only shard its environments are placed on.
+            if self.environment_handler.schema_exists(target_schema, rte.shard):
+                target_schema = f"{base}_{uuid4().hex[:8]}"
 
-        self.environment_handler.clone_schema_from_environment(
-            source_schema, target_schema
-        )
+            self.environment_handler.clone_schema_from_environment(
+                source_schema, target_schema, rte.shard
+            )
+        else:
+            raise ValueError(f"templates of kind '{kind}' are not supported")
 
         table_order = None
         if rte.template_id:
@@ -150,7 +549,7 @@ class CoreIsolationEngine:
             visibility=visibility,
             description=description,
             owner_id=owner_id,
-            kind="schema",
+            kind=kind,
             location=target_schema,
             table_order=table_order,
         )
@@ -162,6 +561,21 @@ class CoreIsolationEngine:
             name=name,
         )
 
+    def restore_environment(self, environment_id: str) -> bool:
+        """Bring a hibernated environment's schema back from its artifact.
+
+        Returns False if it was not hibernated, e.g. because a concurrent
+        request restored it first.
+        """
+        t0 = time.perf_counter()
+        restored = self.environment_handler.restore_environment(environment_id)
+        if restored:
+            logger.info(
+                f"Restored hibernated environment {environment_id} "
+                f"in {time.perf_counter() - t0:.2f}s"
+            )
+        return restored
+
     def get_schema_for_environment(self, environment_id: str) -> str:
         with self.sessions.with_meta_session() as session:
             env = (
@@ -172,3 +586,8 @@ class CoreIsolationEngine:
             if env is None:
                 raise ValueError("environment not found")
             return env.schema
+
+
+def _template_kind(meta) -> str:
+    """Kind of a template; unregistered template schemas are schema templates."""
+    return meta.kind if meta is not None else SCHEMA_TEMPLATE
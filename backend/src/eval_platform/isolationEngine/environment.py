@@ -1,23 +1,56 @@
 import logging
 from datetime import datetime
-from typing import Iterable
+from typing import Any, Iterable
 from uuid import UUID, uuid4
 
-from sqlalchemy import MetaData, text
-
-from eval_platform.db.schema import RunTimeEnvironment, TemplateEnvironment
-
+from sqlalchemy import MetaData, delete, select, text, update
+
+from eval_platform.db.schema import (
+    PRIMARY_SHARD,
+    RunTimeEnvironment,
+    SnapshotMetadata,
+    TemplateEnvironment,
+)
+
+from .artifact import (
+    ArtifactManifest,
+    ArtifactStore,
+    restore_schema_artifact,
+    write_schema_artifact,
+)
+from .planner import (
+    CHANGE_CAPTURE_TRIGGER,
+    CHANGE_COUNTER_TRIGGER,
+    SNAPSHOT_MARKER,
+    ClonePlanner,
+    fetch_checksums,
+)
 from .session import SessionManager
 
 logger = logging.getLogger(__name__)
 
+# Expired schemas are renamed into this namespace and dropped later in batches.
+TRASH_SCHEMA_PREFIX = "trash_"
+# Runtime status of an environment whose schema lives in an artifact
+HIBERNATED_STATUS = "hibernated"
+# Template kinds environments can be built from
+SCHEMA_TEMPLATE = "schema"
+ARTIFACT_TEMPLATE = "artifact"
+
 
 class EnvironmentHandler:
-    def __init__(self, session_manager: SessionManager):
+    def __init__(
+        self,
+        session_manager: SessionManager,
+        clone_planner: ClonePlanner | None = None,
+        artifact_store: ArtifactStore | None = None,
+    ):
         self.session_manager = session_manager
+        self.clone_planner = clone_planner or ClonePlanner(session_manager)
+        self.artifact_store = artifact_store
 
-    def schema_exists(self, schema: str) -> bool:
-        with self.session_manager.base_engine.begin() as conn:
+    def schema_exists(self, schema: str, shard: str = PRIMARY_SHARD) -> bool:
+        with self.session_manager.engine_for_shard(shard).begin() as conn:
             result = conn.execute(
                 text(
                     "SELECT EXISTS(SELECT 1 FROM information_schema.schemata WHERE schema_name = :schema)"
@@ -26,17 +59,44 @@ class EnvironmentHandler:
             ).scalar()
             return bool(result)
 
-    def create_schema(self, schema: str) -> None:
+    def shards_with_schema(self, schema: str) -> list[str]:
+        """Data shards holding ``schema``, e.g. the shards a template is seeded in."""
+        shards = []
+        for shard, engine in self.session_manager.shard_engines.items():
+            with engine.connect() as conn:
+                found = conn.execute(
+                    text("SELECT 1 FROM pg_namespace WHERE nspname = :schema"),
+                    {"schema": schema},
+                ).first()
+            if found:
+                shards.append(shard)
+        return shards
+
+    def shards_for_template(
+        self, location: str, kind: str = SCHEMA_TEMPLATE
+    ) -> list[str]:
+        """Data shards environments of a template can be built on.
+
+        Artifact templates live outside the databases, so every shard can
+        restore them.
+        """
+        if kind == ARTIFACT_TEMPLATE:
+            return self.session_manager.shards
+        return self.shards_with_schema(location)
+
+    def create_schema(self, schema: str, shard: str = PRIMARY_SHARD) -> None:
         try:
-            with self.session_manager.base_engine.begin() as conn:
+            with self.session_manager.engine_for_shard(shard).begin() as conn:
                 conn.execute(text(f'CREATE SCHEMA "{schema}"'))
             logger.debug(f"Created schema {schema}")
         except Exception as e:
             logger.error(f"Failed to create schema {schema}: {e}")
             raise
 
-    def migrate_schema(self, template_schema: str, target_schema: str) -> None:
-        engine = self.session_manager.base_engine
+    def migrate_schema(
+        self, template_schema: str, target_schema: str, shard: str = PRIMARY_SHARD
+    ) -> None:
+        engine = self.session_manager.engine_for_shard(shard)
         meta = MetaData()
         meta.reflect(bind=engine, schema=template_schema)
         translated = engine.execution_options(
@@ -44,7 +104,7 @@ class EnvironmentHandler:
         )
         meta.create_all(translated)
 
-        self._set_replica_identity(target_schema)
+        self._set_replica_identity(target_schema, shard)
 
     def _list_tables(self, conn, schema: str) -> list[str]:
         rows = conn.execute(
@@ -60,9 +120,9 @@ class EnvironmentHandler:
         ).fetchall()
         return [r[0] for r in rows]
 
-    def _set_replica_identity(self, schema: str) -> None:
+    def _set_replica_identity(self, schema: str, shard: str = PRIMARY_SHARD) -> None:
         """Set REPLICA IDENTITY FULL for all tables in schema to enable logical replication."""
-        with self.session_manager.base_engine.begin() as conn:
+        with self.session_manager.engine_for_shard(shard).begin() as conn:
             tables = self._list_tables(conn, schema)
             if not tables:
                 logger.warning(
@@ -170,8 +230,9 @@ class EnvironmentHandler:
         template_schema: str,
         target_schema: str,
         tables_order: list[str] | None = None,
+        shard: str = PRIMARY_SHARD,
     ) -> None:
-        engine = self.session_manager.base_engine
+        engine = self.session_manager.engine_for_shard(shard)
         with engine.begin() as conn:
             meta = MetaData()
             meta.reflect(bind=engine, schema=template_schema)
@@ -212,6 +273,228 @@ class EnvironmentHandler:
 
             self._reset_sequences(conn, target_schema, ordered_tables)
 
+    def build_schema_from_template(
+        self,
+        template_schema: str,
+        target_schema: str,
+        tables_order: list[str] | None = None,
+        shard: str = PRIMARY_SHARD,
+    ) -> None:
+        """Create, migrate and seed ``target_schema`` in one batch using a cached plan."""
+        plan = self.clone_planner.get_plan(template_schema, tables_order, shard=shard)
+        try:
+            with self.session_manager.engine_for_shard(shard).begin() as conn:
+                conn.execution_options(no_parameters=True).exec_driver_sql(
+                    plan.render(target_schema)
+                )
+            logger.debug(f"Built schema {target_schema} from {template_schema}")
+        except Exception as e:
+            logger.error(
+                f"Failed to build schema {target_schema} from {template_schema}: {e}"
+            )
+            raise
+
+    def build_schema_from_artifact(
+        self, location: str, target_schema: str, shard: str = PRIMARY_SHARD
+    ) -> None:
+        """Create ``target_schema`` from an artifact template.
+
+        The manifest's DDL is applied and each table streamed in with
+        ``COPY ... FROM STDIN``, all in one transaction.
+        """
+        store = self._require_artifact_store()
+        try:
+            with (
+                self.session_manager.engine_for_shard(shard).begin() as conn,
+                store.open_read(location) as fileobj,
+            ):
+                restore_schema_artifact(conn, fileobj, target_schema)
+            logger.debug(f"Built schema {target_schema} from artifact {location}")
+        except Exception as e:
+            logger.error(
+                f"Failed to build schema {target_schema} from artifact {location}: {e}"
+            )
+            raise
+
+    def build_environment_schema(
+        self,
+        template_location: str,
+        target_schema: str,
+        *,
+        kind: str = SCHEMA_TEMPLATE,
+        tables_order: list[str] | None = None,
+        shard: str = PRIMARY_SHARD,
+    ) -> None:
+        """Build ``target_schema`` from a template of any supported kind."""
+        if kind == ARTIFACT_TEMPLATE:
+            self.build_schema_from_artifact(template_location, target_schema, shard)
+        elif kind == SCHEMA_TEMPLATE:
+            self.build_schema_from_template(
+                template_location, target_schema, tables_order, shard
+            )
+        else:
+            raise ValueError(f"templates of kind '{kind}' are not supported")
+
+    def export_artifact_template(
+        self, source_schema: str, location: str, shard: str = PRIMARY_SHARD
+    ) -> ArtifactManifest:
+        """Write ``source_schema`` to ``location`` as an artifact template.
+
+        The export runs in one REPEATABLE READ transaction, so all tables come
+        from the same snapshot while the source stays writable.
+        """
+        store = self._require_artifact_store()
+        plan = self.clone_planner.compile_uncached(source_schema, shard=shard)
+        with self.session_manager.engine_for_shard(shard).connect() as conn:
+            conn = conn.execution_options(isolation_level="REPEATABLE READ")
+            with conn.begin(), store.open_write(location) as fileobj:
+                manifest = write_schema_artifact(conn, plan, source_schema, fileobj)
+        logger.info(
+            f"Exported {source_schema} to artifact {location} "
+            f"({len(manifest.tables)} tables)"
+        )
+        return manifest
+
+    def build_empty_schema(
+        self,
+        template_schema: str,
+        target_schema: str,
+        tables_order: list[str] | None = None,
+        shard: str = PRIMARY_SHARD,
+    ) -> str:
+        """Create and migrate ``target_schema`` without data; returns the plan shape."""
+        plan = self.clone_planner.get_plan(template_schema, tables_order, shard=shard)
+        try:
+            with self.session_manager.engine_for_shard(shard).begin() as conn:
+                conn.execution_options(no_parameters=True).exec_driver_sql(
+                    plan.render_structure(target_schema)
+                )
+            logger.debug(f"Built empty schema {target_schema} from {template_schema}")
+        except Exception as e:
+            logger.error(
+                f"Failed to build empty schema {target_schema} from {template_schema}: {e}"
+            )
+            raise
+        return plan.shape
+
+    def populate_schema_from_template(
+        self,
+        template_schema: str,
+        target_schema: str,
+        tables_order: list[str] | None = None,
+        shard: str = PRIMARY_SHARD,
+    ) -> None:
+        """Copy template data into an empty schema built by ``build_empty_schema``."""
+        plan = self.clone_planner.get_plan(template_schema, tables_order, shard=shard)
+        try:
+            with self.session_manager.engine_for_shard(shard).begin() as conn:
+                conn.execution_options(no_parameters=True).exec_driver_sql(
+                    plan.render_data(target_schema)
+                )
+            logger.debug(f"Populated schema {target_schema} from {template_schema}")
+        except Exception as e:
+            logger.error(
+                f"Failed to populate schema {target_schema} from {template_schema}: {e}"
+            )
+            raise
+
+    def empty_schema_shape(
+        self,
+        template_schema: str,
+        tables_order: list[str] | None = None,
+        shard: str = PRIMARY_SHARD,
+    ) -> str:
+        return self.clone_planner.get_plan(
+            template_schema, tables_order, shard=shard
+        ).shape
+
+    def fork_schema(
+        self,
+        source_schema: str,
+        target_schemas: list[str],
+        shard: str = PRIMARY_SHARD,
+    ) -> None:
+        """Copy a live schema's current state into several new schemas.
+
+        All copies are made in one REPEATABLE READ transaction so every fork
+        sees the same consistent snapshot of the source, and sequences carry
+        on from the source's current values.
+        """
+        plan = self.clone_planner.compile_uncached(source_schema, shard=shard)
+        batch = "\n".join(
+            plan.render(target, copy_sequences=True) for target in target_schemas
+        )
+        try:
+            with self.session_manager.engine_for_shard(shard).connect() as conn:
+                conn = conn.execution_options(
+                    isolation_level="REPEATABLE READ", no_parameters=True
+                )
+                with conn.begin():
+                    conn.exec_driver_sql(batch)
+            logger.debug(
+                f"Forked schema {source_schema} into {len(target_schemas)} schemas"
+            )
+        except Exception as e:
+            logger.error(f"Failed to fork schema {source_schema}: {e}")
+            raise
+
+    def reset_schema_from_template(
+        self,
+        template_schema: str,
+        target_schema: str,
+        tables_order: list[str] | None = None,
+        shard: str = PRIMARY_SHARD,
+    ) -> list[str] | None:
+        """Restore a previously built schema to template state in place.
+
+        Only tables whose checksum differs from the template (plus the tables
+        referencing them) are truncated and re-copied; sequences are reset for
+        all tables since nextval is not rolled back with failed writes.
+        Returns the rewritten tables, or None when the schema's table set no
+        longer matches the template and it must be rebuilt instead.
+        """
+        plan = self.clone_planner.get_plan(template_schema, tables_order, shard=shard)
+        expected = self.clone_planner.template_checksums(plan, shard=shard)
+        target = f'"{target_schema}"'
+
+        with self.session_manager.engine_for_shard(shard).begin() as conn:
+            existing = self._list_tables(conn, target_schema)
+            leftovers = [t for t in existing if SNAPSHOT_MARKER in t]
+            if set(existing) - set(leftovers) != set(plan.tables):
+                return None
+
+            current = fetch_checksums(conn, plan, target_schema)
+            changed = [t for t in plan.tables if current.get(t) != expected.get(t)]
+            rewrite = plan.with_dependents(changed)
+
+            # Change counter and capture triggers go with their functions,
+            # before the tables they write to.
+            statements = [
+                f'DROP FUNCTION IF EXISTS {target}."{function}"() CASCADE'
+                for function in (CHANGE_COUNTER_TRIGGER, CHANGE_CAPTURE_TRIGGER)
+            ]
+            statements.extend(f'DROP TABLE IF EXISTS {target}."{t}"' for t in leftovers)
+            if rewrite:
+                statements.append(
+                    "TRUNCATE " + ", ".join(f'{target}."{t}"' for t in rewrite)
+                )
+                statements.extend(
+                    plan.copy_statements(f'"{template_schema}"', target, rewrite)
+                )
+            reset = plan.sequence_reset_statement(target_schema, plan.tables)
+            if reset:
+                statements.append(reset)
+            if statements:
+                conn.execution_options(no_parameters=True).exec_driver_sql(
+                    ";\n".join(statements) + ";"
+                )
+
+        logger.debug(
+            f"Reset schema {target_schema} from {template_schema}: "
+            f"{len(rewrite)}/{len(plan.tables)} tables rewritten"
+        )
+        return rewrite
+
     def set_runtime_environment(
         self,
         environment_id: str,
@@ -223,46 +506,111 @@ class EnvironmentHandler:
         template_id: str | None = None,
         impersonate_user_id: str | None = None,
         impersonate_email: str | None = None,
+        shard: str = PRIMARY_SHARD,
     ) -> None:
-        env_uuid = self._to_uuid(environment_id)
-        template_uuid = self._to_uuid(template_id) if template_id else None
+        self.set_runtime_environments(
+            [
+                {
+                    "environment_id": environment_id,
+                    "schema": schema,
+                    "expires_at": expires_at,
+                    "last_used_at": last_used_at,
+                    "created_by": created_by,
+                    "template_id": template_id,
+                    "impersonate_user_id": impersonate_user_id,
+                    "impersonate_email": impersonate_email,
+                    "shard": shard,
+                }
+            ]
+        )
+
+    def set_runtime_environments(self, environments: list[dict[str, Any]]) -> None:
+        """Write several runtime environments in one meta transaction.
+
+        Each item takes the same fields as ``set_runtime_environment``.
+        """
+        if not environments:
+            return
+        schemas = [env["schema"] for env in environments if not env.get("read_only")]
         with self.session_manager.with_meta_session() as s:
-            existing = (
-                s.query(RunTimeEnvironment)
-                .filter(RunTimeEnvironment.schema == schema)
-                .one_or_none()
-            )
-            if existing and existing.id == env_uuid:
-                existing.status = "ready"
-                existing.expires_at = expires_at
-                existing.last_used_at = last_used_at
-                existing.created_by = created_by
-                existing.updated_at = datetime.now()
-                existing.template_id = template_uuid
-                existing.impersonate_user_id = impersonate_user_id
-                existing.impersonate_email = impersonate_email
-                return
-            if existing and existing.id != env_uuid:
-                archive_suffix = uuid4().hex[:6]
-                existing.schema = f"{existing.schema}_archived_{archive_suffix}"
-                existing.status = "deleted"
-                existing.updated_at = datetime.now()
-                existing.expires_at = datetime.now()
-            rte = RunTimeEnvironment(
-                id=env_uuid,
-                schema=schema,
-                status="ready",
-                expires_at=expires_at,
-                last_used_at=last_used_at,
-                created_by=created_by,
+            existing_by_schema = (
+                {
+                    rte.schema: rte
+                    for rte in s.query(RunTimeEnvironment).filter(
+                        RunTimeEnvironment.schema.in_(schemas),
+                        RunTimeEnvironment.read_only.is_(False),
+                    )
+                }
+                if schemas
+                else {}
             )
-            if template_uuid:
-                rte.template_id = template_uuid
-            if impersonate_user_id is not None:
-                rte.impersonate_user_id = impersonate_user_id
-            if impersonate_email is not None:
-                rte.impersonate_email = impersonate_email
-            s.add(rte)
+            for env in environments:
+                # Read-only environments share the template schema, so they
+                # never take over an existing row.
+                existing = (
+                    None
+                    if env.get("read_only")
+                    else existing_by_schema.get(env["schema"])
+                )
+                self._upsert_runtime_environment(s, existing, **env)
+
+    def _upsert_runtime_environment(
+        self,
+        s,
+        existing: RunTimeEnvironment | None,
+        *,
+        environment_id: str,
+        schema: str,
+        expires_at: datetime | None,
+        last_used_at: datetime,
+        created_by: str,
+        template_id: str | None = None,
+        impersonate_user_id: str | None = None,
+        impersonate_email: str | None = None,
+        read_only: bool = False,
+        shard: str = PRIMARY_SHARD,
+        status: str = "ready",
+        pristine: bool = False,
+    ) -> None:
+        env_uuid = self._to_uuid(environment_id)
+        template_uuid = self._to_uuid(template_id) if template_id else None
+        if existing and existing.id == env_uuid:
+            existing.status = status
+            existing.pristine = pristine
+            existing.expires_at = expires_at
+            existing.last_used_at = last_used_at
+            existing.created_by = created_by
+            existing.updated_at = datetime.now()
+            existing.template_id = template_uuid
+            existing.impersonate_user_id = impersonate_user_id
+            existing.impersonate_email = impersonate_email
+            existing.shard = shard
+            return
+        if existing and existing.id != env_uuid:
+            archive_suffix = uuid4().hex[:6]
+            existing.schema = f"{existing.schema}_archived_{archive_suffix}"
+            existing.status = "deleted"
+            existing.updated_at = datetime.now()
+            existing.expires_at = datetime.now()
+            self.session_manager.invalidate_environment(existing.id)
+        rte = RunTimeEnvironment(
+            id=env_uuid,
+            schema=schema,
+            status=status,
+            expires_at=expires_at,
+            last_used_at=last_used_at,
+            created_by=created_by,
+            read_only=read_only,
+            shard=shard,
+            pristine=pristine,
+        )
+        if template_uuid:
+            rte.template_id = template_uuid
+        if impersonate_user_id is not None:
+            rte.impersonate_user_id = impersonate_user_id
+        if impersonate_email is not None:
+            rte.impersonate_email = impersonate_email
+        s.add(rte)
 
     def get_environment(self, environment_id: str) -> RunTimeEnvironment | None:
         env_uuid = self._to_uuid(environment_id)
@@ -308,11 +656,11 @@ class EnvironmentHandler:
         return None
 
     def clone_schema_from_environment(
-        self, source_schema: str, target_schema: str
+        self, source_schema: str, target_schema: str, shard: str = PRIMARY_SHARD
     ) -> None:
-        self.create_schema(target_schema)
-        self.migrate_schema(source_schema, target_schema)
-        self.seed_data_from_template(source_schema, target_schema)
+        self.create_schema(target_schema, shard)
+        self.migrate_schema(source_schema, target_schema, shard)
+        self.seed_data_from_template(source_schema, target_schema, shard=shard)
 
     def register_template(
         self,
@@ -332,6 +680,27 @@ class EnvironmentHandler:
         template_uuid = uuid4()
         order_value = list(table_order) if table_order is not None else None
         with self.session_manager.with_meta_session() as s:
+            # A schema registered again may hold new contents: its shared
+            # template checksums are stale, and environments cloned from the
+            # old contents no longer match it.
+            s.execute(
+                delete(SnapshotMetadata).where(
+                    SnapshotMetadata.environment_id.is_(None),
+                    SnapshotMetadata.schema_name == location,
+                )
+            )
+            s.execute(
+                update(RunTimeEnvironment)
+                .where(
+                    RunTimeEnvironment.template_id.in_(
+                        select(TemplateEnvironment.id).where(
+                            TemplateEnvironment.location == location
+                        )
+                    ),
+                    RunTimeEnvironment.pristine.is_(True),
+                )
+                .values(pristine=False)
+            )
             tmpl = TemplateEnvironment(
                 id=template_uuid,
                 service=service,
@@ -345,17 +714,77 @@ class EnvironmentHandler:
                 table_order=order_value,
             )
             s.add(tmpl)
+        self.clone_planner.invalidate(location)
         return str(template_uuid)
 
-    def drop_schema(self, schema: str) -> None:
+    def drop_schema(self, schema: str, shard: str = PRIMARY_SHARD) -> None:
         try:
-            with self.session_manager.base_engine.begin() as conn:
+            with self.session_manager.engine_for_shard(shard).begin() as conn:
                 conn.execute(text(f'DROP SCHEMA IF EXISTS "{schema}" CASCADE'))
+            self.session_manager.forget_schema(schema)
             logger.info(f"Dropped schema {schema}")
         except Exception as e:
             logger.error(f"Failed to drop schema {schema}: {e}")
             raise
 
+    def trash_schemas(
+        self, schemas: Iterable[str], shard: str = PRIMARY_SHARD
+    ) -> dict[str, str]:
+        """Rename existing ``schemas`` into the trash namespace in one transaction.
+
+        Renaming only touches the schema's catalog row, so it is cheap compared
+        to ``DROP SCHEMA ... CASCADE``. Missing schemas are skipped. Returns
+        original name -> trash name for the schemas that were moved.
+        """
+        names = list(schemas)
+        if not names:
+            return {}
+        with self.session_manager.engine_for_shard(shard).begin() as conn:
+            existing = (
+                conn.execute(
+                    text(
+                        "SELECT nspname FROM pg_namespace WHERE nspname = ANY(:names)"
+                    ),
+                    {"names": names},
+                )
+                .scalars()
+                .all()
+            )
+            renamed = {name: f"{TRASH_SCHEMA_PREFIX}{uuid4().hex}" for name in existing}
+            for name, trash_name in renamed.items():
+                conn.execute(text(f'ALTER SCHEMA "{name}" RENAME TO "{trash_name}"'))
+        for name in renamed:
+            self.session_manager.forget_schema(name)
+        if renamed:
+            logger.info(f"Moved {len(renamed)} schemas to trash")
+        return renamed
+
+    def list_trash_schemas(
+        self, limit: int | None = None, shard: str = PRIMARY_SHARD
+    ) -> list[str]:
+        """Trash schemas still waiting to be dropped, oldest OID first."""
+        with self.session_manager.engine_for_shard(shard).begin() as conn:
+            return list(
+                conn.execute(
+                    text(
+                        "SELECT nspname FROM pg_namespace "
+                        "WHERE starts_with(nspname, :prefix) ORDER BY oid LIMIT :limit"
+                    ),
+                    {"prefix": TRASH_SCHEMA_PREFIX, "limit": limit},
+                )
+                .scalars()
+                .all()
+            )
+
+    def schemas_with_snapshots(
+        self, schemas: list[str], shard: str = PRIMARY_SHARD
+    ) -> set[str]:
+        """Schemas holding snapshot, change counter or change capture tables."""
+        if not schemas:
+            return set()
+        with self.session_manager.engine_for_shard(shard).begin() as conn:
+            return self._snapshot_schemas(conn, schemas)
+
     def mark_environment_status(self, environment_id: str, status: str) -> None:
         env_uuid = self._to_uuid(environment_id)
         with self.session_manager.with_meta_session() as s:
@@ -368,6 +797,189 @@ class EnvironmentHandler:
                 raise ValueError("environment not found")
             env.status = status
             env.updated_at = datetime.now()
+        self.session_manager.invalidate_environment(env_uuid)
+
+    def finish_provisioning(self, environment_id: str, status: str) -> bool:
+        """Move a provisioning environment to ``status``.
+
+        Returns False if it is no longer provisioning, e.g. it was deleted or
+        expired while its schema was being built.
+        """
+        env_uuid = self._to_uuid(environment_id)
+        with self.session_manager.with_meta_session() as s:
+            result = s.execute(
+                update(RunTimeEnvironment)
+                .where(
+                    RunTimeEnvironment.id == env_uuid,
+                    RunTimeEnvironment.status == "initializing",
+                )
+                .values(status=status, updated_at=datetime.now())
+            )
+        self.session_manager.invalidate_environment(env_uuid)
+        return result.rowcount > 0
+
+    def hibernate_environment(
+        self, environment_id: str | UUID, idle_before: datetime
+    ) -> str | None:
+        """Export an idle environment's schema to an artifact and drop it.
+
+        The environment is claimed as hibernated first, so concurrent
+        maintenance workers skip it; the export and the drop then run in one
+        transaction holding write locks on every table, so no write lands
+        between them. Returns the artifact location, or None if the
+        environment was used, restored or changed status in the meantime.
+        """
+        store = self._require_artifact_store()
+        env_uuid = self._to_uuid(environment_id)
+        location = store.location(f"env_{env_uuid.hex}_{uuid4().hex[:8]}")
+        with self.session_manager.with_meta_session() as s:
+            env = s.execute(
+                update(RunTimeEnvironment)
+                .where(
+                    RunTimeEnvironment.id == env_uuid,
+                    RunTimeEnvironment.status == "ready",
+                    RunTimeEnvironment.read_only.is_(False),
+                    RunTimeEnvironment.last_used_at < idle_before,
+                )
+                .values(
+                    status=HIBERNATED_STATUS,
+                    artifact_location=location,
+                    updated_at=datetime.now(),
+                )
+                .returning(RunTimeEnvironment.schema, RunTimeEnvironment.shard)
+            ).one_or_none()
+        if env is None:
+            return None
+        schema, shard = env
+        self.session_manager.invalidate_environment(env_uuid)
+
+        try:
+            plan = self.clone_planner.compile_uncached(schema, shard=shard)
+            with self.session_manager.engine_for_shard(shard).begin() as conn:
+                self._lock_environment(conn, env_uuid)
+                if not self._still_hibernated(env_uuid, location):
+                    return None
+                # Snapshot tables are not part of the artifact; an environment
+                # that took one since it was picked stays awake.
+                if self._snapshot_schemas(conn, [schema]):
+                    self._wake(env_uuid, location)
+                    return None
+                if plan.tables:
+                    conn.exec_driver_sql(
+                        "LOCK TABLE "
+                        + ", ".join(f'"{schema}"."{t}"' for t in plan.tables)
+                        + " IN EXCLUSIVE MODE"
+                    )
+                with store.open_write(location) as fileobj:
+                    write_schema_artifact(conn, plan, schema, fileobj)
+                conn.execute(text(f'DROP SCHEMA "{schema}" CASCADE'))
+        except Exception as e:
+            logger.error(f"Failed to hibernate environment {env_uuid}: {e}")
+            store.delete(location)
+            self._wake(env_uuid, location)
+            raise
+        self.session_manager.forget_schema(schema)
+        logger.info(f"Hibernated environment {env_uuid} ({schema}) to {location}")
+        return location
+
+    def restore_environment(self, environment_id: str | UUID) -> bool:
+        """Rebuild a hibernated environment's schema from its artifact.
+
+        Safe to call concurrently: restores and hibernations of one
+        environment serialise on an advisory lock in its data database.
+        Returns False if the environment was not hibernated.
+        """
+        store = self._require_artifact_store()
+        env = self.get_environment(environment_id)
+        if env is None or env.status != HIBERNATED_STATUS:
+            return False
+        location = env.artifact_location
+        with self.session_manager.engine_for_shard(env.shard).begin() as conn:
+            self._lock_environment(conn, env.id)
+            if not self._still_hibernated(env.id, location):
+                return False
+            # A hibernation that failed before dropping the schema leaves it
+            # in place; only the status needs restoring then.
+            exists = conn.execute(
+                text("SELECT 1 FROM pg_namespace WHERE nspname = :schema"),
+                {"schema": env.schema},
+            ).first()
+            if not exists:
+                with store.open_read(location) as fileobj:
+                    restore_schema_artifact(conn, fileobj, env.schema)
+            # Marked ready while the lock is held, so a waiting hibernation
+            # sees the new status instead of exporting again.
+            if not self._wake(env.id, location):
+                raise RuntimeError(f"environment {env.id} changed while restoring")
+        store.delete(location)
+        return True
+
+    def discard_artifacts(self, locations: Iterable[str | None]) -> None:
+        """Delete artifacts of environments that will not be restored."""
+        if self.artifact_store is None:
+            return
+        for location in locations:
+            if location:
+                try:
+                    self.artifact_store.delete(location)
+                except OSError as e:
+                    logger.warning(f"Failed to delete artifact {location}: {e}")
+
+    def _require_artifact_store(self) -> ArtifactStore:
+        if self.artifact_store is None:
+            raise RuntimeError("no artifact store configured for hibernation")
+        return self.artifact_store
+
+    def _still_hibernated(self, env_uuid: UUID, location: str | None) -> bool:
+        with self.session_manager.with_meta_session() as s:
+            return (
+                s.execute(
+                    select(RunTimeEnvironment.id).where(
+                        RunTimeEnvironment.id == env_uuid,
+                        RunTimeEnvironment.status == HIBERNATED_STATUS,
+                        RunTimeEnvironment.artifact_location == location,
+                    )
+                ).first()
+                is not None
+            )
+
+    def _wake(self, env_uuid: UUID, location: str | None) -> bool:
+        """Mark a hibernated environment ready again; False if it moved on."""
+        with self.session_manager.with_meta_session() as s:
+            result = s.execute(
+                update(RunTimeEnvironment)
+                .where(
+                    RunTimeEnvironment.id == env_uuid,
+                    RunTimeEnvironment.status == HIBERNATED_STATUS,
+                    RunTimeEnvironment.artifact_location == location,
+                )
+                .values(
+                    status="ready", artifact_location=None, updated_at=datetime.now()
+                )
+            )
+        self.session_manager.invalidate_environment(env_uuid)
+        return result.rowcount > 0
+
+    @staticmethod
+    def _snapshot_schemas(conn, schemas: list[str]) -> set[str]:
+        return set(
+            conn.execute(
+                text(
+                    "SELECT DISTINCT n.nspname FROM pg_class c "
+                    "JOIN pg_namespace n ON n.oid = c.relnamespace "
+                    "WHERE n.nspname = ANY(:schemas) AND c.relkind IN ('r', 'p') "
+                    "AND strpos(c.relname, :marker) > 0"
+                ),
+                {"schemas": list(schemas), "marker": SNAPSHOT_MARKER},
+            ).scalars()
+        )
+
+    @staticmethod
+    def _lock_environment(conn, env_uuid: UUID) -> None:
+        conn.execute(
+            text("SELECT pg_advisory_xact_lock(hashtextextended(:key, 0))"),
+            {"key": f"environment:{env_uuid.hex}"},
+        )
 
     @staticmethod
     def _to_uuid(value: str | UUID | None) -> UUID:
@@ -0,0 +1,315 @@
+"""
+Online fan-out of service schema migrations over environment schemas.
+
+Alembic migrates the platform database once, but service tables exist in
+every template, pooled and live environment schema. A revision opts in to
+fan-out by defining ``upgrade_schema(conn, schema)``, which must be
+idempotent. The runner records one progress row per (revision, shard,
+schema) in the meta database and applies the hook with bounded parallelism,
+each schema in its own short transaction, so a restarted run picks up where
+the last one stopped instead of starting over.
+"""
+
+from __future__ import annotations
+
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from functools import partial
+from pathlib import Path
+from typing import Callable
+from uuid import UUID, uuid4
+
+from sqlalchemy import and_, case, delete, func, or_, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+
+from eval_platform.db.schema import (
+    EnvironmentPoolEntry,
+    RunTimeEnvironment,
+    SchemaMigrationProgress,
+    SnapshotMetadata,
+    TemplateEnvironment,
+)
+
+from .environment import SCHEMA_TEMPLATE, EnvironmentHandler
+from .pool import PoolManager
+from .session import SessionManager
+
+logger = logging.getLogger(__name__)
+
+# Function a revision module defines to be applied to each environment schema
+FANOUT_HOOK = "upgrade_schema"
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "db" / "migrations"
+# Progress rows inserted per statement when registering targets
+_REGISTER_BATCH = 1_000
+_MAX_ERROR_LENGTH = 2_000
+# Claim order by target kind: templates first, so pooled schemas that fail
+# are rebuilt from an already migrated template.
+_CLAIM_ORDER = {"template": 0, "pool": 1, "environment": 2}
+
+SchemaHook = Callable[..., None]
+
+
+@dataclass(frozen=True)
+class FanoutTarget:
+    schema: str
+    shard: str
+    # "template", "pool" or "environment"
+    kind: str
+
+
+@dataclass
+class FanoutResult:
+    revision: str
+    counts: Counter[str] = field(default_factory=Counter)
+
+    @property
+    def failed(self) -> int:
+        return self.counts["failed"]
+
+
+def load_schema_hook(revision: str) -> tuple[str, SchemaHook]:
+    """Resolve ``revision`` (an id or e.g. "head") to its id and fan-out hook."""
+    from alembic.config import Config
+    from alembic.script import ScriptDirectory
+    from alembic.util import CommandError
+
+    config = Config()
+    config.set_main_option("script_location", str(MIGRATIONS_DIR))
+    script = ScriptDirectory.from_config(config)
+    try:
+        rev = script.get_revision(revision)
+    except CommandError:
+        rev = None
+    if rev is None:
+        raise ValueError(f"unknown revision '{revision}'")
+    hook = getattr(rev.module, FANOUT_HOOK, None)
+    if hook is None:
+        raise ValueError(
+            f"revision {rev.revision} does not define {FANOUT_HOOK}(conn, schema)"
+        )
+    return rev.revision, hook
+
+
+class MigrationFanout:
+    """Applies a revision's schema hook across environment schemas.
+
+    Templates are migrated first, so pooled schemas that fail and are marked
+    dirty get rebuilt from an already migrated template. Failed template and
+    live schemas are retried up to ``max_attempts`` times; rows left running
+    by a crashed runner are reclaimed once their ``lease_seconds`` run out.
+    """
+
+    def __init__(
+        self,
+        session_manager: SessionManager,
+        environment_handler: EnvironmentHandler,
+        pool_manager: PoolManager,
+        *,
+        concurrency: int = 4,
+        lock_timeout_ms: int = 5_000,
+        lease_seconds: int = 900,
+        max_attempts: int = 3,
+    ):
+        self.session_manager = session_manager
+        self.environment_handler = environment_handler
+        self.pool_manager = pool_manager
+        self.concurrency = max(1, concurrency)
+        # DDL waiting longer than this for a lock held by agent traffic fails
+        # (and is retried later) instead of blocking the schema's requests.
+        self.lock_timeout_ms = max(0, lock_timeout_ms)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+
+    def run(
+        self, revision: str, hook: SchemaHook, *, takeover: bool = False
+    ) -> FanoutResult:
+        """Register targets, then migrate until nothing claimable is left.
+
+        With ``takeover`` rows still marked running are reclaimed at once;
+        only use it when no other runner is active.
+        """
+        added = self.register_targets(revision)
+        logger.info("Registered %d new schemas for revision %s", added, revision)
+        result = FanoutResult(revision)
+        apply = partial(self._apply, hook)
+        with ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="fanout"
+        ) as executor:
+            while batch := self._claim(
+                revision, self.concurrency * 4, takeover=takeover
+            ):
+                result.counts.update(executor.map(apply, batch))
+                takeover = False
+                logger.info("Revision %s: %s", revision, dict(self.progress(revision)))
+        return result
+
+    def collect_targets(self) -> list[FanoutTarget]:
+        """Template, ready pooled and live schemas, one per (shard, schema)."""
+        with self.session_manager.with_meta_session() as s:
+            templates = s.scalars(
+                select(TemplateEnvironment.location)
+                .where(TemplateEnvironment.kind == SCHEMA_TEMPLATE)
+                .distinct()
+            ).all()
+            # Dirty and refreshing entries are rebuilt from the template anyway.
+            pooled = s.execute(
+                select(
+                    EnvironmentPoolEntry.schema_name, EnvironmentPoolEntry.shard
+                ).where(EnvironmentPoolEntry.status == "ready")
+            ).all()
+            live = s.execute(
+                select(RunTimeEnvironment.schema, RunTimeEnvironment.shard).where(
+                    RunTimeEnvironment.status == "ready",
+                    RunTimeEnvironment.read_only.is_(False),
+                )
+            ).all()
+
+        targets: dict[tuple[str, str], str] = {}
+        for location in templates:
+            for shard in self.environment_handler.shards_with_schema(location):
+                targets.setdefault((shard, location), "template")
+        for schema, shard in pooled:
+            targets.setdefault((shard, schema), "pool")
+        for schema, shard in live:
+            targets.setdefault((shard, schema), "environment")
+        return [
+            FanoutTarget(schema=schema, shard=shard, kind=kind)
+            for (shard, schema), kind in targets.items()
+        ]
+
+    def register_targets(self, revision: str) -> int:
+        """Record a pending row per target not yet known for ``revision``."""
+        now = datetime.now()
+        rows = [
+            {
+                "id": uuid4(),
+                "revision": revision,
+                "schema_name": target.schema,
+                "shard": target.shard,
+                "target_kind": target.kind,
+                "status": "pending",
+                "attempts": 0,
+                "created_at": now,
+            }
+            for target in self.collect_targets()
+        ]
+        added = 0
+        with self.session_manager.with_meta_session() as s:
+            for start in range(0, len(rows), _REGISTER_BATCH):
+                result = s.execute(
+                    insert(SchemaMigrationProgress)
+                    .values(rows[start : start + _REGISTER_BATCH])
+                    .on_conflict_do_nothing(constraint="uq_schema_migration_target")
+                )
+                added += result.rowcount
+        return added
+
+    def progress(self, revision: str) -> Counter[str]:
+        """Number of schemas per status for ``revision``."""
+        with self.session_manager.with_meta_session() as s:
+            rows = s.execute(
+                select(SchemaMigrationProgress.status, func.count())
+                .where(SchemaMigrationProgress.revision == revision)
+                .group_by(SchemaMigrationProgress.status)
+            ).all()
+        return Counter({status: count for status, count in rows})
+
+    def _claim(
+        self, revision: str, limit: int, *, takeover: bool = False
+    ) -> list[tuple[UUID, str, str, str]]:
+        """Mark up to ``limit`` claimable rows running, templates first."""
+        progress = SchemaMigrationProgress
+        now = datetime.now()
+        stale_before = now if takeover else now - timedelta(seconds=self.lease_seconds)
+        claimable = (
+            select(progress.id)
+            .where(
+                progress.revision == revision,
+                or_(
+                    progress.status == "pending",
+                    and_(
+                        progress.status == "running",
+                        progress.started_at <= stale_before,
+                    ),
+                    # Failed pooled schemas are rebuilt instead of retried.
+                    and_(
+                        progress.status == "failed",
+                        progress.target_kind != "pool",
+                        progress.attempts < self.max_attempts,
+                    ),
+                ),
+            )
+            .order_by(
+                case(_CLAIM_ORDER, value=progress.target_kind),
+                progress.created_at,
+            )
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        with self.session_manager.with_meta_session() as s:
+            rows = s.execute(
+                update(progress)
+                .where(progress.id.in_(claimable.scalar_subquery()))
+                .values(
+                    status="running",
+                    started_at=now,
+                    finished_at=None,
+                    attempts=progress.attempts + 1,
+                )
+                .returning(
+                    progress.id,
+                    progress.schema_name,
+                    progress.shard,
+                    progress.target_kind,
+                )
+            ).all()
+        return [tuple(row) for row in rows]
+
+    def _apply(self, hook: SchemaHook, row: tuple[UUID, str, str, str]) -> str:
+        """Run ``hook`` on one schema in its own transaction. Returns the new status."""
+        progress_id, schema, shard, kind = row
+        engine = self.session_manager.engine_for_shard(shard)
+        try:
+            with engine.begin() as conn:
+                exists = conn.execute(
+                    text("SELECT 1 FROM pg_namespace WHERE nspname = :schema"),
+                    {"schema": schema},
+                ).first()
+                if exists:
+                    conn.exec_driver_sql(
+                        f"SET LOCAL lock_timeout = {int(self.lock_timeout_ms)}"
+                    )
+                    hook(conn, schema)
+        except Exception as exc:
+            logger.warning("Migrating %s schema %s failed: %s", kind, schema, exc)
+            self._finish(progress_id, "failed", str(exc)[:_MAX_ERROR_LENGTH])
+            if kind == "pool":
+                self.pool_manager.discard_ready([schema])
+            return "failed"
+        # Schemas dropped since registration (expired, hibernated, recycled)
+        status = "done" if exists else "skipped"
+        if exists and kind == "template":
+            self._forget_template_snapshot(schema)
+        self._finish(progress_id, status)
+        return status
+
+    def _forget_template_snapshot(self, schema: str) -> None:
+        """Drop a migrated template's shared snapshot checksums; they are recomputed on use."""
+        with self.session_manager.with_meta_session() as s:
+            s.execute(
+                delete(SnapshotMetadata).where(
+                    SnapshotMetadata.environment_id.is_(None),
+                    SnapshotMetadata.schema_name == schema,
+                )
+            )
+
+    def _finish(self, progress_id: UUID, status: str, error: str | None = None) -> None:
+        with self.session_manager.with_meta_session() as s:
+            s.execute(
+                update(SchemaMigrationProgress)
+                .where(SchemaMigrationProgress.id == progress_id)
+                .values(status=status, error=error, finished_at=datetime.now())
+            )
@@ -1,5 +1,6 @@
 """
-On-demand maintenance service for environment cleanup and pool refill.
+On-demand maintenance service for environment cleanup, pool refill and
+hibernation of idle environments.
 
 Activates when requests arrive, runs for a configurable idle timeout,
 then stops to allow Neon to scale to zero.
@@ -8,19 +9,28 @@ then stops to allow Neon to scale to zero.
 from __future__ import annotations
 
 import asyncio
+import heapq
 import logging
 import time
-from datetime import datetime
-from typing import TYPE_CHECKING, Mapping
-from uuid import uuid4
+from datetime import datetime, timedelta
+from functools import partial
+from typing import TYPE_CHECKING, Awaitable, Callable, Mapping
+from uuid import UUID, uuid4
 
-from eval_platform.db.schema import RunTimeEnvironment
+from sqlalchemy import exists, or_, select, update
+
+from eval_platform.db.schema import RunTimeEnvironment, TestRun
+
+from .environment import SCHEMA_TEMPLATE
+from .pool import empty_tier_key
 
 if TYPE_CHECKING:
     from src.eval_platform.evaluationEngine.replication import LogicalReplicationService
     from .session import SessionManager
     from .environment import EnvironmentHandler
     from .pool import PoolManager
+    from .autoscaler import PoolAutoscaler
+    from .core import DeferredBuild
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +53,12 @@ class EnvironmentMaintenanceService:
         cycle_interval: int = 10,
         max_concurrent_builds: int = 5,
         replication_service: "LogicalReplicationService | None" = None,
+        recycle_mode: str = "delta",
+        autoscaler: "PoolAutoscaler | None" = None,
+        empty_targets: Mapping[str, int] | None = None,
+        cleanup_batch_size: int = 500,
+        max_concurrent_drops: int = 4,
+        hibernate_after: int = 0,
     ):
         self.session_manager = session_manager
         self.environment_handler = environment_handler
@@ -52,12 +68,25 @@ class EnvironmentMaintenanceService:
         self.cycle_interval = cycle_interval
         self.max_concurrent_builds = max(1, max_concurrent_builds)
         self.replication_service = replication_service
+        # "delta" restores returned schemas in place, "rebuild" drops them
+        self.recycle_mode = recycle_mode
+        self.autoscaler = autoscaler
+        # service -> number of empty, migrated schemas kept per DDL shape
+        self.empty_targets = {k: v for k, v in (empty_targets or {}).items() if v > 0}
+        # Expired environments handled per cleanup cycle / trash schemas dropped at once
+        self.cleanup_batch_size = max(1, cleanup_batch_size)
+        self.max_concurrent_drops = max(1, max_concurrent_drops)
+        # Seconds without requests before an environment is exported to an
+        # artifact and its schema dropped; 0 disables hibernation
+        self.hibernate_after = max(0, hibernate_after)
 
         self._running = False
         self._last_activity = 0.0
+        self._last_request = 0.0
         self._lock = asyncio.Lock()
         self._build_semaphore = asyncio.Semaphore(self.max_concurrent_builds)
         self._cleanup_phase = 1  # Alternates between 1 (mark) and 2 (delete)
+        self._provisioning: set[asyncio.Task] = set()
 
     async def trigger(self) -> None:
         """
@@ -67,6 +96,7 @@ class EnvironmentMaintenanceService:
         or just updates last_activity timestamp if running.
         """
         self._last_activity = time.time()
+        self._last_request = self._last_activity
 
         async with self._lock:
             if not self._running:
@@ -74,6 +104,42 @@ class EnvironmentMaintenanceService:
                 asyncio.create_task(self._maintenance_loop())
                 logger.info("Maintenance service activated")
 
+    def provision(
+        self,
+        complete: Callable[[DeferredBuild], None],
+        builds: list[DeferredBuild],
+    ) -> None:
+        """Run deferred environment builds in the background.
+
+        They share the pool-build concurrency limit, so a burst of pool misses
+        queues here instead of occupying request workers.
+        """
+        for build in builds:
+            task = asyncio.create_task(self._run_provisioning(complete, build))
+            self._provisioning.add(task)
+            task.add_done_callback(self._provisioning.discard)
+
+    async def _run_provisioning(
+        self, complete: Callable[[DeferredBuild], None], build: DeferredBuild
+    ) -> None:
+        async with self._build_semaphore:
+            started = time.time()
+            try:
+                await asyncio.to_thread(complete, build)
+            except Exception as exc:
+                logger.error(
+                    "Provisioning environment %s failed: %s",
+                    build.environment_id,
+                    exc,
+                )
+                return
+            finally:
+                self._touch_activity()
+            if self.autoscaler is not None and not build.prebuilt:
+                self.autoscaler.record_build(
+                    build.template_schema, time.time() - started
+                )
+
     @property
     def is_running(self) -> bool:
         return self._running
@@ -82,6 +148,10 @@ class EnvironmentMaintenanceService:
         """Update last activity timestamp. Called when actual work is done."""
         self._last_activity = time.time()
 
+    def _is_quiet(self) -> bool:
+        """True when no request arrived during the last cycle."""
+        return time.time() - self._last_request >= self.cycle_interval
+
     async def _maintenance_loop(self) -> None:
         """Main loop: cleanup + refill until idle timeout is reached."""
         logger.debug("Maintenance loop started")
@@ -93,9 +163,16 @@ class EnvironmentMaintenanceService:
                 if did_cleanup:
                     self._touch_activity()
 
+                if await self._hibernate_idle_environments():
+                    self._touch_activity()
+
                 did_refill = await self._run_pool_refill_cycle()
                 if did_refill:
                     self._touch_activity()
+                elif self._is_quiet() and await self._drain_trash():
+                    # Trash is only dropped while no requests or builds compete
+                    # for catalog locks.
+                    self._touch_activity()
 
                 idle_duration = time.time() - self._last_activity
                 if idle_duration > self.idle_timeout:
@@ -135,13 +212,19 @@ class EnvironmentMaintenanceService:
             return False
 
     def _mark_expired_environments(self) -> int:
-        """Phase 1: Mark ready environments that passed TTL as expired. Returns count."""
+        """Phase 1: Mark environments that passed TTL as expired. Returns count.
+
+        Covers provisioning, failed and hibernated environments too, so a
+        build lost to a restart does not leave its row behind forever.
+        """
         with self.session_manager.with_meta_session() as session:
             ready_but_expired = (
                 session.query(RunTimeEnvironment)
                 .filter(
                     RunTimeEnvironment.expires_at < datetime.now(),
-                    RunTimeEnvironment.status == "ready",
+                    RunTimeEnvironment.status.in_(
+                        ("ready", "initializing", "failed", "hibernated")
+                    ),
                 )
                 .all()
             )
@@ -153,15 +236,23 @@ class EnvironmentMaintenanceService:
                 for env in ready_but_expired:
                     env.status = "expired"
                     env.updated_at = datetime.now()
+                    self.session_manager.invalidate_environment(env.id)
 
             return len(ready_but_expired)
 
     def _delete_expired_environments(self) -> int:
-        """Phase 2: Drop schemas for environments marked as expired. Returns count."""
+        """Phase 2: Move expired schemas to trash and retire their rows. Returns count.
+
+        Schemas are renamed in one transaction and dropped later by
+        ``_drain_trash``; runtime and pool rows are updated in bulk.
+        """
         with self.session_manager.with_meta_session() as session:
             expired_envs = (
                 session.query(RunTimeEnvironment)
                 .filter(RunTimeEnvironment.status == "expired")
+                .order_by(RunTimeEnvironment.expires_at.asc())
+                .with_for_update(skip_locked=True)
+                .limit(self.cleanup_batch_size)
                 .all()
             )
 
@@ -170,122 +261,409 @@ class EnvironmentMaintenanceService:
 
             logger.info("Found %d expired environments to cleanup", len(expired_envs))
 
-            for env in expired_envs:
-                try:
-                    self.environment_handler.drop_schema(env.schema)
-                    env.status = "deleted"
-                    env.updated_at = datetime.now()
-                    logger.info(
-                        "Cleaned up expired environment %s (schema: %s)",
-                        env.id,
-                        env.schema,
-                    )
-                except Exception as exc:
-                    logger.error(
-                        "Failed to cleanup environment %s (schema: %s): %s",
-                        env.id,
-                        env.schema,
-                        exc,
+            # Read-only environments are bound to the template schema; nothing
+            # to drop or recycle.
+            owned = [env for env in expired_envs if not env.read_only]
+            owned_schemas = [env.schema for env in owned]
+            env_ids = [env.id for env in expired_envs]
+            # Hibernated environments have no schema left, only an artifact.
+            artifacts = [env.artifact_location for env in expired_envs]
+            by_shard: dict[str, list[str]] = {}
+            for env in owned:
+                by_shard.setdefault(env.shard, []).append(env.schema)
+            failed: set[str] = set()
+            for shard, schemas in by_shard.items():
+                failed |= self._trash_expired_schemas(schemas, shard)
+
+            now = datetime.now()
+            failed_ids = [env.id for env in owned if env.schema in failed]
+            deleted_ids = [env_id for env_id in env_ids if env_id not in failed_ids]
+            for status, ids in (
+                ("deleted", deleted_ids),
+                ("cleanup_failed", failed_ids),
+            ):
+                if ids:
+                    session.execute(
+                        update(RunTimeEnvironment)
+                        .where(RunTimeEnvironment.id.in_(ids))
+                        .values(status=status, updated_at=now, artifact_location=None)
                     )
-                    env.status = "cleanup_failed"
-                    env.updated_at = datetime.now()
-                finally:
-                    if self.pool_manager:
-                        try:
-                            self.pool_manager.release_in_use(env.schema, recycle=True)
-                        except Exception as pool_exc:
-                            logger.warning(
-                                "Failed to mark schema %s for pool recycle: %s",
-                                env.schema,
-                                pool_exc,
-                            )
-                    self._stop_replication(env.id)
-
-            return len(expired_envs)
-
-    def _stop_replication(self, environment_id) -> None:
-        """Stop replication for an environment."""
+
+        self.environment_handler.discard_artifacts(artifacts)
+        if self.pool_manager:
+            try:
+                self.pool_manager.release_many(owned_schemas, recycle=True)
+            except Exception as exc:
+                logger.warning(
+                    "Failed to mark expired schemas for pool recycle: %s", exc
+                )
+        self._stop_replication(env_ids)
+        return len(env_ids)
+
+    async def _hibernate_idle_environments(self) -> bool:
+        """Hibernate environments idle for ``hibernate_after`` seconds.
+
+        A few per cycle, sharing the build concurrency limit since exports
+        and restores are as heavy as builds. Returns True if any was hibernated.
+        """
+        if not self.hibernate_after:
+            return False
+        idle_before = datetime.now() - timedelta(seconds=self.hibernate_after)
+        try:
+            env_ids = await asyncio.to_thread(self._hibernation_candidates, idle_before)
+        except Exception as exc:
+            logger.error("Hibernation candidate query failed: %s", exc, exc_info=True)
+            return False
+        if not env_ids:
+            return False
+
+        async def hibernate(env_id: UUID) -> str | None:
+            async with self._build_semaphore:
+                return await asyncio.to_thread(
+                    self.environment_handler.hibernate_environment, env_id, idle_before
+                )
+
+        results = await asyncio.gather(
+            *(hibernate(env_id) for env_id in env_ids), return_exceptions=True
+        )
+        hibernated = sum(isinstance(result, str) for result in results)
+        failures = sum(isinstance(result, Exception) for result in results)
+        if hibernated or failures:
+            logger.info(
+                "Hibernated %d idle environments (%d failed)", hibernated, failures
+            )
+        return hibernated > 0
+
+    def _hibernation_candidates(self, idle_before: datetime) -> list[UUID]:
+        """Idle, owned environments not about to expire anyway, least recent first.
+
+        Environments with a running test run or with snapshot tables are
+        skipped: artifacts hold only the environment's own tables, so
+        hibernating would lose the run's before snapshot and checkpoints.
+        """
+        expires_after = datetime.now() + timedelta(seconds=self.hibernate_after)
+        running = exists().where(
+            TestRun.environment_id == RunTimeEnvironment.id,
+            TestRun.status == "running",
+        )
+        with self.session_manager.with_meta_session() as session:
+            rows = session.execute(
+                select(
+                    RunTimeEnvironment.id,
+                    RunTimeEnvironment.schema,
+                    RunTimeEnvironment.shard,
+                )
+                .where(
+                    RunTimeEnvironment.status == "ready",
+                    RunTimeEnvironment.read_only.is_(False),
+                    RunTimeEnvironment.last_used_at < idle_before,
+                    or_(
+                        RunTimeEnvironment.expires_at.is_(None),
+                        RunTimeEnvironment.expires_at > expires_after,
+                    ),
+                    ~running,
+                )
+                .order_by(RunTimeEnvironment.last_used_at.asc())
+            ).all()
+        snapshotted: set[tuple[str, str]] = set()
+        for shard in {row.shard for row in rows}:
+            schemas = [row.schema for row in rows if row.shard == shard]
+            snapshotted.update(
+                (shard, schema)
+                for schema in self.environment_handler.schemas_with_snapshots(
+                    schemas, shard
+                )
+            )
+        candidates = [
+            row.id for row in rows if (row.shard, row.schema) not in snapshotted
+        ]
+        return candidates[: self.max_concurrent_builds]
+
+    def _trash_expired_schemas(self, schemas: list[str], shard: str) -> set[str]:
+        """Move schemas to trash in one go, isolating failures one by one. Returns failed schemas."""
+        try:
+            self.environment_handler.trash_schemas(schemas, shard)
+            return set()
+        except Exception as exc:
+            logger.warning(
+                "Batch trash of %d schemas failed, retrying one by one: %s",
+                len(schemas),
+                exc,
+            )
+        failed: set[str] = set()
+        for schema in schemas:
+            try:
+                self.environment_handler.trash_schemas([schema], shard)
+            except Exception as exc:
+                logger.error("Failed to move schema %s to trash: %s", schema, exc)
+                failed.add(schema)
+        return failed
+
+    def _stop_replication(self, environment_ids) -> None:
+        """Stop replication for a batch of environments."""
         if not self.replication_service:
             return
         try:
-            self.replication_service.cleanup_environment(environment_id)
+            self.replication_service.cleanup_environments(environment_ids)
         except Exception as exc:
             logger.warning(
-                "Failed to cleanup replication for env %s: %s",
-                environment_id,
+                "Failed to cleanup replication for %d envs: %s",
+                len(environment_ids),
                 exc,
             )
 
-    async def _run_pool_refill_cycle(self) -> bool:
-        """Check and refill pool for all templates. Returns True if any work was done."""
-        if not self.pool_targets:
+    async def _drain_trash(self) -> bool:
+        """Drop one batch of trash schemas per shard with bounded parallelism.
+
+        Each drop runs in its own transaction so catalog locks are held
+        briefly. Returns True if anything was dropped.
+        """
+        names: list[tuple[str, str]] = []
+        for shard in self.session_manager.shards:
+            trash = await asyncio.to_thread(
+                self.environment_handler.list_trash_schemas,
+                self.cleanup_batch_size,
+                shard,
+            )
+            names.extend((name, shard) for name in trash)
+        if not names:
             return False
 
-        tasks = [
-            self._ensure_pool_capacity(template_schema, target)
-            for template_schema, target in self.pool_targets.items()
-        ]
-        if tasks:
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            return any(r is True for r in results if not isinstance(r, Exception))
-        return False
+        semaphore = asyncio.Semaphore(self.max_concurrent_drops)
 
-    async def _ensure_pool_capacity(self, template_schema: str, target: int) -> bool:
-        """Ensure pool has enough ready schemas for a template. Returns True if work done."""
-        try:
-            with self.session_manager.with_meta_session() as session:
-                ready = self.pool_manager.ready_count(
-                    template_schema=template_schema, session=session
+        async def drop(name: str, shard: str) -> None:
+            async with semaphore:
+                await asyncio.to_thread(
+                    self.environment_handler.drop_schema, name, shard
                 )
 
-            missing = target - ready
-            if missing <= 0:
-                return False
-
-            template_meta = self.environment_handler.get_template_metadata(
-                location=template_schema
-            )
-            table_order = template_meta.table_order if template_meta else None
-            template_id = template_meta.id if template_meta else None
+        results = await asyncio.gather(
+            *(drop(name, shard) for name, shard in names), return_exceptions=True
+        )
+        failures = sum(isinstance(result, Exception) for result in results)
+        logger.info(
+            "Dropped %d trash schemas (%d failed)", len(names) - failures, failures
+        )
+        return failures < len(names)
 
-            # Get schemas marked for refresh first
-            refresh_targets = self.pool_manager.schemas_for_refresh(
-                template_schema=template_schema, limit=missing
-            )
+    async def _run_pool_refill_cycle(self) -> bool:
+        """Refill pools, largest deficit first. Returns True if any work was done."""
+        if not self.pool_targets:
+            return False
 
-            build_tasks = []
+        try:
+            targets = self._current_targets()
+            empty_sources = self._empty_tier_sources()
+            ready = self.pool_manager.ready_counts(list(targets) + list(empty_sources))
+        except Exception as exc:
+            logger.error("Pool refill planning failed: %s", exc, exc_info=True)
+            return False
 
-            # Refresh existing dirty schemas
-            for schema_name, _ in refresh_targets:
-                build_tasks.append(
-                    self._schedule_build(
-                        template_schema, table_order, template_id, schema_name
-                    )
+        jobs: dict[str, list[Callable[[], Awaitable[None]]]] = {}
+        for template_schema, target in targets.items():
+            missing = target - ready.get(template_schema, 0)
+            if missing <= 0:
+                continue
+            try:
+                jobs[template_schema] = self._refill_jobs(template_schema, missing)
+            except Exception as exc:
+                logger.error(
+                    "Pool capacity check failed for %s: %s",
+                    template_schema,
+                    exc,
+                    exc_info=True,
                 )
-                missing -= 1
 
-            # Build new schemas if still needed
-            for _ in range(missing):
-                build_tasks.append(
-                    self._schedule_build(
-                        template_schema, table_order, template_id, None
-                    )
+        for key, (service, template_schema, table_order) in empty_sources.items():
+            missing = self.empty_targets[service] - ready.get(key, 0)
+            if missing > 0:
+                jobs[key] = self._empty_refill_jobs(
+                    key, template_schema, table_order, missing
                 )
 
-            if build_tasks:
-                await asyncio.gather(*build_tasks, return_exceptions=True)
-                return True
+        tasks = [job() for job in _largest_deficit_first(jobs)]
+        if self.autoscaler is not None:
+            for template_schema, target in targets.items():
+                surplus = ready.get(template_schema, 0) - target
+                if surplus > 0:
+                    tasks.append(self._retire_surplus(template_schema, surplus))
 
+        if not tasks:
             return False
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return True
+
+    def _current_targets(self) -> dict[str, int]:
+        """Fixed targets, or autoscaled targets fed by the pool's claim stats."""
+        if self.autoscaler is None:
+            return dict(self.pool_targets)
+        self.autoscaler.observe(self.pool_manager.drain_claim_stats())
+        return self.autoscaler.targets()
+
+    def _refill_jobs(
+        self, template_schema: str, missing: int
+    ) -> list[Callable[[], Awaitable[None]]]:
+        """Build jobs for one template: recycle dirty schemas first, then new ones."""
+        template_meta = self.environment_handler.get_template_metadata(
+            location=template_schema
+        )
+        table_order = template_meta.table_order if template_meta else None
+        template_id = template_meta.id if template_meta else None
+        kind = template_meta.kind if template_meta else SCHEMA_TEMPLATE
+
+        refresh_targets = self.pool_manager.schemas_for_refresh(
+            template_schema=template_schema, limit=missing
+        )
+        slots = self._with_new_slots(template_schema, refresh_targets, missing, kind)
+        return [
+            partial(
+                self._schedule_build,
+                template_schema,
+                table_order,
+                template_id,
+                name,
+                shard,
+                kind,
+            )
+            for name, shard in slots
+        ]
 
-        except Exception as exc:
-            logger.error(
-                "Pool capacity check failed for %s: %s",
+    def _with_new_slots(
+        self,
+        template_schema: str,
+        refresh_targets: list[tuple[str, UUID | None, str]],
+        missing: int,
+        kind: str = SCHEMA_TEMPLATE,
+    ) -> list[tuple[str | None, str]]:
+        """(schema, shard) for returned schemas, then least-loaded shards for new ones."""
+        slots: list[tuple[str | None, str]] = [
+            (name, shard) for name, _, shard in refresh_targets
+        ]
+        new = missing - len(slots)
+        if new > 0:
+            shards = self.environment_handler.shards_for_template(template_schema, kind)
+            slots.extend(
+                (None, shard) for shard in self.pool_manager.place_schemas(shards, new)
+            )
+        return slots
+
+    def _empty_tier_sources(self) -> dict[str, tuple[str, str, list[str] | None]]:
+        """Empty-tier pool key -> (service, source template, table order).
+
+        One key per service and DDL shape among the pooled templates, so
+        templates sharing a shape share their empty schemas.
+        """
+        if not self.empty_targets:
+            return {}
+        sources: dict[str, tuple[str, str, list[str] | None]] = {}
+        for template_schema in self.pool_targets:
+            template_meta = self.environment_handler.get_template_metadata(
+                location=template_schema
+            )
+            if (
+                template_meta is None
+                or template_meta.kind != SCHEMA_TEMPLATE
+                or template_meta.service not in self.empty_targets
+            ):
+                continue
+            table_order = template_meta.table_order
+            shards = self.environment_handler.shards_with_schema(template_schema)
+            if not shards:
+                continue
+            shape = self.environment_handler.empty_schema_shape(
+                template_schema, table_order, shard=shards[0]
+            )
+            sources.setdefault(
+                empty_tier_key(template_meta.service, shape),
+                (template_meta.service, template_schema, table_order),
+            )
+        return sources
+
+    def _empty_refill_jobs(
+        self,
+        key: str,
+        template_schema: str,
+        table_order: list[str] | None,
+        missing: int,
+    ) -> list[Callable[[], Awaitable[None]]]:
+        """Build jobs for one empty-tier key; returned schemas are rebuilt."""
+        refresh_targets = self.pool_manager.schemas_for_refresh(
+            template_schema=key, limit=missing
+        )
+        slots = self._with_new_slots(template_schema, refresh_targets, missing)
+        return [
+            partial(
+                self._schedule_empty_build,
+                key,
                 template_schema,
-                exc,
-                exc_info=True,
+                table_order,
+                name,
+                shard,
             )
-            return False
+            for name, shard in slots
+        ]
+
+    async def _schedule_empty_build(
+        self,
+        key: str,
+        template_schema: str,
+        table_order: list[str] | None,
+        schema_name: str | None,
+        shard: str,
+    ) -> None:
+        async with self._build_semaphore:
+            await asyncio.to_thread(
+                self._build_empty_entry,
+                key,
+                template_schema,
+                table_order,
+                schema_name,
+                shard,
+            )
+            self._touch_activity()
+
+    def _build_empty_entry(
+        self,
+        key: str,
+        template_schema: str,
+        table_order: list[str] | None,
+        schema_name: str | None,
+        shard: str,
+    ) -> None:
+        """Build an empty, migrated schema for the empty tier. Runs in thread pool."""
+        name = schema_name or f"state_pool_{uuid4().hex}"
+        try:
+            if self.environment_handler.schema_exists(name, shard):
+                self.environment_handler.drop_schema(name, shard)
+            self.environment_handler.build_empty_schema(
+                template_schema, name, tables_order=table_order, shard=shard
+            )
+            self.pool_manager.register_entry(
+                schema_name=name, template_schema=key, status="ready", shard=shard
+            )
+            self.pool_manager.mark_ready(name)
+            logger.info("Prepared empty schema %s for %s", name, key)
+        except Exception as exc:
+            logger.error("Failed to build empty schema %s for %s: %s", name, key, exc)
+            try:
+                self.environment_handler.drop_schema(name, shard)
+            except Exception:
+                logger.warning("Failed to cleanup schema %s after pool error", name)
+            raise
+
+    async def _retire_surplus(self, template_schema: str, surplus: int) -> None:
+        """Shrink an over-provisioned pool, a few schemas per cycle."""
+        names = self.pool_manager.retire_ready(
+            template_schema=template_schema,
+            limit=min(surplus, self.max_concurrent_builds),
+        )
+        for name, shard in names:
+            try:
+                await asyncio.to_thread(
+                    self.environment_handler.drop_schema, name, shard
+                )
+            except Exception as exc:
+                logger.warning("Failed to drop retired pool schema %s: %s", name, exc)
 
     async def _schedule_build(
         self,
@@ -293,16 +671,23 @@ class EnvironmentMaintenanceService:
         table_order: list[str] | None,
         template_id,
         schema_name: str | None,
+        shard: str,
+        kind: str = SCHEMA_TEMPLATE,
     ) -> None:
         """Schedule a pool entry build with concurrency limiting."""
         async with self._build_semaphore:
+            started = time.time()
             await asyncio.to_thread(
                 self._build_pool_entry,
                 template_schema,
                 table_order,
                 template_id,
                 schema_name,
+                shard,
+                kind,
             )
+            if self.autoscaler is not None:
+                self.autoscaler.record_build(template_schema, time.time() - started)
             self._touch_activity()
 
     def _build_pool_entry(
@@ -311,28 +696,38 @@ class EnvironmentMaintenanceService:
         table_order: list[str] | None,
         template_id,
         schema_name: str | None,
+        shard: str,
+        kind: str = SCHEMA_TEMPLATE,
         _retry: int = 0,
     ) -> None:
-        """Build a single pool entry. Runs in thread pool."""
+        """Build a single pool entry on ``shard``. Runs in thread pool."""
         name = schema_name or f"state_pool_{uuid4().hex}"
         max_retries = 2
 
         try:
-            # Drop and recreate if exists
-            if self.environment_handler.schema_exists(name):
-                self.environment_handler.drop_schema(name)
-            self.environment_handler.create_schema(name)
-
-            self.environment_handler.migrate_schema(template_schema, name)
-            self.environment_handler.seed_data_from_template(
-                template_schema, name, tables_order=table_order
-            )
+            # Delta resets compare against a live template schema.
+            if not (
+                schema_name
+                and kind == SCHEMA_TEMPLATE
+                and self._recycle_in_place(template_schema, name, table_order, shard)
+            ):
+                # Drop and recreate if exists
+                if self.environment_handler.schema_exists(name, shard):
+                    self.environment_handler.drop_schema(name, shard)
+                self.environment_handler.build_environment_schema(
+                    template_schema,
+                    name,
+                    kind=kind,
+                    tables_order=table_order,
+                    shard=shard,
+                )
 
             entry = self.pool_manager.register_entry(
                 schema_name=name,
                 template_schema=template_schema,
                 template_id=template_id,
                 status="ready",
+                shard=shard,
             )
             self.pool_manager.mark_ready(name)
             logger.info(
@@ -354,11 +749,17 @@ class EnvironmentMaintenanceService:
                     max_retries,
                 )
                 try:
-                    self.environment_handler.drop_schema(name)
+                    self.environment_handler.drop_schema(name, shard)
                 except Exception:
                     pass
                 return self._build_pool_entry(
-                    template_schema, table_order, template_id, schema_name, _retry + 1
+                    template_schema,
+                    table_order,
+                    template_id,
+                    schema_name,
+                    shard,
+                    kind,
+                    _retry + 1,
                 )
 
             logger.error(
@@ -368,11 +769,59 @@ class EnvironmentMaintenanceService:
                 exc,
             )
             try:
-                self.environment_handler.drop_schema(name)
+                self.environment_handler.drop_schema(name, shard)
             except Exception:
                 logger.warning("Failed to cleanup schema %s after pool error", name)
             raise
 
+    def _recycle_in_place(
+        self,
+        template_schema: str,
+        schema_name: str,
+        table_order: list[str] | None,
+        shard: str,
+    ) -> bool:
+        """Try a delta reset of a returned schema. Returns False to fall back to a rebuild."""
+        if self.recycle_mode != "delta":
+            return False
+        if not self.environment_handler.schema_exists(schema_name, shard):
+            return False
+        try:
+            rewritten = self.environment_handler.reset_schema_from_template(
+                template_schema, schema_name, tables_order=table_order, shard=shard
+            )
+        except Exception as exc:
+            logger.warning("Delta reset of %s failed, rebuilding: %s", schema_name, exc)
+            return False
+        if rewritten is None:
+            logger.info(
+                "Schema %s no longer matches %s, rebuilding",
+                schema_name,
+                template_schema,
+            )
+            return False
+        logger.info(
+            "Recycled pooled schema %s in place (%d tables rewritten)",
+            schema_name,
+            len(rewritten),
+        )
+        return True
+
+
+def _largest_deficit_first[T](queues: Mapping[str, list[T]]) -> list[T]:
+    """Interleave per-template jobs, always taking from the longest remaining queue."""
+    pending = {key: list(items) for key, items in queues.items() if items}
+    heap = [(-len(items), key) for key, items in pending.items()]
+    heapq.heapify(heap)
+    ordered: list[T] = []
+    while heap:
+        _, key = heapq.heappop(heap)
+        items = pending[key]
+        ordered.append(items.pop(0))
+        if items:
+            heapq.heappush(heap, (-len(items), key))
+    return ordered
+
 
 def parse_pool_targets(raw: str | None) -> dict[str, int]:
     """Parse pool targets from environment variable string."""
@@ -21,12 +21,24 @@ class InitEnvResult(BaseModel):
     expires_at: Optional[datetime]
 
 
+class EnvironmentSpec(BaseModel):
+    template_schema: str
+    ttl_seconds: int = 1800
+    impersonate_user_id: Optional[str] = None
+    impersonate_email: Optional[str] = None
+    read_only: bool = False
+
+
 class EnvironmentResponse(BaseModel):
     environment_id: str
     schema_name: str
     expires_at: datetime
     impersonate_user_id: Optional[str] = None
     impersonate_email: Optional[str] = None
+    pooled: bool = False
+    read_only: bool = False
+    # "provisioning" while a deferred build is still running
+    status: str = "ready"
 
 
 class TemplateCreateResult(BaseModel):
@@ -0,0 +1,486 @@
+"""
+Precompiled clone plans for building environment schemas from templates.
+
+A plan captures everything needed to materialise a template into a fresh
+schema (DDL, INSERT…SELECT order, sequence resets) so that a pool miss costs
+one catalog fingerprint query plus one server-side batch instead of repeated
+reflection and per-table catalog round-trips.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Iterable
+
+from sqlalchemy import Engine, MetaData, create_mock_engine, text
+from sqlalchemy.dialects.postgresql.named_types import NamedType
+
+from eval_platform.db.schema import PRIMARY_SHARD
+
+from .session import SessionManager
+
+logger = logging.getLogger(__name__)
+
+TARGET_PLACEHOLDER = "__clone_target__"
+# Snapshot tables (``<table>_snapshot_<suffix>``) live next to environment
+# tables but are never part of a plan.
+SNAPSHOT_MARKER = "_snapshot_"
+# Statement-level triggers (and their function) of this name count writes per
+# table into CHANGE_COUNTER_TABLE, letting diffs skip untouched tables.
+CHANGE_COUNTER_TRIGGER = "_snapshot_count_changes"
+CHANGE_COUNTER_TABLE = "_snapshot_counters"
+# Row-level triggers (and their function) of this name log row images into
+# CHANGE_CAPTURE_TABLE for capture mode diffs; CHANGE_CAPTURE_POSITIONS keeps
+# the transaction snapshots that delimit runs in that log.
+CHANGE_CAPTURE_TRIGGER = "_snapshot_capture_changes"
+CHANGE_CAPTURE_TABLE = "_snapshot_changes"
+CHANGE_CAPTURE_POSITIONS = "_snapshot_capture_positions"
+
+
+@dataclass(frozen=True)
+class ClonePlan:
+    template_schema: str
+    fingerprint: str
+    table_order: tuple[str, ...] | None
+    ddl: tuple[str, ...]
+    tables: tuple[str, ...]
+    sequence_columns: tuple[tuple[str, str], ...]
+    # (referenced_table, referencing_table) pairs within the template schema
+    foreign_keys: tuple[tuple[str, str], ...] = ()
+
+    @cached_property
+    def shape(self) -> str:
+        """Digest of the plan's DDL, independent of table and index order.
+
+        Templates of one service normally share a shape, so an empty schema
+        built from one of them can be seeded from any other.
+        """
+        return hashlib.md5("\n".join(sorted(self.ddl)).encode()).hexdigest()
+
+    def render(
+        self,
+        target_schema: str,
+        *,
+        create_schema: bool = True,
+        copy_sequences: bool = False,
+    ) -> str:
+        """Render the plan as a single SQL batch targeting ``target_schema``.
+
+        With ``copy_sequences`` the target's sequences continue exactly where
+        the source's left off instead of restarting after the highest id.
+        """
+        return (
+            self.render_structure(target_schema, create_schema=create_schema)
+            + "\n"
+            + self.render_data(target_schema, copy_sequences=copy_sequences)
+        )
+
+    def render_structure(
+        self, target_schema: str, *, create_schema: bool = True
+    ) -> str:
+        """Render only the DDL, producing an empty schema of this plan's shape."""
+        target = _quote(target_schema)
+        statements: list[str] = []
+        if create_schema:
+            statements.append(f"CREATE SCHEMA {target}")
+        statements.extend(stmt.replace(TARGET_PLACEHOLDER, target) for stmt in self.ddl)
+        statements.extend(
+            f"ALTER TABLE {target}.{_quote(tbl)} REPLICA IDENTITY FULL"
+            for tbl in self.tables
+        )
+        return ";\n".join(statements) + ";"
+
+    def render_data(self, target_schema: str, *, copy_sequences: bool = False) -> str:
+        """Render the data copy and sequence setup into an existing empty schema."""
+        statements = self.copy_statements(
+            _quote(self.template_schema), _quote(target_schema), self.tables
+        )
+        if copy_sequences:
+            reset = self.sequence_copy_statement(target_schema)
+        else:
+            reset = self.sequence_reset_statement(target_schema, self.tables)
+        if reset:
+            statements.append(reset)
+        return ";\n".join(statements) + ";"
+
+    @staticmethod
+    def copy_statements(source: str, target: str, tables: Iterable[str]) -> list[str]:
+        """INSERT…SELECT statements wrapped in deferred constraint checking."""
+        statements = ["SET CONSTRAINTS ALL DEFERRED"]
+        statements.extend(
+            f"INSERT INTO {target}.{_quote(tbl)} SELECT * FROM {source}.{_quote(tbl)}"
+            for tbl in tables
+        )
+        statements.append("SET CONSTRAINTS ALL IMMEDIATE")
+        return statements
+
+    def sequence_reset_statement(
+        self, target_schema: str, tables: Iterable[str]
+    ) -> str | None:
+        """One SELECT that resets every owned sequence of ``tables`` in the target."""
+        return sequence_reset_statement(target_schema, self.sequence_columns, tables)
+
+    def sequence_copy_statement(self, target_schema: str) -> str | None:
+        """One SELECT that copies every owned sequence's state from the source."""
+        calls = []
+        for tbl, column in self.sequence_columns:
+            column_literal = column.replace("'", "''")
+            source_seq = (
+                f"pg_get_serial_sequence('{_relation_literal(self.template_schema, tbl)}', "
+                f"'{column_literal}')::regclass"
+            )
+            target_seq = (
+                f"pg_get_serial_sequence('{_relation_literal(target_schema, tbl)}', "
+                f"'{column_literal}')"
+            )
+            calls.append(
+                f"setval({target_seq}, COALESCE(pg_sequence_last_value({source_seq}), 1), "
+                f"pg_sequence_last_value({source_seq}) IS NOT NULL)"
+            )
+        if not calls:
+            return None
+        return "SELECT " + ", ".join(calls)
+
+    def checksum_statement(self, schema: str) -> str:
+        """One query returning (table_name, row_count, checksum) for every table.
+
+        Row hashes are aggregated in sorted order so the checksum does not
+        depend on physical row order or on the table having a primary key.
+        """
+        source = _quote(schema)
+        parts = []
+        for tbl in self.tables:
+            literal = tbl.replace("'", "''")
+            parts.append(
+                f"SELECT '{literal}' AS table_name, COUNT(*) AS row_count, "
+                f"md5(COALESCE(string_agg(h, '' ORDER BY h), '')) AS checksum "
+                f"FROM (SELECT md5(row_to_json(t)::text) AS h "
+                f"FROM {source}.{_quote(tbl)} AS t) rows"
+            )
+        return " UNION ALL ".join(parts)
+
+    def with_dependents(self, tables: Iterable[str]) -> list[str]:
+        """Expand ``tables`` with every table referencing them, in copy order."""
+        return with_referencing_tables(tables, self.foreign_keys, self.tables)
+
+
+class ClonePlanner:
+    """Compiles and caches one ClonePlan per template schema.
+
+    Plans are keyed by template schema and invalidated when the template's
+    catalog fingerprint or explicit table order changes, or when
+    ``invalidate`` is called (e.g. after a template is re-registered).
+    Data shards hold identical copies of each template, so a plan compiled
+    against one shard renders for all of them.
+    """
+
+    def __init__(self, session_manager: SessionManager):
+        self.session_manager = session_manager
+        self._plans: dict[str, ClonePlan] = {}
+        self._checksums: dict[tuple[str, str], dict[str, tuple[int, str]]] = {}
+        self._lock = threading.Lock()
+
+    def get_plan(
+        self,
+        template_schema: str,
+        tables_order: list[str] | None = None,
+        *,
+        shard: str = PRIMARY_SHARD,
+    ) -> ClonePlan:
+        """Plan for ``template_schema``; ``shard`` is any shard holding a copy of it."""
+        order_key = tuple(tables_order) if tables_order else None
+        engine = self.session_manager.engine_for_shard(shard)
+        with engine.connect() as conn:
+            fingerprint = self._fingerprint(conn, template_schema)
+
+        cached = self._plans.get(template_schema)
+        if (
+            cached is not None
+            and cached.fingerprint == fingerprint
+            and cached.table_order == order_key
+        ):
+            return cached
+
+        with self._lock:
+            cached = self._plans.get(template_schema)
+            if (
+                cached is not None
+                and cached.fingerprint == fingerprint
+                and cached.table_order == order_key
+            ):
+                return cached
+            t0 = time.perf_counter()
+            plan = self._compile(engine, template_schema, fingerprint, order_key)
+            self._plans[template_schema] = plan
+            logger.info(
+                "Compiled clone plan for %s (%d tables, %d ddl statements) in %.2fs",
+                template_schema,
+                len(plan.tables),
+                len(plan.ddl),
+                time.perf_counter() - t0,
+            )
+            return plan
+
+    def compile_uncached(self, schema: str, *, shard: str = PRIMARY_SHARD) -> ClonePlan:
+        """Compile a plan for copying ``schema`` itself, bypassing the cache.
+
+        Used for one-off copies of live environments, whose plans would only
+        accumulate in the cache.
+        """
+        engine = self.session_manager.engine_for_shard(shard)
+        with engine.connect() as conn:
+            fingerprint = self._fingerprint(conn, schema)
+        return self._compile(engine, schema, fingerprint, None)
+
+    def template_checksums(
+        self, plan: ClonePlan, *, shard: str = PRIMARY_SHARD
+    ) -> dict[str, tuple[int, str]]:
+        """Per-table (row_count, checksum) of the template, cached per plan.
+
+        Templates are treated as immutable once registered; ``invalidate``
+        drops the cached values together with the plan.
+        """
+        key = (plan.template_schema, plan.fingerprint)
+        cached = self._checksums.get(key)
+        if cached is not None:
+            return cached
+        with self.session_manager.engine_for_shard(shard).connect() as conn:
+            checksums = fetch_checksums(conn, plan, plan.template_schema)
+        with self._lock:
+            self._checksums[key] = checksums
+        return checksums
+
+    def invalidate(self, template_schema: str | None = None) -> None:
+        with self._lock:
+            if template_schema is None:
+                self._plans.clear()
+                self._checksums.clear()
+            else:
+                self._plans.pop(template_schema, None)
+                for key in [k for k in self._checksums if k[0] == template_schema]:
+                    del self._checksums[key]
+
+    def _compile(
+        self,
+        engine: Engine,
+        template_schema: str,
+        fingerprint: str,
+        table_order: tuple[str, ...] | None,
+    ) -> ClonePlan:
+        meta = MetaData()
+        meta.reflect(
+            bind=engine,
+            schema=template_schema,
+            only=lambda name, _: SNAPSHOT_MARKER not in name,
+        )
+
+        # Environments defer FK checks while seeding and agents rely on the
+        # same behaviour, so bake it into the DDL instead of altering later.
+        for table in meta.tables.values():
+            for fk in table.foreign_key_constraints:
+                fk.deferrable = True
+                fk.initially = "DEFERRED"
+
+        captured = []
+
+        def _capture(sql, *multiparams, **params):
+            captured.append(sql)
+
+        mock = create_mock_engine(engine.url, _capture)
+        meta.create_all(mock, checkfirst=False)
+
+        ddl: list[str] = []
+        with engine.connect() as conn:
+            for stmt in captured:
+                element = getattr(stmt, "element", None)
+                # Types outside the template schema (e.g. enums in public) are
+                # shared, mirror create_all(checkfirst=True) and skip existing.
+                if (
+                    isinstance(element, NamedType)
+                    and element.schema != template_schema
+                    and engine.dialect.has_type(conn, element.name, element.schema)
+                ):
+                    continue
+                compiled = stmt.compile(
+                    dialect=engine.dialect,
+                    schema_translate_map={template_schema: TARGET_PLACEHOLDER},
+                    render_schema_translate=True,
+                )
+                ddl.append(str(compiled).strip())
+            sequence_columns = owned_sequence_columns(conn, template_schema)
+
+        foreign_keys = sorted(
+            {
+                (fk.referred_table.name, table.name)
+                for table in meta.tables.values()
+                for fk in table.foreign_key_constraints
+                if fk.referred_table.schema == template_schema
+            }
+        )
+
+        available = [t.name for t in meta.sorted_tables]
+        available_set = set(available)
+        ordered: list[str] = []
+        seen: set[str] = set()
+        for tbl in list(table_order or ()) + available:
+            if tbl in available_set and tbl not in seen:
+                ordered.append(tbl)
+                seen.add(tbl)
+
+        return ClonePlan(
+            template_schema=template_schema,
+            fingerprint=fingerprint,
+            table_order=table_order,
+            ddl=tuple(ddl),
+            tables=tuple(ordered),
+            sequence_columns=sequence_columns,
+            foreign_keys=tuple(foreign_keys),
+        )
+
+    @staticmethod
+    def _fingerprint(conn, schema: str) -> str:
+        return conn.execute(
+            text(
+                """
+                SELECT md5(COALESCE(string_agg(entry, ',' ORDER BY entry), ''))
+                FROM (
+                    SELECT c.relname || '.' || a.attname || ':'
+                           || format_type(a.atttypid, a.atttypmod) || ':'
+                           || a.attnotnull::text || ':'
+                           || COALESCE(pg_get_expr(d.adbin, d.adrelid), '') AS entry
+                    FROM pg_class c
+                    JOIN pg_namespace n ON n.oid = c.relnamespace
+                    JOIN pg_attribute a
+                      ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+                    LEFT JOIN pg_attrdef d
+                      ON d.adrelid = c.oid AND d.adnum = a.attnum
+                    WHERE n.nspname = :schema AND c.relkind = 'r'
+                      AND strpos(c.relname, '_snapshot_') = 0
+                    UNION ALL
+                    SELECT cl.relname || '#' || con.conname || ':'
+                           || pg_get_constraintdef(con.oid)
+                    FROM pg_constraint con
+                    JOIN pg_class cl ON cl.oid = con.conrelid
+                    JOIN pg_namespace n ON n.oid = cl.relnamespace
+                    WHERE n.nspname = :schema
+                    UNION ALL
+                    SELECT '@' || pg_get_indexdef(i.indexrelid)
+                    FROM pg_index i
+                    JOIN pg_class ci ON ci.oid = i.indexrelid
+                    JOIN pg_namespace n ON n.oid = ci.relnamespace
+                    WHERE n.nspname = :schema
+                ) entries
+                """
+            ),
+            {"schema": schema},
+        ).scalar_one()
+
+
+def owned_sequence_columns(conn, schema: str) -> tuple[tuple[str, str], ...]:
+    """(table, column) pairs for every sequence owned by a column in ``schema``."""
+    rows = conn.execute(
+        text(
+            """
+            SELECT tbl.relname AS table_name, att.attname AS column_name
+            FROM pg_depend dep
+            JOIN pg_class seq ON seq.oid = dep.objid AND seq.relkind = 'S'
+            JOIN pg_class tbl ON tbl.oid = dep.refobjid
+            JOIN pg_namespace n ON n.oid = tbl.relnamespace
+            JOIN pg_attribute att
+              ON att.attrelid = tbl.oid AND att.attnum = dep.refobjsubid
+            WHERE n.nspname = :schema
+              AND dep.classid = 'pg_class'::regclass
+              AND dep.refclassid = 'pg_class'::regclass
+              AND dep.deptype IN ('a', 'i')
+            ORDER BY tbl.relname, att.attname
+            """
+        ),
+        {"schema": schema},
+    ).fetchall()
+    return tuple((r[0], r[1]) for r in rows)
+
+
+def foreign_key_pairs(conn, schema: str) -> tuple[tuple[str, str], ...]:
+    """(referenced_table, referencing_table) pairs for FKs within ``schema``."""
+    rows = conn.execute(
+        text(
+            """
+            SELECT DISTINCT parent.relname, child.relname
+            FROM pg_constraint con
+            JOIN pg_class child ON child.oid = con.conrelid
+            JOIN pg_class parent ON parent.oid = con.confrelid
+            JOIN pg_namespace n ON n.oid = child.relnamespace
+            WHERE con.contype = 'f'
+              AND n.nspname = :schema
+              AND parent.relnamespace = child.relnamespace
+            """
+        ),
+        {"schema": schema},
+    ).fetchall()
+    return tuple((r[0], r[1]) for r in rows)
+
+
+def with_referencing_tables(
+    tables: Iterable[str],
+    foreign_keys: Iterable[tuple[str, str]],
+    order: Iterable[str],
+) -> list[str]:
+    """Expand ``tables`` with every table referencing them, following ``order``.
+
+    Truncating a table requires truncating its referencing tables too, so
+    a partial rewrite has to cover the whole dependent closure.
+    """
+    referencing: dict[str, set[str]] = {}
+    for parent, child in foreign_keys:
+        referencing.setdefault(parent, set()).add(child)
+    selected = set(tables)
+    stack = list(selected)
+    while stack:
+        for child in referencing.get(stack.pop(), ()):
+            if child not in selected:
+                selected.add(child)
+                stack.append(child)
+    return [tbl for tbl in order if tbl in selected]
+
+
+def sequence_reset_statement(
+    schema: str,
+    sequence_columns: Iterable[tuple[str, str]],
+    tables: Iterable[str],
+) -> str | None:
+    """One SELECT that restarts each owned sequence of ``tables`` after its max id."""
+    wanted = set(tables)
+    target = _quote(schema)
+    calls = []
+    for tbl, column in sequence_columns:
+        if tbl not in wanted:
+            continue
+        column_literal = column.replace("'", "''")
+        calls.append(
+            f"setval(pg_get_serial_sequence('{_relation_literal(schema, tbl)}', "
+            f"'{column_literal}'), "
+            f"COALESCE((SELECT MAX({_quote(column)}) FROM {target}.{_quote(tbl)}), 0) + 1, false)"
+        )
+    if not calls:
+        return None
+    return "SELECT " + ", ".join(calls)
+
+
+def fetch_checksums(conn, plan: ClonePlan, schema: str) -> dict[str, tuple[int, str]]:
+    if not plan.tables:
+        return {}
+    rows = conn.exec_driver_sql(plan.checksum_statement(schema)).fetchall()
+    return {row[0]: (int(row[1]), row[2]) for row in rows}
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _relation_literal(schema: str, table: str) -> str:
+    return f"{_quote(schema)}.{_quote(table)}".replace("'", "''")
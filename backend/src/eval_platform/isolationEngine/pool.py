@@ -1,23 +1,42 @@
 from __future__ import annotations
 
 from datetime import datetime
+import heapq
 import logging
+import threading
+from typing import Mapping
 from uuid import UUID, uuid4
 
-from sqlalchemy import select
+from sqlalchemy import Integer, String, column, func, select, true, update, values
 from sqlalchemy.orm import Session
 
-from eval_platform.db.schema import EnvironmentPoolEntry
+from eval_platform.db.schema import (
+    PRIMARY_SHARD,
+    EnvironmentPoolEntry,
+    RunTimeEnvironment,
+)
 
 from .session import SessionManager
 
 
 logger = logging.getLogger(__name__)
 
+# Pool entries whose ``template_schema`` starts with this prefix are empty,
+# fully migrated schemas shared by every template of one service and shape.
+EMPTY_TIER_PREFIX = "empty:"
+
+
+def empty_tier_key(service: str, shape: str) -> str:
+    """Pool key for empty schemas of ``service`` with the given DDL shape."""
+    return f"{EMPTY_TIER_PREFIX}{service}:{shape[:16]}"
+
 
 class PoolManager:
     def __init__(self, sessions: SessionManager):
         self.sessions = sessions
+        # template_schema -> [claims, misses] since the last drain
+        self._claim_counts: dict[str, list[int]] = {}
+        self._claim_counts_lock = threading.Lock()
 
     def claim_ready_schema(
         self,
@@ -36,6 +55,7 @@ class PoolManager:
                 .with_for_update(skip_locked=True)
             )
             entry = session.execute(stmt).scalars().first()
+            self._record_claims(template_schema, claims=1, misses=int(entry is None))
             if entry is None:
                 logger.debug("No ready pool entries for template %s", template_schema)
                 return None
@@ -54,6 +74,78 @@ class PoolManager:
             )
             return entry
 
+    def claim_ready_schemas(
+        self,
+        template_counts: Mapping[str, int],
+        *,
+        requested_by: str | None = None,
+    ) -> dict[str, list[tuple[str, UUID | None, str]]]:
+        """Claim up to ``count`` ready schemas per template in one statement.
+
+        Returns (schema_name, template_id, shard) per template; templates with
+        fewer ready entries than requested get a shorter (possibly empty) list.
+        """
+        wanted_counts = {k: v for k, v in template_counts.items() if v > 0}
+        claimed: dict[str, list[tuple[str, UUID | None, str]]] = {
+            template: [] for template in wanted_counts
+        }
+        if not wanted_counts:
+            return claimed
+
+        wanted = values(
+            column("template_schema", String),
+            column("n", Integer),
+            name="wanted",
+        ).data(list(wanted_counts.items()))
+        picked = (
+            select(EnvironmentPoolEntry.id)
+            .where(
+                EnvironmentPoolEntry.template_schema == wanted.c.template_schema,
+                EnvironmentPoolEntry.status == "ready",
+            )
+            .order_by(EnvironmentPoolEntry.updated_at.asc())
+            .limit(wanted.c.n)
+            .with_for_update(skip_locked=True)
+            .lateral("picked")
+        )
+        now = datetime.now()
+        stmt = (
+            update(EnvironmentPoolEntry)
+            .where(
+                EnvironmentPoolEntry.id.in_(
+                    select(picked.c.id).select_from(wanted).join(picked, true())
+                )
+            )
+            .values(
+                status="in_use",
+                claimed_by=requested_by,
+                claimed_at=now,
+                last_used_at=now,
+            )
+            .returning(
+                EnvironmentPoolEntry.template_schema,
+                EnvironmentPoolEntry.schema_name,
+                EnvironmentPoolEntry.template_id,
+                EnvironmentPoolEntry.shard,
+            )
+        )
+        with self.sessions.with_meta_session() as session:
+            rows = session.execute(stmt).all()
+
+        for template_schema, schema_name, template_id, shard in rows:
+            claimed[template_schema].append((schema_name, template_id, shard))
+        for template_schema, count in wanted_counts.items():
+            hits = len(claimed[template_schema])
+            self._record_claims(template_schema, claims=count, misses=count - hits)
+            logger.info(
+                "Claimed %d/%d pooled schemas for template %s (requested_by=%s)",
+                hits,
+                count,
+                template_schema,
+                requested_by,
+            )
+        return claimed
+
     def register_entry(
         self,
         *,
@@ -61,6 +153,7 @@ class PoolManager:
         template_schema: str,
         template_id: UUID | None = None,
         status: str = "in_use",
+        shard: str = PRIMARY_SHARD,
     ) -> EnvironmentPoolEntry:
         with self.sessions.with_meta_session() as session:
             entry = (
@@ -76,6 +169,7 @@ class PoolManager:
                     template_schema=template_schema,
                     schema_name=schema_name,
                     status=status,
+                    shard=shard,
                     created_at=now,
                     updated_at=now,
                 )
@@ -90,6 +184,7 @@ class PoolManager:
                 entry.template_id = template_id
                 entry.template_schema = template_schema
                 entry.status = status
+                entry.shard = shard
                 entry.updated_at = now
                 logger.debug("Updated pool entry %s -> status %s", schema_name, status)
             session.flush()
@@ -112,6 +207,36 @@ class PoolManager:
             self._update_status(schema_name, "refreshing")
             logger.info("Marked schema %s as refreshing", schema_name)
 
+    def release_many(self, schema_names: list[str], *, recycle: bool) -> int:
+        """Bulk ``release_in_use`` in one statement. Returns the rows updated."""
+        if not schema_names:
+            return 0
+        status = "dirty" if recycle else "refreshing"
+        with self.sessions.with_meta_session() as session:
+            result = session.execute(
+                update(EnvironmentPoolEntry)
+                .where(EnvironmentPoolEntry.schema_name.in_(schema_names))
+                .values(status=status, updated_at=datetime.now())
+            )
+        logger.info("Marked %d schemas as %s", result.rowcount, status)
+        return result.rowcount
+
+    def discard_ready(self, schema_names: list[str]) -> int:
+        """Mark entries still ready as dirty so they are rebuilt before any claim."""
+        if not schema_names:
+            return 0
+        with self.sessions.with_meta_session() as session:
+            result = session.execute(
+                update(EnvironmentPoolEntry)
+                .where(
+                    EnvironmentPoolEntry.schema_name.in_(schema_names),
+                    EnvironmentPoolEntry.status == "ready",
+                )
+                .values(status="dirty", updated_at=datetime.now())
+            )
+        logger.info("Discarded %d ready pool schemas", result.rowcount)
+        return result.rowcount
+
     def ready_count(
         self, *, template_schema: str, session: Session | None = None
     ) -> int:
@@ -132,9 +257,131 @@ class PoolManager:
             if own_session:
                 session.close()
 
+    def ready_counts(self, template_schemas: list[str]) -> dict[str, int]:
+        """Ready entries per template in one grouped query."""
+        if not template_schemas:
+            return {}
+        with self.sessions.with_meta_session() as session:
+            rows = (
+                session.query(
+                    EnvironmentPoolEntry.template_schema,
+                    func.count(EnvironmentPoolEntry.id),
+                )
+                .filter(
+                    EnvironmentPoolEntry.template_schema.in_(template_schemas),
+                    EnvironmentPoolEntry.status == "ready",
+                )
+                .group_by(EnvironmentPoolEntry.template_schema)
+                .all()
+            )
+        counts = {template: 0 for template in template_schemas}
+        counts.update({template: count for template, count in rows})
+        return counts
+
+    def retire_ready(
+        self, *, template_schema: str, limit: int
+    ) -> list[tuple[str, str]]:
+        """Remove up to ``limit`` ready entries and return their (schema name, shard).
+
+        The caller is responsible for dropping the schemas.
+        """
+        if limit <= 0:
+            return []
+        with self.sessions.with_meta_session() as session:
+            entries = (
+                session.query(EnvironmentPoolEntry)
+                .filter(
+                    EnvironmentPoolEntry.template_schema == template_schema,
+                    EnvironmentPoolEntry.status == "ready",
+                )
+                .order_by(EnvironmentPoolEntry.updated_at.desc())
+                .with_for_update(skip_locked=True)
+                .limit(limit)
+                .all()
+            )
+            names = [(entry.schema_name, entry.shard) for entry in entries]
+            for entry in entries:
+                session.delete(entry)
+            session.flush()
+        if names:
+            logger.info(
+                "Retired %d surplus pool entries for template %s",
+                len(names),
+                template_schema,
+            )
+        return names
+
+    def shard_loads(self, shards: list[str]) -> dict[str, int]:
+        """Schemas currently held per shard: live owned environments plus idle pool entries."""
+        loads = {shard: 0 for shard in shards}
+        if not shards:
+            return loads
+        with self.sessions.with_meta_session() as session:
+            live = (
+                session.query(
+                    RunTimeEnvironment.shard, func.count(RunTimeEnvironment.id)
+                )
+                .filter(
+                    RunTimeEnvironment.shard.in_(shards),
+                    RunTimeEnvironment.status.in_(("initializing", "ready", "expired")),
+                    RunTimeEnvironment.read_only.is_(False),
+                )
+                .group_by(RunTimeEnvironment.shard)
+                .all()
+            )
+            idle = (
+                session.query(
+                    EnvironmentPoolEntry.shard, func.count(EnvironmentPoolEntry.id)
+                )
+                .filter(
+                    EnvironmentPoolEntry.shard.in_(shards),
+                    EnvironmentPoolEntry.status != "in_use",
+                )
+                .group_by(EnvironmentPoolEntry.shard)
+                .all()
+            )
+        for shard, count in [*live, *idle]:
+            loads[shard] += count
+        return loads
+
+    def place_schemas(self, shards: list[str], count: int) -> list[str]:
+        """Pick a shard for each of ``count`` new schemas, least loaded first.
+
+        Loads are read once and updated locally, so a batch spreads across
+        shards instead of piling onto the one that was emptiest at the start.
+        """
+        if count <= 0:
+            return []
+        if not shards:
+            raise ValueError("no data shard available for placement")
+        if len(shards) == 1:
+            return [shards[0]] * count
+        heap = [(load, shard) for shard, load in self.shard_loads(shards).items()]
+        heapq.heapify(heap)
+        placed: list[str] = []
+        for _ in range(count):
+            load, shard = heapq.heappop(heap)
+            placed.append(shard)
+            heapq.heappush(heap, (load + 1, shard))
+        return placed
+
+    def drain_claim_stats(self) -> dict[str, tuple[int, int]]:
+        """Return (claims, misses) per template since the previous drain."""
+        with self._claim_counts_lock:
+            counts = {k: (v[0], v[1]) for k, v in self._claim_counts.items()}
+            self._claim_counts.clear()
+        return counts
+
+    def _record_claims(self, template_schema: str, *, claims: int, misses: int) -> None:
+        with self._claim_counts_lock:
+            counts = self._claim_counts.setdefault(template_schema, [0, 0])
+            counts[0] += claims
+            counts[1] += misses
+
     def schemas_for_refresh(
         self, *, template_schema: str, limit: int | None
-    ) -> list[tuple[str, UUID | None]]:
+    ) -> list[tuple[str, UUID | None, str]]:
+        """Claim dirty/refreshing entries for rebuild as (schema, template_id, shard)."""
         if limit is not None and limit <= 0:
             return []
         with self.sessions.with_meta_session() as session:
@@ -151,11 +398,11 @@ class PoolManager:
                 query = query.limit(limit)
             entries = query.all()
             now = datetime.now()
-            result: list[tuple[str, UUID | None]] = []
+            result: list[tuple[str, UUID | None, str]] = []
             for entry in entries:
                 entry.status = "refreshing"
                 entry.updated_at = now
-                result.append((entry.schema_name, entry.template_id))
+                result.append((entry.schema_name, entry.template_id, entry.shard))
             session.flush()
             return result
 
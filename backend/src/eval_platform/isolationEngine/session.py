@@ -1,21 +1,117 @@
 from __future__ import annotations
 
-from contextlib import contextmanager
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, replace
 from datetime import datetime
+from typing import Mapping
 from uuid import UUID
 
-from sqlalchemy import Engine
+from sqlalchemy import Engine, bindparam, make_url, select, update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import Session, sessionmaker
 
-from eval_platform.db.schema import RunTimeEnvironment
+from eval_platform.db.schema import PRIMARY_SHARD, RunTimeEnvironment
+
+logger = logging.getLogger(__name__)
+
+# Stale cache entries are pruned once this many environments are cached.
+_MAX_RESOLVED_ENVIRONMENTS = 10_000
+# Schema-translated engines kept for reuse, least recently used evicted first.
+_MAX_TRANSLATED_ENGINES = 1_024
+
+
+class EnvironmentHibernated(PermissionError):
+    """The environment's schema was exported and dropped; restore it before use."""
+
+    def __init__(self, env_id: str):
+        super().__init__(f"environment '{env_id}' is hibernated")
+        self.env_id = env_id
+
+
+@dataclass(frozen=True)
+class ResolvedEnvironment:
+    """What a request needs to know about a ready environment."""
+
+    schema: str
+    read_only: bool
+    shard: str
+    impersonate_user_id: str | None
+    impersonate_email: str | None
+    expires_at: datetime | None
+    last_used_at: datetime | None = None
+    pristine: bool = False
 
 
 class SessionManager:
     def __init__(
         self,
         base_engine: Engine,
+        shard_engines: Mapping[str, Engine] | None = None,
+        *,
+        async_engine: AsyncEngine | None = None,
+        resolve_ttl: float = 5.0,
+        touch_flush_interval: float = 5.0,
     ):
         self.base_engine = base_engine
+        self._meta_sessionmaker = sessionmaker(bind=base_engine, expire_on_commit=False)
+        # Optional async engine on the platform database, used by the platform
+        # API so meta-DB queries do not block the event loop.
+        self.async_engine = async_engine
+        self._async_sessionmaker = (
+            async_sessionmaker(bind=async_engine, expire_on_commit=False)
+            if async_engine is not None
+            else None
+        )
+        # Data databases environment schemas are placed in; the platform
+        # database always doubles as the primary shard.
+        self.shard_engines: dict[str, Engine] = {
+            **(shard_engines or {}),
+            PRIMARY_SHARD: base_engine,
+        }
+        # Seconds a resolved environment is served from memory. Status changes
+        # made by this process invalidate immediately; other processes'
+        # changes are picked up within the TTL.
+        self.resolve_ttl = resolve_ttl
+        # Seconds last_used_at updates are coalesced before one batched
+        # write; 0 writes through on every access.
+        self.touch_flush_interval = touch_flush_interval
+        self._resolved: dict[UUID, tuple[float, ResolvedEnvironment]] = {}
+        self._touched: dict[UUID, datetime] = {}
+        self._flush_timer: threading.Timer | None = None
+        self._cache_lock = threading.Lock()
+        self._translated: OrderedDict[tuple[str, str, bool], Engine] = OrderedDict()
+        self._translated_lock = threading.Lock()
+
+    @property
+    def shards(self) -> list[str]:
+        return list(self.shard_engines)
+
+    def engine_for_shard(self, shard: str) -> Engine:
+        try:
+            return self.shard_engines[shard]
+        except KeyError:
+            raise ValueError(f"unknown data shard '{shard}'") from None
+
+    def engine_for_environment(self, env_id: str) -> Engine:
+        """Engine of the data database holding an environment's schema."""
+        if len(self.shard_engines) == 1:
+            return self.base_engine
+        cached = self._resolved.get(self._to_uuid(str(env_id)))
+        if cached is not None:
+            return self.engine_for_shard(cached[1].shard)
+        with Session(bind=self.base_engine) as s:
+            shard = s.execute(
+                select(RunTimeEnvironment.shard).where(
+                    RunTimeEnvironment.id == self._to_uuid(str(env_id))
+                )
+            ).scalar_one_or_none()
+        if shard is None:
+            raise ValueError(f"environment '{env_id}' not found")
+        return self.engine_for_shard(shard)
 
     def get_meta_session(self):
         """
@@ -23,7 +119,7 @@ class SessionManager:
         Caller MUST manually commit/rollback and close the session.
         Use with_meta_session() instead for automatic cleanup.
         """
-        return sessionmaker(bind=self.base_engine)(expire_on_commit=False)
+        return self._meta_sessionmaker()
 
     @contextmanager
     def with_meta_session(self):
@@ -37,8 +133,136 @@ class SessionManager:
         finally:
             session.close()
 
+    def get_async_meta_session(self) -> AsyncSession:
+        """
+        Returns a raw async session for platform database.
+        Caller MUST manually commit/rollback and close the session.
+        Use with_async_meta_session() instead for automatic cleanup.
+        """
+        if self._async_sessionmaker is None:
+            raise RuntimeError("no async engine configured for the platform database")
+        return self._async_sessionmaker()
+
+    @asynccontextmanager
+    async def with_async_meta_session(self):
+        session = self.get_async_meta_session()
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+
     def lookup_environment(self, env_id: str):
-        env_uuid = self._to_uuid(env_id)
+        resolved = self.resolve_environment(env_id)
+        return resolved.schema, resolved.last_used_at
+
+    def resolve_environment(self, env_id: str) -> ResolvedEnvironment:
+        """Resolve a ready environment, from memory when recently seen.
+
+        Raises PermissionError for unknown, expired, deleted or not-ready
+        environments, ``EnvironmentHibernated`` for hibernated ones. Records
+        the access for the next ``last_used_at`` flush.
+        """
+        env_uuid = self._to_uuid(str(env_id))
+        now = datetime.now()
+        cached = self._resolved.get(env_uuid)
+        if (
+            cached is not None
+            and time.monotonic() - cached[0] < self.resolve_ttl
+            and (cached[1].expires_at is None or cached[1].expires_at > now)
+        ):
+            resolved = cached[1]
+        else:
+            resolved = self._load_environment(env_id, env_uuid)
+            with self._cache_lock:
+                if len(self._resolved) >= _MAX_RESOLVED_ENVIRONMENTS:
+                    cutoff = time.monotonic() - self.resolve_ttl
+                    self._resolved = {
+                        k: v for k, v in self._resolved.items() if v[0] >= cutoff
+                    }
+                self._resolved[env_uuid] = (time.monotonic(), resolved)
+        self._touch(env_uuid, now)
+        return replace(resolved, last_used_at=now)
+
+    def invalidate_environment(self, env_id: str | UUID) -> None:
+        """Forget a cached resolution, e.g. after the environment was deleted or expired."""
+        env_uuid = env_id if isinstance(env_id, UUID) else self._to_uuid(str(env_id))
+        with self._cache_lock:
+            self._resolved.pop(env_uuid, None)
+
+    def flush_last_used(self) -> int:
+        """Write pending ``last_used_at`` updates in one batch. Returns the rows written."""
+        with self._cache_lock:
+            touched, self._touched = self._touched, {}
+            self._flush_timer = None
+        if not touched:
+            return 0
+        table = RunTimeEnvironment.__table__
+        stmt = (
+            update(table)
+            .where(table.c.id == bindparam("env_id"))
+            .values(last_used_at=bindparam("used_at"))
+        )
+        try:
+            with self.base_engine.begin() as conn:
+                conn.execute(
+                    stmt,
+                    [
+                        {"env_id": env_uuid, "used_at": used_at}
+                        for env_uuid, used_at in touched.items()
+                    ],
+                )
+        except Exception as exc:
+            logger.warning(
+                "Failed to flush last_used_at for %d environments: %s",
+                len(touched),
+                exc,
+            )
+            return 0
+        return len(touched)
+
+    def _clear_pristine(self, env_uuid: UUID) -> None:
+        """Record that an environment may no longer match its template.
+
+        Written through before the data session opens, so a before snapshot
+        taken afterwards never mistakes the environment for an untouched one.
+        """
+        with self.base_engine.begin() as conn:
+            conn.execute(
+                update(RunTimeEnvironment)
+                .where(
+                    RunTimeEnvironment.id == env_uuid,
+                    RunTimeEnvironment.pristine.is_(True),
+                )
+                .values(pristine=False)
+            )
+        with self._cache_lock:
+            cached = self._resolved.get(env_uuid)
+            if cached is not None:
+                self._resolved[env_uuid] = (
+                    cached[0],
+                    replace(cached[1], pristine=False),
+                )
+
+    def _touch(self, env_uuid: UUID, used_at: datetime) -> None:
+        if self.touch_flush_interval <= 0:
+            with self._cache_lock:
+                self._touched[env_uuid] = used_at
+            self.flush_last_used()
+            return
+        with self._cache_lock:
+            self._touched[env_uuid] = used_at
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(
+                    self.touch_flush_interval, self.flush_last_used
+                )
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def _load_environment(self, env_id: str, env_uuid: UUID) -> ResolvedEnvironment:
         with Session(bind=self.base_engine) as s:
             env = (
                 s.query(RunTimeEnvironment)
@@ -53,28 +277,63 @@ class SessionManager:
                 )
             if env.status == "deleted":
                 raise PermissionError(f"environment '{env_id}' has been deleted")
+            if env.status == "hibernated":
+                raise EnvironmentHibernated(env_id)
             if env.status != "ready":
                 raise PermissionError(
                     f"environment '{env_id}' is not ready (status: {env.status})"
                 )
-            env.last_used_at = datetime.now()
-            s.commit()
-            return env.schema, env.last_used_at
+            return ResolvedEnvironment(
+                schema=env.schema,
+                read_only=env.read_only,
+                shard=env.shard,
+                impersonate_user_id=env.impersonate_user_id,
+                impersonate_email=env.impersonate_email,
+                expires_at=env.expires_at,
+                pristine=env.pristine,
+            )
 
-    def get_session_for_schema(self, schema: str):
+    def get_session_for_schema(self, schema: str, shard: str = PRIMARY_SHARD):
         """
         Returns a raw session bound to a specific schema.
         Caller MUST manually commit/rollback and close the session.
         Use with_session_for_schema() instead for automatic cleanup.
         """
-        translated_engine = self.base_engine.execution_options(
-            schema_translate_map={None: schema}
-        )
-        return sessionmaker(bind=translated_engine)()
+        return Session(bind=self.translated_engine(schema, shard))
+
+    def translated_engine(
+        self, schema: str, shard: str = PRIMARY_SHARD, *, read_only: bool = False
+    ) -> Engine:
+        """Engine that maps unqualified tables to ``schema``, reused per schema.
+
+        Option engines share their parent's pool; reusing one per schema keeps
+        option setup and its cache-key generation out of every request.
+        """
+        key = (shard, schema, read_only)
+        with self._translated_lock:
+            engine = self._translated.get(key)
+            if engine is not None:
+                self._translated.move_to_end(key)
+                return engine
+        options: dict = {"schema_translate_map": {None: schema}}
+        if read_only:
+            options["postgresql_readonly"] = True
+        engine = self.engine_for_shard(shard).execution_options(**options)
+        with self._translated_lock:
+            self._translated[key] = engine
+            while len(self._translated) > _MAX_TRANSLATED_ENGINES:
+                self._translated.popitem(last=False)
+        return engine
+
+    def forget_schema(self, schema: str) -> None:
+        """Drop cached translated engines for a schema that no longer exists."""
+        with self._translated_lock:
+            for key in [k for k in self._translated if k[1] == schema]:
+                del self._translated[key]
 
     @contextmanager
-    def with_session_for_schema(self, schema: str):
-        session = self.get_session_for_schema(schema)
+    def with_session_for_schema(self, schema: str, shard: str = PRIMARY_SHARD):
+        session = self.get_session_for_schema(schema, shard)
         try:
             yield session
             session.commit()
@@ -89,10 +348,16 @@ class SessionManager:
         Returns a raw session bound to an environment's schema.
         Caller MUST manually commit/rollback and close the session.
         Use with_session_for_environment() instead for automatic cleanup.
+
+        Read-only environments are bound to their template schema and every
+        transaction on the session runs as READ ONLY, so writes are rejected.
+        The session is bound to the data shard holding the schema.
         """
-        schema, _ = self.lookup_environment(environment_id)
-        translated = self.base_engine.execution_options(
-            schema_translate_map={None: schema}
+        resolved = self.resolve_environment(environment_id)
+        if resolved.pristine and not resolved.read_only:
+            self._clear_pristine(self._to_uuid(str(environment_id)))
+        translated = self.translated_engine(
+            resolved.schema, resolved.shard, read_only=resolved.read_only
         )
         return Session(bind=translated, expire_on_commit=False)
 
@@ -114,3 +379,25 @@ class SessionManager:
             return UUID(value)
         except ValueError:
             return UUID(hex=value)
+
+
+def parse_shard_urls(raw: str | None) -> dict[str, str]:
+    """Parse ``name=url`` pairs, e.g. "shard_a=postgresql://...,shard_b=postgresql://..."."""
+    if not raw:
+        return {}
+    urls: dict[str, str] = {}
+    for part in raw.split(","):
+        name, sep, url = part.strip().partition("=")
+        name, url = name.strip(), url.strip()
+        if sep and name and url and name != PRIMARY_SHARD:
+            urls[name] = url
+    return urls
+
+
+def async_database_url(url: str) -> str:
+    """Rewrite a Postgres URL to use psycopg's asyncio driver."""
+    return (
+        make_url(url)
+        .set(drivername="postgresql+psycopg")
+        .render_as_string(hide_password=False)
+    )
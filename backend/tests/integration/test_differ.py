@@ -2,8 +2,8 @@
 
 import pytest
 from sqlalchemy import text
-from src.platform.evaluationEngine.differ import Differ
-from src.platform.db.schema import Diff
+from src.eval_platform.evaluationEngine.differ import Differ
+from src.eval_platform.db.schema import Diff
 
 MESSAGE_1 = "1699564800.000123"
 MESSAGE_2 = "1699568400.000456"
@@ -461,6 +461,67 @@ class TestComplexScenarios:
         assert len(diff.updates) == 1
         assert len(diff.deletes) == 1
 
+    def test_single_pass_matches_staged_diff(self, differ_env):
+        differ = differ_env["differ"]
+        schema = differ_env["schema"]
+        engine = differ_env["engine"]
+
+        differ.create_snapshot("before")
+
+        execute_sql(engine, schema, """
+            INSERT INTO {schema}.messages (message_id, channel_id, user_id, message_text, created_at)
+            VALUES ('M_PASS', 'C01ABCD1234', 'U01AGENBOT9', 'one pass', NOW())
+        """)
+
+        execute_sql(engine, schema, """
+            UPDATE {schema}.messages
+            SET message_text = NULL
+            WHERE message_id = '1699572000.000789'
+        """)
+
+        execute_sql(engine, schema, """
+            DELETE FROM {schema}.messages
+            WHERE message_id = '1699564800.000123'
+        """)
+
+        differ.create_snapshot("after")
+        differ.single_pass = True
+        single = differ.get_diff("before", "after")
+        differ.single_pass = False
+        staged = differ.get_diff("before", "after")
+
+        assert single.model_dump(mode="json") == staged.model_dump(mode="json")
+        assert [row["message_id"] for row in single.inserts] == ["M_PASS"]
+        assert single.updates[0]["after"]["message_text"] is None
+        assert [row["message_id"] for row in single.deletes] == ["1699564800.000123"]
+
+    def test_parallel_snapshot_and_diff(self, differ_env):
+        differ = differ_env["differ"]
+        schema = differ_env["schema"]
+        engine = differ_env["engine"]
+        differ.workers = 4
+
+        differ.create_snapshot("before")
+
+        execute_sql(engine, schema, """
+            INSERT INTO {schema}.channels (channel_id, channel_name, team_id, is_private, created_at)
+            VALUES ('C_PAR', 'parallel', 'T01WORKSPACE', false, NOW())
+        """)
+
+        execute_sql(engine, schema, """
+            DELETE FROM {schema}.messages
+            WHERE message_id = '1699564800.000123'
+        """)
+
+        differ.create_snapshot("after")
+        diff = differ.get_diff("before", "after")
+
+        snapshot_tables = query_tables(engine, schema, "%_snapshot_after")
+        assert len(snapshot_tables) == len(differ.tables)
+        assert [row["__table__"] for row in diff.inserts] == ["channels"]
+        assert [row["message_id"] for row in diff.deletes] == ["1699564800.000123"]
+        assert len(diff.updates) == 0
+
 
 class TestDiffStorage:
     def test_store_diff_persists_to_database(self, differ_env):
@@ -489,3 +550,250 @@ class TestDiffStorage:
             assert len(stored.diff["inserts"]) == len(diff.inserts)
             assert len(stored.diff["updates"]) == len(diff.updates)
             assert len(stored.diff["deletes"]) == len(diff.deletes)
+
+
+class TestTemplateSnapshots:
+    def test_pristine_environment_diffs_against_template(self, differ_env):
+        differ = differ_env["differ"]
+        schema = differ_env["schema"]
+        engine = differ_env["engine"]
+        session_manager = differ_env["session_manager"]
+
+        assert differ.use_template_snapshot()
+
+        with session_manager.with_session_for_environment(differ_env["env_id"]):
+            pass
+        execute_sql(engine, schema, """
+            DELETE FROM {schema}.messages
+            WHERE message_id = '1699564800.000123'
+        """)
+
+        assert not differ.use_template_snapshot()
+        assert query_tables(engine, schema, "%_snapshot_template") == []
+
+        differ.create_snapshot("after")
+        diff = differ.get_diff("template", "after")
+
+        assert [row["message_id"] for row in diff.deletes] == ["1699564800.000123"]
+        assert len(diff.inserts) == 0
+        assert len(diff.updates) == 0
+
+
+class TestChangeCounters:
+    def test_unwritten_tables_are_not_compared(self, differ_env):
+        differ = differ_env["differ"]
+        schema = differ_env["schema"]
+        engine = differ_env["engine"]
+
+        differ.create_snapshot("before")
+
+        execute_sql(engine, schema, """
+            UPDATE {schema}.channels SET topic_text = 'counted'
+            WHERE channel_id = 'C01ABCD1234'
+        """)
+
+        differ.create_snapshot("after")
+
+        assert query_tables(engine, schema, "_snapshot_counters") == [
+            "_snapshot_counters"
+        ]
+        assert "_snapshot_counters" not in differ.tables
+        assert differ._tables_to_compare("before", "after") == ["channels"]
+        diff = differ.get_diff("before", "after")
+        assert [row["after"]["topic_text"] for row in diff.updates] == ["counted"]
+
+    def test_concurrent_writers_do_not_wait_on_counters(self, differ_env):
+        differ = differ_env["differ"]
+        schema = differ_env["schema"]
+        engine = differ_env["engine"]
+
+        differ.create_snapshot("before")
+
+        insert = f"""
+            INSERT INTO {schema}.channels (channel_id, channel_name, team_id, is_private, created_at)
+            VALUES (:channel_id, :channel_id, 'T01WORKSPACE', false, NOW())
+        """
+        with engine.connect() as first, engine.connect() as second:
+            first_tx = first.begin()
+            first.execute(text(insert), {"channel_id": "C_FIRST"})
+            second_tx = second.begin()
+            second.execute(text("SET LOCAL lock_timeout = '1s'"))
+            second.execute(text(insert), {"channel_id": "C_SECOND"})
+            second_tx.commit()
+            first_tx.commit()
+
+        differ.create_snapshot("after")
+
+        assert differ._tables_to_compare("before", "after") == ["channels"]
+        diff = differ.get_diff("before", "after")
+        assert sorted(row["channel_id"] for row in diff.inserts) == [
+            "C_FIRST",
+            "C_SECOND",
+        ]
+
+    def test_write_during_snapshot_is_counted_with_its_copy(
+        self, differ_env, monkeypatch
+    ):
+        differ = differ_env["differ"]
+        schema = differ_env["schema"]
+        engine = differ_env["engine"]
+
+        differ.create_snapshot("before")
+
+        read_markers = differ._read_change_markers
+
+        def read_then_write(conn):
+            markers = read_markers(conn)
+            execute_sql(engine, schema, """
+                INSERT INTO {schema}.channels (channel_id, channel_name, team_id, is_private, created_at)
+                VALUES ('C_RACE', 'race', 'T01WORKSPACE', false, NOW())
+            """)
+            return markers
+
+        monkeypatch.setattr(differ, "_read_change_markers", read_then_write)
+        differ.create_snapshot("after")
+        monkeypatch.undo()
+        differ.create_snapshot("later")
+
+        # Neither counted nor copied by "after", so it shows up in the next diff.
+        assert differ.get_diff("before", "after").inserts == []
+        diff = differ.get_diff("after", "later")
+        assert [row["channel_id"] for row in diff.inserts] == ["C_RACE"]
+
+    def test_recreated_trigger_falls_back_to_checksums(self, differ_env):
+        differ = differ_env["differ"]
+        schema = differ_env["schema"]
+        engine = differ_env["engine"]
+
+        differ.create_snapshot("before")
+
+        execute_sql(engine, schema, """
+            DROP TRIGGER "_snapshot_count_changes" ON {schema}.messages;
+            DELETE FROM {schema}.messages
+            WHERE message_id = '1699564800.000123'
+        """)
+
+        differ.create_snapshot("after")
+        diff = differ.get_diff("before", "after")
+
+        assert [row["message_id"] for row in diff.deletes] == ["1699564800.000123"]
+        assert len(diff.inserts) == 0
+        assert len(diff.updates) == 0
+
+
+class TestChangeCapture:
+    def test_captured_changes_match_snapshot_diff(self, differ_env):
+        differ = differ_env["differ"]
+        schema = differ_env["schema"]
+        engine = differ_env["engine"]
+
+        differ.create_snapshot("before")
+        before = differ.start_capture()
+
+        execute_sql(engine, schema, """
+            INSERT INTO {schema}.channels (channel_id, channel_name, team_id, is_private, created_at)
+            VALUES ('C_CAP', 'captured', 'T01WORKSPACE', false, NOW());
+            UPDATE {schema}.channels SET channel_name = 'renamed' WHERE channel_id = 'C_CAP';
+            UPDATE {schema}.channels SET topic_text = 'first' WHERE channel_id = 'C01ABCD1234';
+            UPDATE {schema}.channels SET topic_text = 'second' WHERE channel_id = 'C01ABCD1234';
+            DELETE FROM {schema}.messages WHERE message_id = '1699564800.000123'
+        """)
+
+        differ.create_snapshot("after")
+        captured = differ.get_diff(before, differ.capture_suffix())
+        snapshot = differ.get_diff("before", "after")
+
+        assert query_tables(engine, schema, "_snapshot_changes") == ["_snapshot_changes"]
+        assert "_snapshot_changes" not in differ.tables
+        assert captured.model_dump(mode="json") == snapshot.model_dump(mode="json")
+        assert [row["channel_name"] for row in captured.inserts] == ["renamed"]
+        assert [row["after"]["topic_text"] for row in captured.updates] == ["second"]
+
+    def test_reverted_and_truncated_rows(self, differ_env):
+        differ = differ_env["differ"]
+        schema = differ_env["schema"]
+        engine = differ_env["engine"]
+
+        execute_sql(engine, schema, """
+            DELETE FROM {schema}.message_reactions;
+            INSERT INTO {schema}.message_reactions (message_id, user_id, reaction_type, created_at)
+            VALUES ('1699568400.000456', 'U01AGENBOT9', 'thumbsup', NOW())
+        """)
+        before = differ.start_capture()
+
+        execute_sql(engine, schema, """
+            INSERT INTO {schema}.channels (channel_id, channel_name, team_id, is_private, created_at)
+            VALUES ('C_TMP', 'temporary', 'T01WORKSPACE', false, NOW());
+            DELETE FROM {schema}.channels WHERE channel_id = 'C_TMP';
+            TRUNCATE {schema}.message_reactions
+        """)
+
+        diff = differ.get_diff(before, differ.capture_suffix())
+
+        assert len(diff.inserts) == 0
+        assert len(diff.updates) == 0
+        assert [(row["__table__"], row["user_id"]) for row in diff.deletes] == [
+            ("message_reactions", USER_AGENT)
+        ]
+
+    def test_transaction_committing_after_a_position_is_not_lost(self, differ_env):
+        differ = differ_env["differ"]
+        schema = differ_env["schema"]
+        engine = differ_env["engine"]
+
+        differ.start_capture()
+        insert = f"""
+            INSERT INTO {schema}.channels (channel_id, channel_name, team_id, is_private, created_at)
+            VALUES (:channel_id, :channel_id, 'T01WORKSPACE', false, NOW())
+        """
+        with engine.connect() as slow:
+            slow_tx = slow.begin()
+            # Logged first, committed last
+            slow.execute(text(insert), {"channel_id": "C_SLOW"})
+            with engine.begin() as fast:
+                fast.execute(text(insert), {"channel_id": "C_FAST"})
+            before = differ.capture_suffix()
+            slow_tx.commit()
+        after = differ.capture_suffix()
+
+        diff = differ.get_diff(before, after)
+
+        assert [row["channel_id"] for row in diff.inserts] == ["C_SLOW"]
+
+    def test_released_positions_prune_the_log_and_stop_capture(self, differ_env):
+        differ = differ_env["differ"]
+        schema = differ_env["schema"]
+        engine = differ_env["engine"]
+
+        first_run = differ.start_capture()
+        execute_sql(engine, schema, """
+            INSERT INTO {schema}.channels (channel_id, channel_name, team_id, is_private, created_at)
+            VALUES ('C_ONE', 'one', 'T01WORKSPACE', false, NOW())
+        """)
+        second_run = differ.start_capture()
+        execute_sql(engine, schema, """
+            INSERT INTO {schema}.channels (channel_id, channel_name, team_id, is_private, created_at)
+            VALUES ('C_TWO', 'two', 'T01WORKSPACE', false, NOW())
+        """)
+        after = differ.capture_suffix()
+
+        differ.archive_snapshots(first_run)
+
+        # Only the entry the second run still needs is kept.
+        assert query_count(engine, f"{schema}._snapshot_changes") == 1
+        diff = differ.get_diff(second_run, after)
+        assert [row["channel_id"] for row in diff.inserts] == ["C_TWO"]
+
+        differ.archive_snapshots(second_run)
+        differ.archive_snapshots(after)
+
+        assert query_tables(engine, schema, "_snapshot_changes") == []
+        assert query_tables(engine, schema, "_snapshot_capture_positions") == []
+        with engine.begin() as conn:
+            triggers = conn.execute(text(f"""
+                SELECT count(*) FROM pg_trigger t
+                JOIN pg_class c ON c.oid = t.tgrelid
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = '{schema}' AND t.tgname LIKE '\\_snapshot\\_capture%'
+            """)).scalar_one()
+        assert triggers == 0
@@ -1,11 +1,15 @@
 """Integration tests for environment lifecycle management."""
 
+import asyncio
 import time
 import pytest
 from sqlalchemy import text
 from datetime import datetime, timedelta
+from uuid import UUID
 
-from src.platform.db.schema import RunTimeEnvironment
+from src.eval_platform.db.schema import RunTimeEnvironment
+from src.eval_platform.isolationEngine.artifact import ArtifactStore
+from src.eval_platform.isolationEngine.models import EnvironmentSpec
 from src.services.slack.database.schema import User, Channel, Message
 
 
@@ -231,6 +235,35 @@ def test_lookup_updates_last_used_at(
     assert last_used > initial_last_used
 
 
+def test_resolution_is_cached_and_last_used_flushed_in_batch(
+    test_user_id,
+    core_isolation_engine,
+    environment_handler,
+    session_manager,
+    cleanup_test_environments,
+):
+    result = core_isolation_engine.create_environment(
+        template_schema="slack_default",
+        ttl_seconds=3600,
+        created_by=test_user_id,
+    )
+    session_manager.flush_last_used()
+
+    first = session_manager.resolve_environment(result.environment_id)
+    second = session_manager.resolve_environment(result.environment_id)
+    assert first.schema == second.schema == result.schema_name
+    assert second.last_used_at > first.last_used_at
+
+    session_manager.flush_last_used()
+    with session_manager.with_meta_session() as session:
+        env = session.get(RunTimeEnvironment, UUID(result.environment_id))
+        assert env.last_used_at == second.last_used_at
+
+    environment_handler.mark_environment_status(result.environment_id, "deleted")
+    with pytest.raises(PermissionError):
+        session_manager.resolve_environment(result.environment_id)
+
+
 def test_drop_schema_cleanup(
     test_user_id, core_isolation_engine, environment_handler, session_manager
 ):
@@ -268,3 +301,309 @@ def test_drop_schema_cleanup(
             {"schema": schema_name},
         ).scalar()
     assert exists_after is False
+
+
+def test_clone_plan_is_cached_and_reused(
+    environment_handler, session_manager, created_schemas
+):
+    planner = environment_handler.clone_planner
+    planner.invalidate("slack_default")
+
+    first = planner.get_plan("slack_default")
+    second = planner.get_plan("slack_default")
+    assert first is second
+
+    target = f"state_plan_{int(time.time() * 1000)}"
+    created_schemas.append(target)
+    environment_handler.build_schema_from_template("slack_default", target)
+
+    with session_manager.with_session_for_schema(target) as session:
+        assert len(session.query(User).all()) == 3
+
+    with session_manager.base_engine.begin() as conn:
+        non_deferrable = conn.execute(
+            text("""
+                SELECT COUNT(*)
+                FROM pg_constraint c
+                JOIN pg_namespace n ON n.oid = c.connamespace
+                WHERE n.nspname = :schema
+                  AND c.contype = 'f'
+                  AND NOT c.condeferrable
+            """),
+            {"schema": target},
+        ).scalar()
+    assert non_deferrable == 0
+
+
+def test_reset_schema_rewrites_only_changed_tables(
+    environment_handler, session_manager, created_schemas
+):
+    target = f"state_reset_{int(time.time() * 1000)}"
+    created_schemas.append(target)
+    environment_handler.build_schema_from_template("slack_default", target)
+
+    assert environment_handler.reset_schema_from_template("slack_default", target) == []
+
+    with session_manager.with_session_for_schema(target) as session:
+        session.query(Message).delete()
+        channel = session.query(Channel).first()
+        channel.channel_name = "renamed"
+        session.commit()
+    with session_manager.base_engine.begin() as conn:
+        conn.execute(text(f'CREATE TABLE "{target}"."users_snapshot_x" (id int)'))
+
+    rewritten = environment_handler.reset_schema_from_template("slack_default", target)
+    assert "messages" in rewritten
+    assert "channels" in rewritten
+    assert "users" not in rewritten
+
+    with session_manager.with_session_for_schema(target) as session:
+        assert len(session.query(Message).all()) == 3
+        assert session.query(Channel).filter_by(channel_name="renamed").count() == 0
+
+    with session_manager.base_engine.begin() as conn:
+        leftover = conn.execute(
+            text("SELECT to_regclass(:rel)"), {"rel": f'"{target}".users_snapshot_x'}
+        ).scalar()
+    assert leftover is None
+    assert environment_handler.reset_schema_from_template("slack_default", target) == []
+
+
+def test_artifact_template_restores_with_copy(
+    environment_handler, session_manager, created_schemas, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(environment_handler, "artifact_store", ArtifactStore(tmp_path))
+    location = environment_handler.artifact_store.location("template_slack_default")
+    manifest = environment_handler.export_artifact_template("slack_default", location)
+    assert set(manifest.tables) >= {"users", "channels", "messages"}
+
+    target = f"state_artifact_{int(time.time() * 1000)}"
+    created_schemas.append(target)
+    environment_handler.build_environment_schema(location, target, kind="artifact")
+
+    with session_manager.with_session_for_schema(target) as session:
+        assert len(session.query(User).all()) == 3
+        assert len(session.query(Message).all()) == 3
+
+
+def test_create_environments_batch_mixes_pool_hits_and_misses(
+    test_user_id,
+    core_isolation_engine,
+    environment_handler,
+    pool_manager,
+    session_manager,
+    cleanup_test_environments,
+):
+    pooled_schema = f"state_pool_{int(time.time() * 1000)}"
+    environment_handler.build_schema_from_template("slack_default", pooled_schema)
+    pool_manager.register_entry(
+        schema_name=pooled_schema, template_schema="slack_default", status="ready"
+    )
+
+    specs = [
+        EnvironmentSpec(template_schema="slack_default", impersonate_user_id="U01AGENBOT9")
+        for _ in range(3)
+    ]
+    results = core_isolation_engine.create_environments(specs, created_by=test_user_id)
+
+    assert len(results) == 3
+    assert len({r.schema_name for r in results}) == 3
+    assert [r.schema_name for r in results if r.pooled] == [pooled_schema]
+
+    with session_manager.with_meta_session() as session:
+        rows = (
+            session.query(RunTimeEnvironment)
+            .filter(RunTimeEnvironment.id.in_([r.environment_id for r in results]))
+            .all()
+        )
+        assert {row.schema for row in rows} == {r.schema_name for r in results}
+        assert all(row.status == "ready" for row in rows)
+
+    for result in results:
+        with session_manager.with_session_for_schema(result.schema_name) as session:
+            assert len(session.query(User).all()) == 3
+
+
+def test_fork_environment_copies_current_state(
+    test_user_id, core_isolation_engine, session_manager, cleanup_test_environments
+):
+    source = core_isolation_engine.create_environment(
+        template_schema="slack_default",
+        ttl_seconds=3600,
+        created_by=test_user_id,
+        impersonate_user_id="U01AGENBOT9",
+    )
+    with session_manager.with_session_for_schema(source.schema_name) as session:
+        user = session.query(User).filter(User.user_id == "U01AGENBOT9").first()
+        user.real_name = "Before Fork"
+        session.commit()
+
+    forks = core_isolation_engine.fork_environment(
+        source.environment_id, count=2, ttl_seconds=600, created_by=test_user_id
+    )
+
+    assert len(forks) == 2
+    for fork in forks:
+        assert fork.impersonate_user_id == "U01AGENBOT9"
+        with session_manager.with_session_for_environment(
+            fork.environment_id
+        ) as session:
+            user = session.query(User).filter(User.user_id == "U01AGENBOT9").first()
+            assert user.real_name == "Before Fork"
+            user.real_name = f"Branch {fork.environment_id}"
+            session.commit()
+
+    with session_manager.with_session_for_schema(source.schema_name) as session:
+        user = session.query(User).filter(User.user_id == "U01AGENBOT9").first()
+        assert user.real_name == "Before Fork"
+
+
+def test_rollback_restores_checkpoint_in_place(
+    test_user_id, core_isolation_engine, session_manager, cleanup_test_environments
+):
+    from src.eval_platform.evaluationEngine.core import CoreEvaluationEngine
+
+    core_eval = CoreEvaluationEngine(session_manager)
+    env = core_isolation_engine.create_environment(
+        template_schema="slack_default",
+        ttl_seconds=3600,
+        created_by=test_user_id,
+    )
+    core_eval.create_checkpoint(
+        schema=env.schema_name, environment_id=env.environment_id, name="start"
+    )
+
+    with session_manager.with_session_for_schema(env.schema_name) as session:
+        original = {m.message_id: m.message_text for m in session.query(Message)}
+        message = session.query(Message).first()
+        message.message_text = "changed during episode"
+        session.commit()
+
+    restored = core_eval.rollback_to_checkpoint(
+        schema=env.schema_name, environment_id=env.environment_id, name="start"
+    )
+
+    assert "messages" in restored
+    assert "users" not in restored
+    assert "channels" not in restored
+    with session_manager.with_session_for_schema(env.schema_name) as session:
+        current = {m.message_id: m.message_text for m in session.query(Message)}
+    assert current == original
+
+    assert (
+        core_eval.rollback_to_checkpoint(
+            schema=env.schema_name, environment_id=env.environment_id, name="start"
+        )
+        == []
+    )
+    with pytest.raises(ValueError):
+        core_eval.rollback_to_checkpoint(
+            schema=env.schema_name, environment_id=env.environment_id, name="missing"
+        )
+
+
+def test_read_only_environment_shares_template_schema(
+    test_user_id, core_isolation_engine, session_manager
+):
+    from sqlalchemy.exc import InternalError
+
+    first = core_isolation_engine.create_environment(
+        template_schema="slack_default",
+        ttl_seconds=3600,
+        created_by=test_user_id,
+        read_only=True,
+    )
+    second = core_isolation_engine.create_environment(
+        template_schema="slack_default",
+        ttl_seconds=3600,
+        created_by=test_user_id,
+        read_only=True,
+    )
+
+    assert first.schema_name == second.schema_name == "slack_default"
+    assert first.read_only and not first.pooled
+
+    with session_manager.with_session_for_environment(
+        first.environment_id
+    ) as session:
+        assert session.query(User).count() > 0
+
+    with pytest.raises(InternalError):
+        with session_manager.with_session_for_environment(
+            second.environment_id
+        ) as session:
+            user = session.query(User).first()
+            user.real_name = "Should Not Persist"
+            session.flush()
+
+
+def test_pool_miss_seeds_empty_service_schema(
+    test_user_id,
+    core_isolation_engine,
+    environment_handler,
+    pool_manager,
+    session_manager,
+    cleanup_test_environments,
+):
+    from src.eval_platform.db.schema import EnvironmentPoolEntry
+    from src.eval_platform.isolationEngine.pool import empty_tier_key
+
+    template = environment_handler.get_template_metadata(location="slack_default")
+    # Built from another slack template: the empty tier is shared per shape
+    empty_schema = f"state_pool_empty_{int(time.time() * 1000)}"
+    shape = environment_handler.build_empty_schema("slack_bench_v2", empty_schema)
+    assert shape == environment_handler.empty_schema_shape(
+        "slack_default", template.table_order
+    )
+    pool_manager.register_entry(
+        schema_name=empty_schema,
+        template_schema=empty_tier_key("slack", shape),
+        status="ready",
+    )
+
+    specs = [
+        EnvironmentSpec(template_schema="slack_default", impersonate_user_id="U01AGENBOT9")
+        for _ in range(2)
+    ]
+    results = core_isolation_engine.create_environments(specs, created_by=test_user_id)
+
+    assert empty_schema in {r.schema_name for r in results}
+    with session_manager.with_session_for_schema(empty_schema) as session:
+        assert len(session.query(User).all()) == 3
+    with session_manager.with_meta_session() as session:
+        entry = (
+            session.query(EnvironmentPoolEntry)
+            .filter(EnvironmentPoolEntry.schema_name == empty_schema)
+            .one()
+        )
+        assert entry.template_schema == "slack_default"
+        assert entry.status == "in_use"
+
+
+def test_trash_schemas_renames_then_drains(
+    environment_handler, session_manager, created_schemas
+):
+    from src.eval_platform.isolationEngine.maintenance import (
+        EnvironmentMaintenanceService,
+    )
+
+    schemas = [f"state_trash_{int(time.time() * 1000)}_{i}" for i in range(3)]
+    with session_manager.base_engine.begin() as conn:
+        for schema in schemas:
+            conn.execute(text(f'CREATE SCHEMA "{schema}"'))
+
+    renamed = environment_handler.trash_schemas(schemas + ["state_missing_schema"])
+    assert set(renamed) == set(schemas)
+    assert not any(environment_handler.schema_exists(s) for s in schemas)
+    assert set(renamed.values()) <= set(environment_handler.list_trash_schemas())
+
+    service = EnvironmentMaintenanceService(
+        session_manager=session_manager,
+        environment_handler=environment_handler,
+        pool_manager=None,
+        pool_targets={},
+        max_concurrent_drops=2,
+    )
+    while asyncio.run(service._drain_trash()):
+        pass
+    assert not set(renamed.values()) & set(environment_handler.list_trash_schemas())
@@ -0,0 +1,132 @@
+"""Tests for per-stage admission control of snapshot and diff work."""
+
+import asyncio
+
+import pytest
+
+from src.eval_platform.api.admission import (
+    AdmissionRejected,
+    StageLimiter,
+    StageLimits,
+)
+
+
+def _limiter(**overrides) -> StageLimiter:
+    limits = dict(
+        max_concurrent=1, max_queue=10, max_queue_per_principal=10, max_wait=5.0
+    )
+    limits.update(overrides)
+    return StageLimiter("diff", StageLimits(**limits))
+
+
+class TestStageLimiter:
+    def test_queued_principals_are_served_round_robin(self):
+        """A principal with many queued requests does not starve another."""
+
+        async def scenario():
+            limiter = _limiter()
+            order: list[str] = []
+            gate = asyncio.Event()
+
+            async def work(principal: str, wait_for_gate: bool = False):
+                async with limiter.slot(principal):
+                    order.append(principal)
+                    if wait_for_gate:
+                        await gate.wait()
+
+            first = asyncio.create_task(work("busy", wait_for_gate=True))
+            await asyncio.sleep(0)
+            queued = [asyncio.create_task(work("busy")) for _ in range(3)]
+            await asyncio.sleep(0)
+            queued.append(asyncio.create_task(work("quiet")))
+            await asyncio.sleep(0)
+            assert limiter.queued == 4
+
+            gate.set()
+            await asyncio.gather(first, *queued)
+            return order, limiter
+
+        order, limiter = asyncio.run(scenario())
+        assert order == ["busy", "busy", "quiet", "busy", "busy"]
+        assert limiter.active == 0
+        assert limiter.queued == 0
+
+    def test_principal_over_its_queue_share_gets_429(self):
+        async def scenario():
+            limiter = _limiter(max_queue_per_principal=1)
+            gate = asyncio.Event()
+
+            async def hold():
+                async with limiter.slot("p"):
+                    await gate.wait()
+
+            tasks = [asyncio.create_task(hold()) for _ in range(2)]
+            await asyncio.sleep(0)
+            try:
+                with pytest.raises(AdmissionRejected) as exc_info:
+                    async with limiter.slot("p"):
+                        pass
+                # Another principal still fits in the queue.
+                other = asyncio.create_task(hold_other(limiter))
+                await asyncio.sleep(0)
+                assert limiter.queued == 2
+            finally:
+                gate.set()
+            await asyncio.gather(*tasks, other)
+            return exc_info.value
+
+        async def hold_other(limiter):
+            async with limiter.slot("other"):
+                pass
+
+        rejected = asyncio.run(scenario())
+        assert rejected.status_code == 429
+        assert rejected.retry_after >= 1
+
+    def test_full_queue_or_long_wait_gets_503(self):
+        async def scenario():
+            limiter = _limiter(max_queue=1, max_wait=0.05)
+            gate = asyncio.Event()
+
+            async def hold(principal):
+                async with limiter.slot(principal):
+                    await gate.wait()
+
+            holder = asyncio.create_task(hold("a"))
+            await asyncio.sleep(0)
+            # Expected wait (1s average hold) already exceeds max_wait.
+            with pytest.raises(AdmissionRejected) as exc_info:
+                async with limiter.slot("b"):
+                    pass
+            gate.set()
+            await holder
+            return exc_info.value, limiter
+
+        rejected, limiter = asyncio.run(scenario())
+        assert rejected.status_code == 503
+        assert limiter.rejected == 1
+        assert limiter.active == 0
+
+    def test_cancelled_waiter_leaves_the_queue(self):
+        async def scenario():
+            limiter = _limiter()
+            gate = asyncio.Event()
+
+            async def hold():
+                async with limiter.slot("a"):
+                    await gate.wait()
+
+            holder = asyncio.create_task(hold())
+            await asyncio.sleep(0)
+            waiter = asyncio.create_task(hold())
+            await asyncio.sleep(0)
+            assert limiter.queued == 1
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+            assert limiter.queued == 0
+            gate.set()
+            await holder
+            return limiter
+
+        limiter = asyncio.run(scenario())
+        assert limiter.active == 0
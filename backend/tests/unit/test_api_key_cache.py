@@ -0,0 +1,124 @@
+"""Tests for API key validation caching and batched usage reporting."""
+
+import asyncio
+
+import httpx
+import pytest
+
+from src.eval_platform.api import auth
+
+
+@pytest.fixture
+def control_plane(monkeypatch):
+    """Fake control plane recording /validate calls."""
+    calls: list[tuple[str, str]] = []
+    verdicts: dict[str, object] = {"good": "user-1"}
+
+    async def fake_validate(api_key, action):
+        calls.append((api_key, action))
+        verdict = verdicts.get(api_key, auth._KeyRejected("invalid api key"))
+        if isinstance(verdict, Exception):
+            raise verdict
+        return verdict
+
+    async def no_flush():
+        return None
+
+    monkeypatch.setattr(auth, "CONTROL_PLANE_URL", "http://control-plane")
+    monkeypatch.setattr(auth, "_validate_remote", fake_validate)
+    monkeypatch.setattr(auth, "_usage_flush_loop", no_flush)
+    monkeypatch.setattr(auth, "_key_cache", auth.OrderedDict())
+    monkeypatch.setattr(auth, "_usage_counts", auth.Counter())
+    return calls, verdicts
+
+
+def _validate(api_key, action="api_request"):
+    return asyncio.run(auth.validate_with_control_plane(api_key, action))
+
+
+class TestApiKeyCache:
+    def test_valid_key_is_cached_and_usage_counted(self, control_plane):
+        calls, _ = control_plane
+
+        assert [_validate("good") for _ in range(3)] == ["user-1"] * 3
+
+        assert calls == [("good", "api_request")]
+        assert auth._usage_counts == {("good", "api_request"): 2}
+
+    def test_rejected_key_is_negatively_cached(self, control_plane):
+        calls, _ = control_plane
+
+        for _ in range(2):
+            with pytest.raises(PermissionError):
+                _validate("bad")
+
+        assert len(calls) == 1
+
+    def test_rate_limited_actions_always_hit_control_plane(self, control_plane):
+        calls, _ = control_plane
+
+        _validate("good")
+        _validate("good", "environment_created")
+        _validate("good", "environment_created")
+
+        assert [action for _, action in calls] == [
+            "api_request",
+            "environment_created",
+            "environment_created",
+        ]
+
+    def test_revocation_applies_after_ttl(self, control_plane, monkeypatch):
+        _, verdicts = control_plane
+        _validate("good")
+        verdicts["good"] = auth._KeyRejected("revoked")
+        monkeypatch.setattr(auth, "API_KEY_CACHE_TTL", 0)
+
+        with pytest.raises(PermissionError, match="revoked"):
+            _validate("good")
+
+    def test_stale_key_served_while_control_plane_down(
+        self, control_plane, monkeypatch
+    ):
+        _, verdicts = control_plane
+        _validate("good")
+        verdicts["good"] = httpx.ConnectError("down")
+        monkeypatch.setattr(auth, "API_KEY_CACHE_TTL", 0)
+
+        assert _validate("good") == "user-1"
+
+        monkeypatch.setattr(auth, "API_KEY_STALE_GRACE", 0)
+        with pytest.raises(RuntimeError):
+            _validate("good")
+
+    def test_cache_is_bounded(self, control_plane, monkeypatch):
+        monkeypatch.setattr(auth, "API_KEY_CACHE_SIZE", 2)
+
+        for key in ["garbage-1", "garbage-2"]:
+            with pytest.raises(PermissionError):
+                _validate(key)
+        _validate("good")
+
+        assert list(auth._key_cache) == ["garbage-2", "good"]
+
+    def test_expired_entries_are_pruned(self, control_plane, monkeypatch):
+        _validate("good")
+        monkeypatch.setattr(auth, "API_KEY_CACHE_TTL", 0)
+        monkeypatch.setattr(auth, "API_KEY_STALE_GRACE", 0)
+
+        with pytest.raises(PermissionError):
+            _validate("bad")
+
+        assert list(auth._key_cache) == ["bad"]
+
+    def test_extra_uses_are_reported_through_the_batcher(
+        self, control_plane, monkeypatch
+    ):
+        monkeypatch.setattr(auth, "ENVIRONMENT", "production")
+
+        async def record():
+            auth.record_usage("Bearer good", "environment_created", 4)
+            auth.record_usage("good", "environment_created", 0)
+
+        asyncio.run(record())
+
+        assert auth._usage_counts == {("good", "environment_created"): 4}
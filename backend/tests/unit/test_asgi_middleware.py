@@ -0,0 +1,126 @@
+"""Tests for the plain-ASGI isolation middleware."""
+
+from contextlib import contextmanager
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from src.eval_platform.api import middleware as middleware_module
+from src.eval_platform.api.middleware import IsolationMiddleware, _rate_limit_action
+from src.eval_platform.isolationEngine.session import ResolvedEnvironment
+
+
+class _Session:
+    def __init__(self, events: list[str], fail_commit: bool = False):
+        self.events = events
+        self.fail_commit = fail_commit
+
+    def commit(self):
+        self.events.append("commit")
+        if self.fail_commit:
+            raise PermissionError("write rejected")
+
+
+class _Sessions:
+    def __init__(self, fail_commit: bool = False):
+        self.events: list[str] = []
+        self.fail_commit = fail_commit
+
+    def resolve_environment(self, env_id):
+        return ResolvedEnvironment(
+            schema="env_schema",
+            read_only=False,
+            shard="primary",
+            impersonate_user_id="U1",
+            impersonate_email=None,
+            expires_at=None,
+        )
+
+    @contextmanager
+    def with_session_for_environment(self, env_id):
+        yield _Session(self.events, self.fail_commit)
+        self.events.append("closed")
+
+
+def _client(sessions: _Sessions, monkeypatch) -> TestClient:
+    async def principal(api_key, action="api_request"):
+        return "principal"
+
+    monkeypatch.setattr(middleware_module, "get_principal_id", principal)
+
+    async def stream(request):
+        events = sessions.events
+
+        def chunks():
+            for i in range(3):
+                events.append(f"chunk{i}")
+                yield f"{i}".encode()
+
+        assert request.state.impersonate_user_id == "U1"
+        return StreamingResponse(chunks())
+
+    async def write(request):
+        request.state.db_session.events.append("handler")
+        return JSONResponse({"ok": True})
+
+    app = Starlette(
+        routes=[
+            Route("/api/env/{env_id}/stream", stream),
+            Route("/api/env/{env_id}/write", write, methods=["POST"]),
+        ]
+    )
+    app.add_middleware(
+        IsolationMiddleware, session_manager=sessions, core_isolation_engine=None
+    )
+    return TestClient(app, headers={"X-API-Key": "key"})
+
+
+class TestIsolationMiddleware:
+    def test_streaming_body_passes_through_and_session_closes_after(self, monkeypatch):
+        sessions = _Sessions()
+
+        response = _client(sessions, monkeypatch).get("/api/env/abc/stream")
+
+        assert response.status_code == 200
+        assert response.content == b"012"
+        # Committed before headers, chunks streamed, then the session closed.
+        assert sessions.events[0] == "commit"
+        assert sessions.events[1:4] == ["chunk0", "chunk1", "chunk2"]
+        assert sessions.events[-1] == "closed"
+
+    def test_commit_failure_becomes_an_error_response(self, monkeypatch):
+        sessions = _Sessions(fail_commit=True)
+
+        response = _client(sessions, monkeypatch).post("/api/env/abc/write")
+
+        assert response.status_code == 401
+        assert response.json() == {"ok": False, "error": "write rejected"}
+        assert sessions.events == ["handler", "commit"]
+
+    def test_other_paths_are_untouched(self, monkeypatch):
+        sessions = _Sessions()
+        client = _client(sessions, monkeypatch)
+
+        assert client.get("/health").status_code == 404
+        assert sessions.events == []
+
+
+class TestRateLimitAction:
+    @pytest.mark.parametrize(
+        "path",
+        [
+            "/api/platform/initEnv",
+            "/api/platform/initEnvBatch",
+            "/api/platform/env/abc/fork",
+        ],
+    )
+    def test_environment_creation_is_charged_as_such(self, path):
+        assert _rate_limit_action(path, "POST") == "environment_created"
+
+    def test_other_requests_are_plain_api_requests(self):
+        assert _rate_limit_action("/api/platform/initEnv", "GET") == "api_request"
+        assert _rate_limit_action("/api/platform/diffRun", "POST") == "api_request"
+        assert _rate_limit_action("/api/platform/env/abc/fork", "GET") == "api_request"
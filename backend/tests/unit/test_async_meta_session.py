@@ -0,0 +1,68 @@
+"""Tests for the async platform-database path used by the platform API."""
+
+import asyncio
+
+import pytest
+
+from src.eval_platform.api.routes import _run_evaluation
+from src.eval_platform.isolationEngine.session import (
+    SessionManager,
+    async_database_url,
+)
+
+
+class _State:
+    pass
+
+
+class _App:
+    def __init__(self, executor=None):
+        self.state = _State()
+        self.state.evaluation_executor = executor
+
+
+class _Request:
+    def __init__(self, executor=None):
+        self.app = _App(executor)
+
+
+class TestAsyncDatabaseUrl:
+    def test_plain_and_sync_driver_urls_switch_to_async_psycopg(self):
+        for url in (
+            "postgresql://u:secret@db:5432/app",
+            "postgresql+psycopg2://u:secret@db:5432/app",
+        ):
+            assert (
+                async_database_url(url) == "postgresql+psycopg://u:secret@db:5432/app"
+            )
+
+    def test_query_parameters_are_kept(self):
+        url = "postgresql://u:p@db-pooler/app?sslmode=require"
+        assert async_database_url(url).endswith("/app?sslmode=require")
+
+
+class TestAsyncMetaSession:
+    def test_requires_an_async_engine(self):
+        sessions = SessionManager(base_engine=None)
+        with pytest.raises(RuntimeError):
+            sessions.get_async_meta_session()
+
+
+class TestRunEvaluation:
+    def test_runs_on_the_configured_executor(self):
+        from concurrent.futures import ThreadPoolExecutor
+        import threading
+
+        with ThreadPoolExecutor(1, thread_name_prefix="evaluation") as executor:
+            name = asyncio.run(
+                _run_evaluation(
+                    _Request(executor), lambda: threading.current_thread().name
+                )
+            )
+        assert name.startswith("evaluation")
+
+    def test_passes_keyword_arguments(self):
+        result = asyncio.run(
+            _run_evaluation(_Request(), lambda *, a, b: a + b, a=1, b=2)
+        )
+        assert result == 3
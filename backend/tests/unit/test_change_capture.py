@@ -0,0 +1,51 @@
+"""Tests for change capture positions and how runs pick them up."""
+
+import pytest
+
+from src.eval_platform.evaluationEngine.core import CoreEvaluationEngine
+from src.eval_platform.evaluationEngine.differ import Differ, is_capture_suffix
+
+
+class _Differ:
+    def start_capture(self):
+        return "capture_16384_0"
+
+    def capture_suffix(self):
+        return "capture_16384_42"
+
+
+class _Engine(CoreEvaluationEngine):
+    def _differ(self, schema, environment_id):
+        return _Differ()
+
+    def take_snapshot(self, *, schema, environment_id, prefix, suffix=None):
+        raise AssertionError("snapshot taken in capture mode")
+
+
+class TestCapturePositions:
+    def test_parses_log_oid_and_position(self):
+        assert Differ._capture_position("capture_16384_42") == (16384, 42)
+
+    @pytest.mark.parametrize(
+        "suffix", ["before_1a2b3c4d", "capture_16384", "capture_x_1", "template"]
+    )
+    def test_rejects_other_suffixes(self, suffix):
+        with pytest.raises(ValueError, match="not a change capture position"):
+            Differ._capture_position(suffix)
+
+    def test_is_capture_suffix(self):
+        assert is_capture_suffix("capture_16384_0")
+        assert not is_capture_suffix("template")
+        assert not is_capture_suffix(None)
+
+
+class TestCaptureRuns:
+    def test_run_starts_and_ends_at_capture_positions(self):
+        engine = _Engine(None, change_capture=True)
+
+        before = engine.take_before(schema="state_abc", environment_id="env")
+        after = engine.take_after(
+            schema="state_abc", environment_id="env", before_suffix=before.suffix
+        )
+
+        assert (before.suffix, after.suffix) == ("capture_16384_0", "capture_16384_42")
@@ -0,0 +1,91 @@
+"""Tests for deciding which tables changed from trigger-maintained counters."""
+
+from types import SimpleNamespace
+
+from src.eval_platform.evaluationEngine.differ import Differ, _counted_change
+
+
+def _entry(marker=None, checksum=None, row_count=1):
+    return SimpleNamespace(change_marker=marker, checksum=checksum, row_count=row_count)
+
+
+class _Differ(Differ):
+    def __init__(self, tables, before, after, checksums=None):
+        self.schema = "state_abc"
+        self.tables = tables
+        self.metadata = {"before": before, "after": after}
+        # Checksums filled in for entries that deferred them
+        self.checksums = checksums or {}
+        self.checksummed: list[tuple[str, str]] = []
+
+    def _load_metadata_map(self, suffix):
+        return self.metadata[suffix]
+
+    def _ensure_checksums(self, suffix, metadata, tables):
+        for t in tables:
+            if metadata[t].checksum is None:
+                self.checksummed.append((suffix, t))
+                metadata[t].checksum = self.checksums[(suffix, t)]
+
+
+class TestCountedChange:
+    def test_compares_writes_of_the_same_counter(self):
+        assert _counted_change("1.2:3", "1.2:3") is False
+        assert _counted_change("1.2:3", "1.2:4") is True
+
+    def test_undecided_without_comparable_readings(self):
+        assert _counted_change(None, "1.2:3") is None
+        assert _counted_change("1.2:3", None) is None
+        # Trigger re-created, e.g. after the schema was restored
+        assert _counted_change("1.2:3", "1.5:3") is None
+        # Counter table re-created
+        assert _counted_change("1.2:3", "7.2:3") is None
+
+
+class TestTablesToCompare:
+    def test_counters_skip_checksums(self):
+        differ = _Differ(
+            ["users", "channels", "messages"],
+            before={
+                "users": _entry("1.2:0"),
+                "channels": _entry("1.3:4"),
+                "messages": _entry("1.4:0"),
+            },
+            after={
+                "users": _entry("1.2:0"),
+                "channels": _entry("1.3:4"),
+                "messages": _entry("1.4:2"),
+            },
+        )
+
+        assert differ._tables_to_compare("before", "after") == ["messages"]
+        assert differ.checksummed == []
+
+    def test_falls_back_to_checksums(self):
+        differ = _Differ(
+            ["users", "channels", "messages"],
+            # A template before snapshot has checksums but no counters.
+            before={
+                "users": _entry(checksum="a"),
+                "channels": _entry(checksum="b"),
+                "messages": _entry(checksum="c"),
+            },
+            after={
+                "users": _entry("1.2:0"),
+                "channels": _entry("1.3:1", checksum="b"),
+                "messages": _entry("1.4:1"),
+            },
+            checksums={("after", "users"): "a", ("after", "messages"): "changed"},
+        )
+
+        assert differ._tables_to_compare("before", "after") == ["messages"]
+        assert differ.checksummed == [("after", "users"), ("after", "messages")]
+
+    def test_tables_missing_metadata_are_flagged(self):
+        differ = _Differ(
+            ["users", "channels"],
+            before={"users": _entry("1.2:0")},
+            after={"users": _entry("1.2:0"), "channels": _entry("1.3:0")},
+        )
+
+        assert differ._tables_to_compare("before", "after") == ["channels"]
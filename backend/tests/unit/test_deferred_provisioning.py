@@ -0,0 +1,73 @@
+"""Tests for building pool-miss environments in the maintenance service."""
+
+import asyncio
+
+from src.eval_platform.isolationEngine.core import DeferredBuild
+from src.eval_platform.isolationEngine.maintenance import (
+    EnvironmentMaintenanceService,
+)
+
+
+def _service(max_builds: int = 1) -> EnvironmentMaintenanceService:
+    return EnvironmentMaintenanceService(
+        session_manager=None,
+        environment_handler=None,
+        pool_manager=None,
+        pool_targets={},
+        max_concurrent_builds=max_builds,
+        autoscaler=None,
+    )
+
+
+def _build(environment_id: str) -> DeferredBuild:
+    return DeferredBuild(
+        environment_id=environment_id,
+        template_schema="slack_default",
+        schema=f"state_{environment_id}",
+        meta=None,
+        shard="primary",
+        prebuilt=False,
+    )
+
+
+class TestDeferredProvisioning:
+    def test_builds_run_in_background_within_the_build_limit(self):
+        async def scenario():
+            service = _service(max_builds=1)
+            completed: list[str] = []
+            running = 0
+            peak = 0
+
+            def complete(build: DeferredBuild) -> None:
+                nonlocal running, peak
+                running += 1
+                peak = max(peak, running)
+                completed.append(build.environment_id)
+                running -= 1
+
+            service.provision(complete, [_build("a"), _build("b"), _build("c")])
+            # provision() returns before anything has been built
+            assert completed == []
+            await asyncio.gather(*service._provisioning)
+            return completed, peak, service
+
+        completed, peak, service = asyncio.run(scenario())
+        assert sorted(completed) == ["a", "b", "c"]
+        assert peak == 1
+        assert not service._provisioning
+
+    def test_failed_build_does_not_stop_the_others(self):
+        async def scenario():
+            service = _service(max_builds=2)
+            completed: list[str] = []
+
+            def complete(build: DeferredBuild) -> None:
+                if build.environment_id == "bad":
+                    raise RuntimeError("template missing")
+                completed.append(build.environment_id)
+
+            service.provision(complete, [_build("bad"), _build("good")])
+            await asyncio.gather(*service._provisioning)
+            return completed
+
+        assert asyncio.run(scenario()) == ["good"]
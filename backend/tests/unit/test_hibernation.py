@@ -0,0 +1,256 @@
+"""Tests for schema artifacts and transparent restore of hibernated environments."""
+
+import io
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import create_engine, event
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from src.eval_platform.api import middleware as middleware_module
+from src.eval_platform.api.middleware import IsolationMiddleware
+from src.eval_platform.db import schema as db_schema
+from src.eval_platform.db.schema import RunTimeEnvironment
+from src.eval_platform.isolationEngine.artifact import (
+    ArtifactStore,
+    read_manifest,
+    restore_schema_artifact,
+    write_schema_artifact,
+)
+from src.eval_platform.isolationEngine.maintenance import (
+    EnvironmentMaintenanceService,
+)
+from src.eval_platform.isolationEngine.planner import ClonePlan
+from src.eval_platform.isolationEngine.session import (
+    ResolvedEnvironment,
+    SessionManager,
+)
+
+
+class _Result:
+    def __init__(self, row):
+        self.row = row
+
+    def one(self):
+        return self.row
+
+
+class _Cursor:
+    """psycopg2-style cursor serving and collecting COPY data per table."""
+
+    def __init__(self, tables: dict[str, bytes], loaded: dict[str, bytes]):
+        self.tables = tables
+        self.loaded = loaded
+
+    def copy_expert(self, sql, file, size=8192):
+        table = sql.split()[1].split(".")[1].strip('"')
+        if "TO STDOUT" in sql:
+            data = self.tables[table]
+            # Several writes per table, as the driver streams rows.
+            for i in range(0, len(data), 3):
+                file.write(data[i : i + 3])
+            return
+        chunks = []
+        while chunk := file.read(size):
+            chunks.append(chunk)
+        self.loaded[table] = b"".join(chunks)
+
+    def close(self):
+        pass
+
+
+class _Conn:
+    def __init__(self, tables=None, sequence_row=()):
+        self.statements: list[str] = []
+        self.loaded: dict[str, bytes] = {}
+        self.sequence_row = sequence_row
+        self.connection = self
+        self._tables = tables or {}
+
+    def cursor(self):
+        return _Cursor(self._tables, self.loaded)
+
+    def execution_options(self, **options):
+        return self
+
+    def exec_driver_sql(self, sql):
+        self.statements.append(sql)
+        return _Result(self.sequence_row)
+
+
+def _plan() -> ClonePlan:
+    return ClonePlan(
+        template_schema="state_abc",
+        fingerprint="f",
+        table_order=None,
+        ddl=(
+            "CREATE TABLE __clone_target__.users (id SERIAL NOT NULL)",
+            "CREATE TABLE __clone_target__.messages (id SERIAL NOT NULL)",
+        ),
+        tables=("users", "messages"),
+        sequence_columns=(("messages", "id"), ("users", "id")),
+    )
+
+
+class TestSchemaArtifact:
+    def test_round_trip_restores_data_and_sequences(self, tmp_path):
+        store = ArtifactStore(tmp_path)
+        location = store.location("env_abc")
+        source = _Conn(
+            tables={"users": b"PGCOPY-users-rows", "messages": b""},
+            sequence_row=(None, 42),
+        )
+
+        with store.open_write(location) as fileobj:
+            write_schema_artifact(source, _plan(), "state_abc", fileobj)
+
+        target = _Conn()
+        with store.open_read(location) as fileobj:
+            manifest = restore_schema_artifact(target, fileobj, "state_new")
+
+        assert manifest.tables == ("users", "messages")
+        assert target.loaded == {"users": b"PGCOPY-users-rows", "messages": b""}
+        structure = target.statements[0]
+        assert 'CREATE SCHEMA "state_new"' in structure
+        assert 'CREATE TABLE "state_new".users' in structure
+        # Sequences continue where the source left off.
+        sequences = target.statements[-1]
+        assert "'\"state_new\".\"messages\"', 'id'), 1, false)" in sequences
+        assert "'\"state_new\".\"users\"', 'id'), 42, true)" in sequences
+
+    def test_failed_write_leaves_no_artifact(self, tmp_path):
+        store = ArtifactStore(tmp_path)
+        location = store.location("env_abc")
+
+        with pytest.raises(RuntimeError):
+            with store.open_write(location) as fileobj:
+                fileobj.write(b"partial")
+                raise RuntimeError("export failed")
+
+        assert list(tmp_path.iterdir()) == []
+
+    def test_rejects_foreign_files(self):
+        with pytest.raises(ValueError):
+            read_manifest(io.BytesIO(b"PGDMP not an artifact"))
+
+
+class _Session:
+    def commit(self):
+        pass
+
+
+class _Sessions:
+    def __init__(self):
+        self.hibernated = True
+
+    def resolve_environment(self, env_id):
+        if self.hibernated:
+            # The class the middleware imported, not a second copy under src.
+            raise middleware_module.EnvironmentHibernated(env_id)
+        return ResolvedEnvironment(
+            schema="state_abc",
+            read_only=False,
+            shard="primary",
+            impersonate_user_id="U1",
+            impersonate_email=None,
+            expires_at=None,
+        )
+
+    @contextmanager
+    def with_session_for_environment(self, env_id):
+        yield _Session()
+
+
+class _Core:
+    def __init__(self, sessions: _Sessions):
+        self.sessions = sessions
+        self.restores = 0
+
+    def restore_environment(self, env_id):
+        self.restores += 1
+        self.sessions.hibernated = False
+        return True
+
+
+class TestTransparentRestore:
+    def test_hibernated_environment_is_restored_on_request(self, monkeypatch):
+        async def principal(api_key, action="api_request"):
+            return "principal"
+
+        monkeypatch.setattr(middleware_module, "get_principal_id", principal)
+
+        async def handler(request):
+            return JSONResponse({"user": request.state.impersonate_user_id})
+
+        sessions = _Sessions()
+        core = _Core(sessions)
+        app = Starlette(routes=[Route("/api/env/{env_id}/ping", handler)])
+        app.add_middleware(
+            IsolationMiddleware, session_manager=sessions, core_isolation_engine=core
+        )
+        client = TestClient(app, headers={"X-API-Key": "key"})
+
+        first = client.get("/api/env/abc/ping")
+        second = client.get("/api/env/abc/ping")
+
+        assert first.status_code == 200
+        assert first.json() == {"user": "U1"}
+        assert second.status_code == 200
+        assert core.restores == 1
+
+
+class _Handler:
+    def __init__(self, snapshotted: set[str]):
+        self.snapshotted = snapshotted
+
+    def schemas_with_snapshots(self, schemas, shard):
+        return self.snapshotted.intersection(schemas)
+
+
+class TestHibernationCandidates:
+    def test_environments_in_use_by_runs_stay_awake(self):
+        engine = create_engine("sqlite://")
+
+        @event.listens_for(engine, "connect")
+        def _attach_public(dbapi_conn, _):
+            dbapi_conn.execute("ATTACH DATABASE ':memory:' AS public")
+
+        RunTimeEnvironment.__table__.create(engine)
+        db_schema.TestRun.__table__.create(engine)
+        sessions = SessionManager(engine)
+        idle = datetime.now() - timedelta(hours=1)
+        ids = {name: uuid4() for name in ["idle", "running", "snapshotted"]}
+        with sessions.with_meta_session() as s:
+            for name, env_id in ids.items():
+                s.add(
+                    RunTimeEnvironment(
+                        id=env_id,
+                        schema=f"state_{name}",
+                        status="ready",
+                        read_only=False,
+                        last_used_at=idle,
+                        created_by="user",
+                    )
+                )
+            s.flush()
+            s.add(
+                db_schema.TestRun(
+                    environment_id=ids["running"], status="running", created_by="user"
+                )
+            )
+        service = EnvironmentMaintenanceService(
+            session_manager=sessions,
+            environment_handler=_Handler({"state_snapshotted"}),
+            pool_manager=None,
+            pool_targets={},
+            hibernate_after=60,
+        )
+
+        candidates = service._hibernation_candidates(datetime.now())
+
+        assert candidates == [ids["idle"]]
@@ -0,0 +1,155 @@
+"""Tests for fanning out schema migrations over environment schemas."""
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import create_engine, event
+
+from src.eval_platform.db.schema import SchemaMigrationProgress
+from src.eval_platform.isolationEngine.fanout import MigrationFanout, load_schema_hook
+from src.eval_platform.isolationEngine.session import SessionManager
+
+
+class _Result:
+    def __init__(self, row):
+        self.row = row
+
+    def first(self):
+        return self.row
+
+
+class _Conn:
+    def __init__(self, schemas: set[str]):
+        self.schemas = schemas
+        self.statements: list[str] = []
+
+    def execute(self, statement, params):
+        return _Result((1,) if params["schema"] in self.schemas else None)
+
+    def exec_driver_sql(self, sql):
+        self.statements.append(sql)
+
+
+class _Engine:
+    def __init__(self, schemas: set[str]):
+        self.conn = _Conn(schemas)
+
+    @contextmanager
+    def begin(self):
+        yield self.conn
+
+
+class _Sessions:
+    def __init__(self, engine: _Engine):
+        self.engine = engine
+
+    def engine_for_shard(self, shard):
+        return self.engine
+
+
+class _Pool:
+    def __init__(self):
+        self.discarded: list[str] = []
+
+    def discard_ready(self, schema_names):
+        self.discarded.extend(schema_names)
+        return len(schema_names)
+
+
+class _Fanout(MigrationFanout):
+    def __init__(self, schemas: set[str]):
+        self.engine = _Engine(schemas)
+        self.finished: list[tuple[str, str | None]] = []
+        super().__init__(_Sessions(self.engine), None, _Pool(), lock_timeout_ms=250)
+
+    def _finish(self, progress_id, status, error=None):
+        self.finished.append((status, error))
+
+
+def _row(schema: str, kind: str):
+    return (uuid4(), schema, "primary", kind)
+
+
+class TestApply:
+    def test_runs_hook_under_lock_timeout(self):
+        fanout = _Fanout({"state_abc"})
+        migrated = []
+
+        status = fanout._apply(
+            lambda conn, schema: migrated.append(schema),
+            _row("state_abc", "environment"),
+        )
+
+        assert status == "done"
+        assert migrated == ["state_abc"]
+        assert fanout.engine.conn.statements == ["SET LOCAL lock_timeout = 250"]
+        assert fanout.finished == [("done", None)]
+
+    def test_dropped_schema_is_skipped(self):
+        fanout = _Fanout(set())
+
+        status = fanout._apply(
+            lambda conn, schema: pytest.fail("hook ran"), _row("state_gone", "pool")
+        )
+
+        assert status == "skipped"
+        assert fanout.pool_manager.discarded == []
+
+    def test_failed_pool_schema_is_discarded(self):
+        fanout = _Fanout({"pool_abc", "state_abc"})
+
+        def hook(conn, schema):
+            raise RuntimeError("lock timeout")
+
+        assert fanout._apply(hook, _row("pool_abc", "pool")) == "failed"
+        assert fanout._apply(hook, _row("state_abc", "environment")) == "failed"
+
+        assert fanout.finished == [
+            ("failed", "lock timeout"),
+            ("failed", "lock timeout"),
+        ]
+        # Live environments are retried instead; only pooled schemas are rebuilt.
+        assert fanout.pool_manager.discarded == ["pool_abc"]
+
+
+class TestClaim:
+    def test_templates_are_claimed_first(self):
+        engine = create_engine("sqlite://")
+
+        @event.listens_for(engine, "connect")
+        def _attach_public(dbapi_conn, _):
+            dbapi_conn.execute("ATTACH DATABASE ':memory:' AS public")
+
+        SchemaMigrationProgress.__table__.create(engine)
+        sessions = SessionManager(engine)
+        created = datetime.now()
+        with sessions.with_meta_session() as s:
+            for offset, kind in enumerate(["environment", "pool", "template"]):
+                s.add(
+                    SchemaMigrationProgress(
+                        revision="abc",
+                        schema_name=f"{kind}_abc",
+                        target_kind=kind,
+                        status="pending",
+                        attempts=0,
+                        created_at=created + timedelta(seconds=offset),
+                    )
+                )
+        fanout = MigrationFanout(sessions, None, _Pool())
+
+        claimed = [fanout._claim("abc", 1)[0][3] for _ in range(3)]
+
+        assert claimed == ["template", "pool", "environment"]
+        assert fanout._claim("abc", 1) == []
+
+
+class TestLoadSchemaHook:
+    def test_revision_without_hook_is_rejected(self):
+        with pytest.raises(ValueError, match="upgrade_schema"):
+            load_schema_hook("d4a6c8e0f2b3")
+
+    def test_unknown_revision_is_rejected(self):
+        with pytest.raises(ValueError, match="unknown revision"):
+            load_schema_hook("0000deadbeef")
@@ -0,0 +1,52 @@
+"""Tests for demand-driven pool sizing."""
+
+from src.eval_platform.isolationEngine.autoscaler import PoolAutoscaler
+from src.eval_platform.isolationEngine.maintenance import _largest_deficit_first
+
+
+class TestPoolAutoscaler:
+    def test_idle_templates_fall_to_floor(self):
+        """Templates without demand are kept at their floor."""
+        scaler = PoolAutoscaler({"hot": 100, "cold": 100}, {"cold": 2})
+        scaler.observe({}, now=scaler._last_observed + 60)
+
+        assert scaler.targets() == {"hot": 1, "cold": 2}
+
+    def test_demand_raises_target_within_ceiling(self):
+        """Sustained claims grow the target but never past the ceiling."""
+        scaler = PoolAutoscaler({"hot": 100, "capped": 5}, half_life=10)
+        now = scaler._last_observed
+        for _ in range(10):
+            now += 10
+            scaler.observe({"hot": (20, 0), "capped": (20, 0)}, now=now)
+
+        # ~2 claims/s over (5s default build + 10s interval) * 1.5 headroom
+        assert 40 <= scaler.target("hot") <= 46
+        assert scaler.target("capped") == 5
+
+    def test_misses_and_slow_builds_increase_target(self):
+        """Misses and slower builds both call for a deeper pool."""
+        base = PoolAutoscaler({"t": 1000}, half_life=10)
+        missing = PoolAutoscaler({"t": 1000}, half_life=10)
+        slow = PoolAutoscaler({"t": 1000}, half_life=10)
+        slow.record_build("t", 30.0)
+        for scaler, counts in ((base, (10, 0)), (missing, (10, 5)), (slow, (10, 0))):
+            scaler.observe({"t": counts}, now=scaler._last_observed + 10)
+
+        assert missing.target("t") > base.target("t")
+        assert slow.target("t") > base.target("t")
+
+    def test_floor_is_clamped_to_ceiling(self):
+        scaler = PoolAutoscaler({"t": 3}, {"t": 10})
+        assert scaler.target("t") == 3
+
+
+class TestLargestDeficitFirst:
+    def test_interleaves_from_longest_queue(self):
+        queues = {"a": ["a1", "a2", "a3"], "b": ["b1"], "c": []}
+
+        ordered = _largest_deficit_first(queues)
+
+        assert ordered[:2] == ["a1", "a2"]
+        assert sorted(ordered) == ["a1", "a2", "a3", "b1"]
+        assert queues["a"] == ["a1", "a2", "a3"]
@@ -0,0 +1,53 @@
+"""Tests for placing environment schemas across data shards."""
+
+import pytest
+
+from src.eval_platform.isolationEngine.pool import PoolManager
+from src.eval_platform.isolationEngine.session import parse_shard_urls
+
+
+class _FixedLoads(PoolManager):
+    def __init__(self, loads: dict[str, int]):
+        super().__init__(sessions=None)
+        self.loads = loads
+
+    def shard_loads(self, shards):
+        return {shard: self.loads.get(shard, 0) for shard in shards}
+
+
+class TestShardPlacement:
+    def test_batch_fills_least_loaded_shards_first(self):
+        """New schemas level out shard loads instead of piling onto one shard."""
+        pool = _FixedLoads({"primary": 10, "a": 4, "b": 7})
+
+        placed = pool.place_schemas(["primary", "a", "b"], 6)
+
+        # a: 4 -> 9, b: 7 -> 8; ties go to the first shard by name
+        assert placed.count("a") == 5
+        assert placed.count("b") == 1
+        assert "primary" not in placed
+
+    def test_only_candidate_shards_are_used(self):
+        pool = _FixedLoads({"primary": 50, "a": 0})
+
+        assert pool.place_schemas(["primary"], 3) == ["primary"] * 3
+
+    def test_no_candidates_raises(self):
+        with pytest.raises(ValueError):
+            _FixedLoads({}).place_schemas([], 1)
+
+
+class TestParseShardUrls:
+    def test_parses_named_urls(self):
+        raw = "a=postgresql://h1/db?pgbouncer=true, b=postgresql://h2/db"
+
+        assert parse_shard_urls(raw) == {
+            "a": "postgresql://h1/db?pgbouncer=true",
+            "b": "postgresql://h2/db",
+        }
+
+    def test_ignores_malformed_and_primary_entries(self):
+        raw = "bogus,primary=postgresql://h/db,=postgresql://h/db"
+
+        assert parse_shard_urls(raw) == {}
+        assert parse_shard_urls(None) == {}
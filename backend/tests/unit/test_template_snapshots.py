@@ -0,0 +1,169 @@
+"""Tests for tracking whether an environment still matches its template."""
+
+from contextlib import contextmanager
+from types import SimpleNamespace
+from uuid import UUID, uuid4
+
+from sqlalchemy import create_engine, event, select
+
+from src.eval_platform.db.schema import (
+    RunTimeEnvironment,
+    SnapshotMetadata,
+    TemplateEnvironment,
+)
+from src.eval_platform.isolationEngine.core import CoreIsolationEngine
+from src.eval_platform.isolationEngine.environment import EnvironmentHandler
+from src.eval_platform.isolationEngine.session import (
+    ResolvedEnvironment,
+    SessionManager,
+)
+
+ENV_ID = "0f8fad5b-d9cb-469f-a165-70867728950e"
+
+
+class _Conn:
+    def __init__(self, statements: list):
+        self.statements = statements
+
+    def execute(self, statement, params=None):
+        self.statements.append(statement)
+
+
+class _Engine:
+    def __init__(self):
+        self.statements: list = []
+
+    @contextmanager
+    def begin(self):
+        yield _Conn(self.statements)
+
+
+def _sessions(pristine: bool, read_only: bool = False) -> SessionManager:
+    sessions = SessionManager(create_engine("sqlite://"), touch_flush_interval=3600)
+    sessions._load_environment = lambda env_id, env_uuid: ResolvedEnvironment(
+        schema="state_abc",
+        read_only=read_only,
+        shard="primary",
+        impersonate_user_id=None,
+        impersonate_email=None,
+        expires_at=None,
+        pristine=pristine,
+    )
+    sessions.base_engine = _Engine()
+    return sessions
+
+
+class TestPristineTracking:
+    def test_first_data_session_clears_pristine_once(self):
+        sessions = _sessions(pristine=True)
+
+        sessions.get_session_for_environment(ENV_ID).close()
+        sessions.get_session_for_environment(ENV_ID).close()
+
+        assert len(sessions.base_engine.statements) == 1
+        assert "pristine" in str(sessions.base_engine.statements[0])
+        assert sessions.resolve_environment(ENV_ID).pristine is False
+
+    def test_resolving_alone_keeps_pristine(self):
+        sessions = _sessions(pristine=True)
+
+        assert sessions.resolve_environment(ENV_ID).pristine is True
+        assert sessions.base_engine.statements == []
+
+    def test_read_only_environments_are_left_alone(self):
+        sessions = _sessions(pristine=True, read_only=True)
+
+        sessions.get_session_for_environment(ENV_ID).close()
+
+        assert sessions.base_engine.statements == []
+
+
+class _Handler:
+    """Source environment that is written to while it is being forked."""
+
+    def __init__(self):
+        self.source = SimpleNamespace(
+            status="ready",
+            schema="state_abc",
+            shard="primary",
+            template_id=None,
+            impersonate_user_id=None,
+            impersonate_email=None,
+            pristine=True,
+        )
+        self.rows: list[dict] = []
+
+    def require_environment(self, environment_id):
+        return SimpleNamespace(**vars(self.source))
+
+    def fork_schema(self, source, targets, *, shard):
+        self.source.pristine = False
+
+    def set_runtime_environments(self, rows):
+        self.rows.extend(rows)
+
+
+class TestForkPristine:
+    def test_write_during_fork_clears_pristine(self):
+        engine = CoreIsolationEngine.__new__(CoreIsolationEngine)
+        engine.environment_handler = _Handler()
+
+        engine.fork_environment(ENV_ID, count=2, ttl_seconds=60, created_by="u")
+
+        assert [row["pristine"] for row in engine.environment_handler.rows] == [
+            False,
+            False,
+        ]
+
+
+class TestTemplateReRegistration:
+    def test_stale_template_checksums_and_pristine_flags_are_dropped(self):
+        engine = create_engine("sqlite://")
+
+        @event.listens_for(engine, "connect")
+        def _attach_public(dbapi_conn, _):
+            dbapi_conn.execute("ATTACH DATABASE ':memory:' AS public")
+
+        for model in (TemplateEnvironment, RunTimeEnvironment, SnapshotMetadata):
+            model.__table__.create(engine)
+        sessions = SessionManager(engine, touch_flush_interval=3600)
+        handler = EnvironmentHandler(sessions)
+        register = dict(
+            service="slack",
+            name="default",
+            version="v1",
+            visibility="public",
+            description=None,
+            owner_id=None,
+            kind="schema",
+            location="slack_default",
+        )
+        template_id = handler.register_template(**register)
+        env_id = uuid4()
+        with sessions.with_meta_session() as s:
+            s.add(
+                RunTimeEnvironment(
+                    id=env_id,
+                    template_id=UUID(template_id),
+                    schema="state_abc",
+                    status="ready",
+                    created_by="user",
+                    pristine=True,
+                )
+            )
+            s.add(
+                SnapshotMetadata(
+                    environment_id=None,
+                    schema_name="slack_default",
+                    snapshot_suffix="template",
+                    table_name="users",
+                    row_count=1,
+                    checksum="stale",
+                )
+            )
+
+        handler.register_template(**register)
+
+        with sessions.with_meta_session() as s:
+            assert s.scalars(select(SnapshotMetadata)).all() == []
+            assert s.get(RunTimeEnvironment, env_id).pristine is False
@@ -0,0 +1,63 @@
+"""Tests for reusing schema-translated engines across sessions."""
+
+from sqlalchemy import create_engine
+
+from src.eval_platform.isolationEngine import session as session_module
+from src.eval_platform.isolationEngine.session import SessionManager
+
+
+def _sessions() -> SessionManager:
+    return SessionManager(create_engine("sqlite://"))
+
+
+class TestTranslatedEngines:
+    def test_same_schema_reuses_one_engine(self):
+        sessions = _sessions()
+
+        first = sessions.get_session_for_schema("env_a")
+        second = sessions.get_session_for_schema("env_a")
+
+        assert first.get_bind() is second.get_bind()
+        assert (
+            first.get_bind() is not sessions.get_session_for_schema("env_b").get_bind()
+        )
+
+    def test_read_only_engines_are_cached_separately(self):
+        sessions = _sessions()
+
+        writable = sessions.translated_engine("env_a")
+        read_only = sessions.translated_engine("env_a", read_only=True)
+
+        assert writable is not read_only
+        assert read_only.get_execution_options()["postgresql_readonly"] is True
+        assert writable.get_execution_options()["schema_translate_map"] == {
+            None: "env_a"
+        }
+
+    def test_least_recently_used_engine_is_evicted(self, monkeypatch):
+        monkeypatch.setattr(session_module, "_MAX_TRANSLATED_ENGINES", 2)
+        sessions = _sessions()
+
+        a = sessions.translated_engine("a")
+        sessions.translated_engine("b")
+        assert sessions.translated_engine("a") is a
+        sessions.translated_engine("c")
+
+        assert sessions.translated_engine("a") is a
+        assert ("primary", "b", False) not in sessions._translated
+
+    def test_dropped_schema_is_forgotten(self):
+        sessions = _sessions()
+        engine = sessions.translated_engine("env_a")
+
+        sessions.forget_schema("env_a")
+
+        assert sessions.translated_engine("env_a") is not engine
+
+    def test_meta_sessions_share_one_factory(self):
+        sessions = _sessions()
+
+        session = sessions.get_meta_session()
+
+        assert session.get_bind() is sessions.base_engine
+        assert session.expire_on_commit is False
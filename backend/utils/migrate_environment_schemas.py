@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Apply a migration revision's upgrade_schema hook to every template, pooled
+and live environment schema, across all data shards.
+
+Run after `alembic upgrade` for revisions that change service tables:
+
+    python utils/migrate_environment_schemas.py head
+    python utils/migrate_environment_schemas.py e5b7d9f1a3c4 --status
+
+Interrupted runs resume from the recorded progress; rerun the same command.
+"""
+
+import argparse
+import logging
+import sys
+from os import environ
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from sqlalchemy import create_engine
+
+from eval_platform.isolationEngine.environment import EnvironmentHandler
+from eval_platform.isolationEngine.fanout import MigrationFanout, load_schema_hook
+from eval_platform.isolationEngine.pool import PoolManager
+from eval_platform.isolationEngine.session import SessionManager, parse_shard_urls
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("revision", help="revision id, or 'head'")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument(
+        "--lock-timeout-ms",
+        type=int,
+        default=5_000,
+        help="give up on a schema (and retry it later) after waiting this long for a lock",
+    )
+    parser.add_argument(
+        "--takeover",
+        action="store_true",
+        help="reclaim schemas left running by an interrupted run",
+    )
+    parser.add_argument(
+        "--status", action="store_true", help="only print progress counts"
+    )
+    args = parser.parse_args()
+
+    db_url = environ.get("DATABASE_URL")
+    if not db_url:
+        raise ValueError("DATABASE_URL environment variable not set")
+
+    pool_size = max(5, args.concurrency)
+    sessions = SessionManager(
+        create_engine(db_url, pool_size=pool_size),
+        shard_engines={
+            name: create_engine(url, pool_size=pool_size)
+            for name, url in parse_shard_urls(environ.get("DATA_SHARD_URLS")).items()
+        },
+    )
+    fanout = MigrationFanout(
+        sessions,
+        EnvironmentHandler(session_manager=sessions),
+        PoolManager(sessions),
+        concurrency=args.concurrency,
+        lock_timeout_ms=args.lock_timeout_ms,
+    )
+
+    revision, hook = load_schema_hook(args.revision)
+    if args.status:
+        print(dict(fanout.progress(revision)))
+        return 0
+
+    result = fanout.run(revision, hook, takeover=args.takeover)
+    logger.info("Revision %s finished: %s", revision, dict(fanout.progress(revision)))
+    return 1 if result.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,18 @@
-from .client import AgentDiff
+from .client import AgentDiff, EnvironmentNotReadyError
 from .models import (
     # Environment
     InitEnvRequestBody,
     InitEnvResponse,
+    InitEnvBatchRequest,
+    InitEnvBatchItem,
+    InitEnvBatchResponse,
+    ForkEnvRequest,
+    ForkEnvResponse,
+    CreateCheckpointRequest,
+    CheckpointResponse,
+    RollbackResponse,
     DeleteEnvResponse,
+    EnvReadyResponse,
     # Runs
     StartRunRequest,
     StartRunResponse,
@@ -48,10 +57,20 @@ from .code_executor import (
 __version__ = "1.0.6"
 __all__ = [
     "AgentDiff",
+    "EnvironmentNotReadyError",
     # Environment
     "InitEnvRequestBody",
     "InitEnvResponse",
+    "InitEnvBatchRequest",
+    "InitEnvBatchItem",
+    "InitEnvBatchResponse",
+    "ForkEnvRequest",
+    "ForkEnvResponse",
+    "CreateCheckpointRequest",
+    "CheckpointResponse",
+    "RollbackResponse",
     "DeleteEnvResponse",
+    "EnvReadyResponse",
     # Runs
     "StartRunRequest",
     "StartRunResponse",
@@ -1,9 +1,18 @@
+import asyncio
 import os
+import time
 from uuid import UUID
 import requests
 from .models import (
     InitEnvRequestBody,
     InitEnvResponse,
+    InitEnvBatchRequest,
+    InitEnvBatchResponse,
+    ForkEnvRequest,
+    ForkEnvResponse,
+    CreateCheckpointRequest,
+    CheckpointResponse,
+    RollbackResponse,
     TestSuiteListResponse,
     TemplateEnvironmentListResponse,
     TemplateEnvironmentDetail,
@@ -24,10 +33,15 @@ from .models import (
     DiffRunRequest,
     DiffRunResponse,
     DeleteEnvResponse,
+    EnvReadyResponse,
     Visibility,
 )
 
 
+class EnvironmentNotReadyError(RuntimeError):
+    """An environment failed to provision or did not become ready in time."""
+
+
 class AgentDiff:
     def __init__(self, api_key: str | None = None, base_url: str | None = None):
         raw_api_key = api_key or os.getenv("AGENT_DIFF_API_KEY")
@@ -51,9 +65,20 @@ class AgentDiff:
         return headers
 
     def init_env(
-        self, request: InitEnvRequestBody | None = None, **kwargs
+        self,
+        request: InitEnvRequestBody | None = None,
+        *,
+        wait: bool = True,
+        ready_timeout: float = 600,
+        **kwargs,
     ) -> InitEnvResponse:
-        """Initialize an isolated environment. Pass InitEnvRequestBody."""
+        """Initialize an isolated environment. Pass InitEnvRequestBody.
+
+        On a pool miss the server answers with status "provisioning" and
+        builds the environment in the background. By default this waits until
+        it is ready; pass wait=False to get the response immediately and call
+        wait_for_env() (or await wait_for_env_async()) later.
+        """
         if request is None:
             request = InitEnvRequestBody(**kwargs)
         response = requests.post(
@@ -63,7 +88,75 @@ class AgentDiff:
             timeout=120,
         )
         response.raise_for_status()
-        return InitEnvResponse.model_validate(response.json())
+        env = InitEnvResponse.model_validate(response.json())
+        if wait and env.status == "provisioning":
+            ready = self.wait_for_env(env.environmentId, timeout=ready_timeout)
+            env = env.model_copy(update={"status": ready.status})
+        return env
+
+    def wait_for_env(
+        self, env_id: str, timeout: float = 600, poll_timeout: float = 30
+    ) -> EnvReadyResponse:
+        """Block until a provisioning environment is ready.
+
+        Long-polls GET /env/{id}/ready. Raises EnvironmentNotReadyError if the
+        build fails or `timeout` seconds pass first.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            response = requests.get(
+                f"{self.base_url}/api/platform/env/{env_id}/ready",
+                params={"timeout": max(0, min(poll_timeout, remaining))},
+                headers=self._headers(),
+                timeout=poll_timeout + 30,
+            )
+            response.raise_for_status()
+            ready = EnvReadyResponse.model_validate(response.json())
+            if ready.ready:
+                return ready
+            if ready.status != "provisioning":
+                raise EnvironmentNotReadyError(
+                    f"environment {env_id} is {ready.status}"
+                )
+            if deadline - time.monotonic() <= 0:
+                raise EnvironmentNotReadyError(
+                    f"environment {env_id} not ready after {timeout}s"
+                )
+
+    async def wait_for_env_async(
+        self, env_id: str, timeout: float = 600, poll_timeout: float = 30
+    ) -> EnvReadyResponse:
+        """Awaitable wait_for_env(); the long-poll runs in a worker thread."""
+        return await asyncio.to_thread(
+            self.wait_for_env, env_id, timeout=timeout, poll_timeout=poll_timeout
+        )
+
+    def init_envs(
+        self, environments: list[InitEnvRequestBody | dict]
+    ) -> InitEnvBatchResponse:
+        """Initialize several isolated environments in one call.
+
+        Pass a list of InitEnvRequestBody (or dicts with the same fields).
+        Each item in the response reports whether it was served from the
+        warm pool (``poolHit``).
+        """
+        request = InitEnvBatchRequest(
+            environments=[
+                item
+                if isinstance(item, InitEnvRequestBody)
+                else InitEnvRequestBody(**item)
+                for item in environments
+            ]
+        )
+        response = requests.post(
+            f"{self.base_url}/api/platform/initEnvBatch",
+            json=request.model_dump(mode="json"),
+            headers=self._headers(),
+            timeout=600,
+        )
+        response.raise_for_status()
+        return InitEnvBatchResponse.model_validate(response.json())
 
     def create_template_from_environment(
         self, request: CreateTemplateFromEnvRequest | None = None, **kwargs
@@ -286,6 +379,60 @@ class AgentDiff:
         response.raise_for_status()
         return DeleteEnvResponse.model_validate(response.json())
 
+    def fork_env(
+        self,
+        env_id: str | None = None,
+        count: int = 1,
+        ttl_seconds: int | None = None,
+        **kwargs,
+    ) -> ForkEnvResponse:
+        """Copy an environment's current state into `count` new environments. Pass env_id or envId kwarg."""
+        eid = env_id or kwargs.get("envId")
+        if not eid:
+            raise ValueError("env_id or envId required")
+        request = ForkEnvRequest(ttlSeconds=ttl_seconds or kwargs.get("ttlSeconds"))
+        response = requests.post(
+            f"{self.base_url}/api/platform/env/{eid}/fork",
+            params={"count": count},
+            json=request.model_dump(mode="json"),
+            headers=self._headers(),
+            timeout=120,
+        )
+        response.raise_for_status()
+        return ForkEnvResponse.model_validate(response.json())
+
+    def create_checkpoint(
+        self, name: str, env_id: str | None = None, **kwargs
+    ) -> CheckpointResponse:
+        """Record the environment's current state under `name`. Pass env_id or envId kwarg."""
+        eid = env_id or kwargs.get("envId")
+        if not eid:
+            raise ValueError("env_id or envId required")
+        request = CreateCheckpointRequest(name=name)
+        response = requests.post(
+            f"{self.base_url}/api/platform/env/{eid}/checkpoints",
+            json=request.model_dump(mode="json"),
+            headers=self._headers(),
+            timeout=120,
+        )
+        response.raise_for_status()
+        return CheckpointResponse.model_validate(response.json())
+
+    def rollback(
+        self, name: str, env_id: str | None = None, **kwargs
+    ) -> RollbackResponse:
+        """Restore the environment to checkpoint `name` in place. Pass env_id or envId kwarg."""
+        eid = env_id or kwargs.get("envId")
+        if not eid:
+            raise ValueError("env_id or envId required")
+        response = requests.post(
+            f"{self.base_url}/api/platform/env/{eid}/rollback/{name}",
+            headers=self._headers(),
+            timeout=120,
+        )
+        response.raise_for_status()
+        return RollbackResponse.model_validate(response.json())
+
     def start_run(
         self, request: StartRunRequest | None = None, **kwargs
     ) -> StartRunResponse:
@@ -125,6 +125,8 @@ class InitEnvRequestBody(BaseModel):
     ttlSeconds: Optional[int] = None
     impersonateUserId: Optional[str] = None
     impersonateEmail: Optional[str] = None
+    # Bind to the template itself; only reads are allowed
+    readOnly: bool = False
 
 
 class InitEnvResponse(BaseModel):
@@ -134,6 +136,46 @@ class InitEnvResponse(BaseModel):
     service: str
     environmentUrl: str
     expiresAt: Optional[datetime]
+    readOnly: bool = False
+    # "provisioning" while the server builds the environment after a pool miss
+    status: str = "ready"
+
+
+class InitEnvBatchRequest(BaseModel):
+    environments: List[InitEnvRequestBody]
+
+
+class InitEnvBatchItem(InitEnvResponse):
+    poolHit: bool
+
+
+class InitEnvBatchResponse(BaseModel):
+    environments: List[InitEnvBatchItem]
+
+
+class ForkEnvRequest(BaseModel):
+    ttlSeconds: Optional[int] = None
+
+
+class ForkEnvResponse(BaseModel):
+    sourceEnvironmentId: str
+    environments: List[InitEnvResponse]
+
+
+class CreateCheckpointRequest(BaseModel):
+    name: str
+
+
+class CheckpointResponse(BaseModel):
+    environmentId: str
+    name: str
+    createdAt: datetime
+
+
+class RollbackResponse(BaseModel):
+    environmentId: str
+    name: str
+    tablesRestored: List[str]
 
 
 class DeleteEnvRequest(BaseModel):
@@ -191,6 +233,12 @@ class DeleteEnvResponse(BaseModel):
     status: str
 
 
+class EnvReadyResponse(BaseModel):
+    environmentId: str
+    status: str
+    ready: bool
+
+
 class CreateTemplateFromEnvRequest(BaseModel):
     environmentId: str
     service: Literal["slack", "linear", "box", "calendar"]
@@ -198,6 +246,8 @@ class CreateTemplateFromEnvRequest(BaseModel):
     description: Optional[str] = None
     visibility: Literal["public", "private"] = "private"
     version: str = "v1"
+    # "artifact" stores the template as a compressed export instead of a schema
+    kind: Literal["schema", "artifact"] = "schema"
 
 
 class CreateTemplateFromEnvResponse(BaseModel):